@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+"""
+Adds acoustic features of the audio track to the TextGrid
+
+For every interval of the tiers 'words' and 'sentence', the loudness (RMS
+energy in dB full scale) and a pitch proxy (mean fundamental frequency of the
+voiced frames in Hz) are written into the new tiers 'words_rms',
+'words_pitch', 'sentence_rms', and 'sentence_pitch'.
+
+The WAV is memory-mapped and processed in blocks; the features are first
+computed for short frames (vectorized per block), and then averaged per
+interval via cumulative sums over the frames.
+
+Call from the root of the dataset, e.g.:
+python3 code/add_acoustic-features2textgrid.py \
+    -i annotation/fg_rscut_ad_ger_speech_tagged.TextGrid
+"""
+import argparse
+import os
+import sys
+import numpy as np
+from annotation_io import append_tiers, read_tiers
+from wav_io import memmap_wav, to_float
+
+
+# tiers whose intervals get acoustic features
+TIERS = ['words', 'sentence']
+
+# the frames' length and the step between frames (in seconds)
+FRAMELEN = 0.025
+FRAMESTEP = 0.010
+
+# sampling rate the audio is decimated to before the frames are computed
+TARGETRATE = 16000
+
+# range of plausible fundamental frequencies (Hz) of speech
+MINF0 = 60
+MAXF0 = 500
+
+# frames quieter than that (dB full scale) are treated as unvoiced
+SILENCE = -50
+
+# minimal normalized autocorrelation at the pitch period of a voiced frame
+VOICING = 0.3
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Add loudness and pitch per word & sentence'
+    )
+    parser.add_argument('-i',
+                        default='annotation/'
+                        'fg_rscut_ad_ger_speech_tagged.TextGrid',
+                        help='the TextGrid with the tiers words & sentence')
+
+    parser.add_argument('-w',
+                        default='bin/montreal-data/corpus/speech-vocal.wav',
+                        help='the audio track')
+
+    parser.add_argument('-o',
+                        default=None,
+                        help='the TextGrid to write (default: the input)')
+
+    parser.add_argument('--pitch',
+                        choices=['acf', 'zcr'],
+                        default='acf',
+                        help='pitch proxy: peak of the autocorrelation, or '
+                        'the (faster) zero-crossing rate')
+
+    parser.add_argument('--block',
+                        type=float,
+                        default=60.0,
+                        help='seconds of audio processed at once')
+
+    args = parser.parse_args()
+
+    outFile = args.o if args.o is not None else args.i
+
+    return args.i, args.w, outFile, args.pitch, args.block
+
+
+def frame_pitch_acf(frames, rate):
+    '''
+    returns the f0 of every frame from the peak of its autocorrelation within
+    the range of plausible lags; unvoiced frames get 0
+    '''
+    nfft = 1 << int(np.ceil(np.log2(2 * frames.shape[1])))
+    windowed = frames * np.hanning(frames.shape[1]).astype(np.float32)
+    spectrum = np.fft.rfft(windowed, n=nfft, axis=1)
+    acf = np.fft.irfft(np.abs(spectrum) ** 2, n=nfft, axis=1)
+
+    minLag = int(rate / MAXF0)
+    maxLag = min(int(rate / MINF0), frames.shape[1] - 1)
+    lags = acf[:, minLag:maxLag]
+    peak = lags.argmax(axis=1)
+
+    energy = acf[:, 0]
+    energy[energy == 0] = 1
+    strength = lags[np.arange(len(lags)), peak] / energy
+
+    f0 = rate / (peak + minLag)
+    f0[strength < VOICING] = 0
+
+    return f0
+
+
+def frame_pitch_zcr(frames, rate):
+    '''
+    returns half the zero-crossing rate of every frame, which approximates
+    the f0 of voiced speech; rates outside the plausible range get 0
+    '''
+    signs = np.signbit(frames)
+    crossings = (signs[:, 1:] != signs[:, :-1]).sum(axis=1)
+    f0 = crossings * rate / (2.0 * frames.shape[1])
+    f0[(f0 < MINF0) | (f0 > MAXF0)] = 0
+
+    return f0
+
+
+def frame_features(wavFile, pitchMethod, blockSeconds):
+    '''
+    returns the frames' centers (in seconds), their mean squared amplitude,
+    and their pitch proxy (0 for unvoiced frames)
+    '''
+    samples, rate = memmap_wav(wavFile)
+    # average blocks of samples to get (roughly) to the target rate
+    factor = max(1, rate // TARGETRATE)
+    rate = rate / factor
+
+    frameLen = int(FRAMELEN * rate)
+    step = int(FRAMESTEP * rate)
+    nrOfSamples = len(samples) // factor
+    nrOfFrames = max(0, (nrOfSamples - frameLen) // step + 1)
+    framesPerBlock = max(1, int(blockSeconds / FRAMESTEP))
+
+    squares = np.zeros(nrOfFrames, dtype=np.float64)
+    pitch = np.zeros(nrOfFrames, dtype=np.float64)
+
+    for first in range(0, nrOfFrames, framesPerBlock):
+        last = min(first + framesPerBlock, nrOfFrames)
+        # samples needed for the frames of the block (in decimated samples)
+        start = first * step
+        end = (last - 1) * step + frameLen
+        block = to_float(samples[start * factor:end * factor])
+        block = block.reshape(-1, factor).mean(axis=1)
+
+        frames = np.lib.stride_tricks.sliding_window_view(
+            block, frameLen)[::step]
+        squares[first:last] = (frames.astype(np.float64) ** 2).mean(axis=1)
+
+        if pitchMethod == 'acf':
+            blockPitch = frame_pitch_acf(frames, rate)
+        else:
+            blockPitch = frame_pitch_zcr(frames, rate)
+        # silent frames have no pitch
+        loud = 10 * np.log10(squares[first:last] + 1e-12) > SILENCE
+        pitch[first:last] = blockPitch * loud
+
+    centers = (np.arange(nrOfFrames) * step + frameLen / 2) / rate
+
+    return centers, squares, pitch
+
+
+def aggregate(intervals, centers, squares, pitch):
+    '''
+    returns the RMS (dB full scale) and the mean pitch of the frames whose
+    centers lie within each interval; a cumulative sum over the frames makes
+    the average of any interval a difference of two values; without frames
+    (a WAV shorter than one frame) all values are undefined
+    '''
+    starts = np.array([interval[0] for interval in intervals])
+    ends = np.array([interval[1] for interval in intervals])
+
+    if len(centers) == 0:
+        undefined = np.full(len(intervals), np.nan)
+        return undefined, undefined.copy()
+
+    first = np.searchsorted(centers, starts)
+    last = np.searchsorted(centers, ends)
+    # intervals shorter than a frame step get the frame closest to them
+    empty = last <= first
+    first[empty] = np.minimum(first[empty], len(centers) - 1)
+    last[empty] = first[empty] + 1
+
+    cumSquares = np.concatenate([[0], np.cumsum(squares)])
+    cumPitch = np.concatenate([[0], np.cumsum(pitch)])
+    cumVoiced = np.concatenate([[0], np.cumsum(pitch > 0)])
+
+    meanSquares = (cumSquares[last] - cumSquares[first]) / (last - first)
+    rms = 10 * np.log10(meanSquares + 1e-12)
+
+    voiced = cumVoiced[last] - cumVoiced[first]
+    meanPitch = (cumPitch[last] - cumPitch[first]) / np.maximum(voiced, 1)
+    meanPitch[voiced == 0] = np.nan
+
+    return rms, meanPitch
+
+
+def feature_tier(intervals, values, decimals):
+    '''
+    returns the intervals with the values as text; intervals without text
+    (i.e. pauses) and undefined values stay empty
+    '''
+    tier = []
+    for (start, end, text), value in zip(intervals, values):
+        if text == '' or np.isnan(value):
+            tier.append([start, end, ''])
+        else:
+            tier.append([start, end, str(round(float(value), decimals))])
+
+    return tier
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, wavFile, outFile, pitchMethod, blockSeconds = parse_arguments()
+
+    tiers = read_tiers(inFile)
+    newNames = [tier + suffix for tier in TIERS
+                for suffix in ['_rms', '_pitch']]
+    if any(name in tiers for name in newNames):
+        sys.exit('%s already contains acoustic tiers' % inFile)
+
+    centers, squares, pitch = frame_features(wavFile, pitchMethod,
+                                             blockSeconds)
+
+    newTiers = []
+    for tierName in TIERS:
+        intervals = tiers[tierName]
+        rms, meanPitch = aggregate(intervals, centers, squares, pitch)
+        newTiers.append((tierName + '_rms',
+                         feature_tier(intervals, rms, 2)))
+        newTiers.append((tierName + '_pitch',
+                         feature_tier(intervals, meanPitch, 1)))
+
+    # write to a temporary file first, so the input can be the output
+    tmpFile = outFile + '.tmp'
+    append_tiers(inFile, tmpFile, newTiers)
+    os.replace(tmpFile, outFile)
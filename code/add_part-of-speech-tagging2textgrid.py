@@ -15,11 +15,16 @@ python3 -m spacy download de_core_news_sm # 10 MB
 python3 -m spacy download de_core_news_md # 210 MB
 """
 
-import spacy
-import sys
+import argparse
 import numpy as np
 import os.path
 from copy import deepcopy
+from annotation_io import read_tiers_cached
+from memory_profile import MemoryProfile
+from tagging_client import RemoteModel, load_model, vectors_length
+from word_vectors import DTYPES, NOVECTOR, add_to_table, save_vector_table
+from word_vectors import save_sentence_vectors, segment_means
+from dependency_graph import NOHEAD, save_dependencies
 
 
 # German language model to be used by spaCy
@@ -31,6 +36,18 @@ ORGTIERS = ['person', 'sentence', 'words', 'descr', 'phones']
 # linguistics are the tiers to be added by spaCy's NLP analysis
 LINGUISTICS = ['pos', 'tag', 'dep', 'lemma', 'stop', 'vector']
 
+# pipeline components of spaCy whose annotation is not used
+DISABLED = ['ner']
+
+# characters stripped from the sentences' tokens when matching them to words
+PUNCTUATION = '.,!?;:"()[]-'
+
+# number of sentences spaCy processes at once
+BATCHSIZE = 256
+
+# smoothing of the words' inverse frequency weights (a / (a + p(word)))
+FREQWEIGHT = 0.001
+
 # the three templates for the TextGrid file to be created
 TEMPLHEADER = ['File type = "ooTextFile"\n',
                'Object class = "TextGrid"\n',
@@ -216,42 +233,69 @@ CORRECTIONS = {
     }
 
 
-def read_n_clean(inFile):
+def parse_arguments():
     '''
     '''
-    with open(inFile, 'r', encoding='utf-16') as f:
-        '''
-        reads the .TextGrid file, does some cleaning, and puts the content into
-        a dict with tiers as keys
-        '''
-        intervalsFlag = False
-        contentDict = {}
-
-        for i, line in enumerate(f):
-            if 'class = "IntervalTier"' in line:
-                intervalsFlag = False
-            elif "name = " in line:
-                tierKey = line.split('"')[1]
-                contentDict[tierKey] = []
-            elif 'intervals [' in line:
-                intervalsFlag = True
-            elif intervalsFlag is True and ' = ' in line:
-                line = line.split(' = ')[1].replace('"', '').strip()
-                # try to convert the string to float
-                # and round the float to milliseconds
-                try:
-                    line = str(round(float(line), 3))
-                except:
-                    pass
-
-                contentDict[tierKey].append(line.strip())
-
-        # now that you have all tiers in the dict,
-        # clean all tiers' data
-        for key in contentDict.keys():
-            cleanedTier = [contentDict[key][i:i+3] for i in
-                           range(0, len(contentDict[key]), 3)]
-            contentDict[key] = cleanedTier
+    parser = argparse.ArgumentParser(
+        description='Add spaCy\'s linguistic features to the TextGrid'
+    )
+    parser.add_argument('infile',
+                        help='the manually revised TextGrid')
+
+    parser.add_argument('--vector-dtype',
+                        choices=DTYPES,
+                        default='float32',
+                        help='data type of the stored word vectors; int8 '
+                        'is stored with per-dimension scales and offsets')
+
+    parser.add_argument('--pretokenized',
+                        action='store_true',
+                        help='build spaCy\'s Docs from the tier "words" '
+                        '(cased like the sentences\' texts) instead of '
+                        'tokenizing the sentences\' texts')
+
+    parser.add_argument('--weighted-sentences',
+                        action='store_true',
+                        help='additionally store the sentence vectors '
+                        'weighted by the words\' inverse frequency')
+
+    parser.add_argument('--no-daemon',
+                        action='store_true',
+                        help='load spaCy\'s model even if the tagging '
+                        'daemon (tagging-daemon.py) is running')
+
+    parser.add_argument('--memory-report',
+                        default=None,
+                        help='trace the memory of every stage and write '
+                        'the report (.json) to this file')
+
+    args = parser.parse_args()
+
+    inFile = args.infile
+    vectorDtype = args.vector_dtype
+    pretokenized = args.pretokenized
+    weighted = args.weighted_sentences
+    memoryReport = args.memory_report
+    useDaemon = not args.no_daemon
+
+    return (inFile, vectorDtype, pretokenized, weighted, memoryReport,
+            useDaemon)
+
+
+def read_n_clean(inFile, tierNames=None):
+    '''
+    reads the .TextGrid file (only the tiers in tierNames, if given), does
+    some cleaning, and puts the content into a dict with tiers as keys
+    '''
+    # parsed tiers are cached in a binary snapshot next to the TextGrid
+    tiers = read_tiers_cached(inFile, tierNames)
+
+    contentDict = {}
+    for tierKey, intervals in tiers.items():
+        # round the timings to milliseconds
+        contentDict[tierKey] = [[str(round(xmin, 3)), str(round(xmax, 3)),
+                                 text.replace('"', '').strip()]
+                                for xmin, xmax, text in intervals]
 
     return contentDict
 
@@ -273,8 +317,77 @@ def add_punctuation(wordList):
     return wordList
 
 
-def match_n_analyze(dataDict, nlp):
+def linguistic_features(nlpWord, pNouns, nouns, numbers, vocab, vectors):
+    '''
+    returns the linguistic features of a word analyzed by spaCy in the order
+    of the tiers in LINGUISTICS; vocab and vectors collect the vector table
+    '''
+    # first, do some heuristic corrections for words that spaCy
+    # more often tags wrongly than correctly
+    if nlpWord.text.lower() in pNouns:
+        nlpPos = 'PROPN'
+        nlpTag = 'NE'
+    elif nlpWord.text.lower() in nouns:
+        nlpPos = 'NOUN'
+        nlpTag = 'NN'
+    elif nlpWord.text.lower() in numbers:
+        nlpPos = 'NUM'
+        nlpTag = 'CARD'
+    else:
+        nlpPos = nlpWord.pos_
+        nlpTag = nlpWord.tag_
+
+    # create the entry for the column "syntactic dependency"
+    # get all word's children (= dependent words)
+    # and ignore punctuation
+    nlpChildren = [x.text for x in nlpWord.children
+                   if x.text.isalnum() == True]
+    # join all items/children to one string
+    if nlpChildren != []:
+        nlpChildren = ','.join(nlpChildren)
+    # if word has no children put in a placeholder
+    else:
+        nlpChildren = '-'
+
+    # prepare the string to write into the TextGrid interval
+    nlpDependText = '%s;%s;%s'
+    nlpDependText = nlpDependText % (nlpWord.dep_,
+                                     nlpWord.head.text.upper(),
+                                     nlpChildren)
+
+    # look up the word2vector in the vector table
+    # check if it is a null vector
+    # and write the row index of the table into the intervall
+    if np.absolute(nlpWord.vector).sum() > 0:
+        nlpVector = add_to_table(vocab, vectors,
+                                 nlpWord.text,
+                                 nlpWord.vector)
+    # if it is a null vector the word is unknown,
+    # hence flag it with '#' (which saves space)
+    else:
+        nlpVector = NOVECTOR
+
+    return [nlpPos,  # simple part-of-speech tag
+            nlpTag,  # detailed part-of-speech tag
+            nlpDependText,
+            nlpWord.lemma_,  # word's base/root
+            nlpWord.is_stop,  # word among most common words?
+            nlpVector]
+
+
+def token_reference(sentNr, nlpWord):
+    '''
+    returns the position of the word and its head within the analyzed
+    sentence, and the dependency label; appended to the word's row after the
+    linguistic features, so dependency_arrays can resolve the heads to words
+    '''
+    return (sentNr, nlpWord.i, nlpWord.head.i, nlpWord.dep_)
+
+
+def match_n_analyze(dataDict, nlp, vocab, vectors):
     '''
+    vocab and vectors collect the vector table (one vector per unique word);
+    the tier 'vector' only gets the word's row index into that table
     '''
     # words to ignore
     nonspeech = add_punctuation(CORRECTIONS['NONSPEECH'])
@@ -283,7 +396,7 @@ def match_n_analyze(dataDict, nlp):
     nouns = add_punctuation(CORRECTIONS[('NOUN', 'NN')])
     numbers = add_punctuation(CORRECTIONS[('NUM', 'CARD')])
 
-    for sentRow in dataDict['sentence']:
+    for sentNr, sentRow in enumerate(dataDict['sentence']):
         # in the sentence tier, skip intervals of silence
         if sentRow[2] == '':
             continue
@@ -348,62 +461,13 @@ def match_n_analyze(dataDict, nlp):
                 # when word from the sentences matches the word from the
                 # tier "word", add the linguistic tags
                 else:
-                    # first, do some heuristic corrections for words that spaCy
-                    # more often tags wrongly than correctly
-                    if nlpWord.text.lower() in pNouns:
-                        nlpPos = 'PROPN'
-                        nlpTag = 'NE'
-                    elif nlpWord.text.lower() in nouns:
-                        nlpPos = 'NOUN'
-                        nlpTag = 'NN'
-                    elif nlpWord.text.lower() in numbers:
-                        nlpPos = 'NUM'
-                        nlpTag = 'CARD'
-                    else:
-                        nlpPos = nlpWord.pos_
-                        nlpTag = nlpWord.tag_
-
-                    # create the entry for the column "syntactic dependency"
-                    # get all word's children (= dependent words)
-                    # and ignore punctuation
-                    nlpChildren = [x.text for x in nlpWord.children
-                                   if x.text.isalnum() == True]
-                    # join all items/children to one string
-                    if nlpChildren != []:
-                        nlpChildren = ','.join(nlpChildren)
-                    # if word has no children put in a placeholder
-                    else:
-                        nlpChildren = '-'
-
-                    # prepare the string to write into the TextGrid interval
-                    nlpDependText = '%s;%s;%s'
-                    nlpDependText = nlpDependText % (nlpWord.dep_,
-                                                     nlpWord.head.text.upper(),
-                                                     nlpChildren)
-
-                    # clean the word2vector
-                    # check if it is a null vector
-                    # and process the string to be written into the intervall
-                    if np.absolute(nlpWord.vector).sum() > 0:
-                        nlpVector = nlpWord.vector.tolist()
-                        nlpVector = [str(x) for x in nlpVector]
-                        nlpVector = ','.join(nlpVector)
-                    # if it is a null vector the word is unknown,
-                    # hence flag it with '#' (which saves space)
-                    else:
-                        nlpVector = '#'
-
-                    # finally, extend the row of the current word with
+                    # extend the row of the current word with
                     # the additional linguistic features
                     # the function "write_to_file" will use the extended
                     # row(s) to build the new actual tiers
-                    wordTierRow.extend(
-                        [nlpPos,  # simple part-of-speech tag
-                         nlpTag,  # detailed part-of-speech tag
-                         nlpDependText,
-                         nlpWord.lemma_,  # word's base/root
-                         nlpWord.is_stop,  # word among most common words?
-                         nlpVector])
+                    wordTierRow.extend(linguistic_features(
+                        nlpWord, pNouns, nouns, numbers, vocab, vectors))
+                    wordTierRow.append(token_reference(sentNr, nlpWord))
 
                     wordInd += 1
                     if wordInd == len(nlpWords):
@@ -412,6 +476,139 @@ def match_n_analyze(dataDict, nlp):
     return dataDict
 
 
+def sentences_with_words(dataDict):
+    '''
+    returns the sentences with text together with the rows of the tier
+    "words" whose intervals lie within the sentence; both tiers are sorted,
+    so one sweep over the words suffices
+    '''
+    wordRows = [row for row in dataDict['words'] if row[2] != '']
+
+    grouped = []
+    wordInd = 0
+    for sentRow in dataDict['sentence']:
+        if sentRow[2] == '':
+            continue
+        sentStart = float(sentRow[0])
+        sentEnd = float(sentRow[1])
+
+        # skip words that lie before the sentence (i.e. outside of any)
+        while (wordInd < len(wordRows) and
+               float(wordRows[wordInd][0]) < sentStart):
+            wordInd += 1
+
+        sentWords = []
+        while (wordInd < len(wordRows) and
+               float(wordRows[wordInd][1]) <= sentEnd):
+            sentWords.append(wordRows[wordInd])
+            wordInd += 1
+
+        grouped.append((sentRow, sentWords))
+
+    return grouped
+
+
+def run_pipeline(nlp, docs):
+    '''
+    runs the (enabled) components of spaCy's pipeline on already tokenized
+    Docs, batch by batch
+    '''
+    for name, proc in nlp.pipeline:
+        if hasattr(proc, 'pipe'):
+            docs = proc.pipe(docs, batch_size=BATCHSIZE)
+        else:
+            docs = map(proc, docs)
+
+    return docs
+
+
+def tag_words(nlp, wordLists):
+    '''
+    returns the tagged sentences of the sentences given as lists of words;
+    the daemon tags them in batches, a local model via run_pipeline
+    '''
+    if isinstance(nlp, RemoteModel):
+        return nlp.pipe_words(wordLists, BATCHSIZE)
+
+    # spaCy is only imported by the local model
+    from spacy.tokens import Doc
+    docs = (Doc(nlp.vocab,
+                words=words,
+                spaces=[True] * (len(words) - 1) + [False])
+            for words in wordLists)
+
+    return run_pipeline(nlp, docs)
+
+
+def cased_words(sentText, rows):
+    '''
+    returns the words of the rows with the casing of the sentence's text;
+    the tier "words" (e.g. the aligner's output) can be all lower case, but
+    spaCy's German model needs the casing (e.g. of nouns); words that are
+    not found in the sentence keep their text
+    '''
+    sentTokens = [token.strip(PUNCTUATION) for token in sentText.split()]
+
+    words = []
+    tokenInd = 0
+    for row in rows:
+        word = row[2]
+        # look for the word among the following tokens of the sentence
+        for nextInd in range(tokenInd, len(sentTokens)):
+            if sentTokens[nextInd].lower() == word.strip(PUNCTUATION).lower():
+                word = word.replace(word.strip(PUNCTUATION),
+                                    sentTokens[nextInd])
+                tokenInd = nextInd + 1
+                break
+        words.append(word)
+
+    return words
+
+
+def analyze_pretokenized(dataDict, nlp, vocab, vectors):
+    '''
+    instead of letting spaCy tokenize the sentence's text and matching
+    spaCy's tokens back to the tier "words" (see match_n_analyze), the Docs
+    are built directly from the words within each sentence; hence, every
+    token belongs to exactly one row of the tier "words"
+    '''
+    # words to ignore
+    nonspeech = add_punctuation(list(CORRECTIONS['NONSPEECH']))
+    other = add_punctuation(list(CORRECTIONS[('X', 'XY')]))
+    pNouns = add_punctuation(list(CORRECTIONS[('PROPN', 'NE')]))
+    nouns = add_punctuation(list(CORRECTIONS[('NOUN', 'NN')]))
+    numbers = add_punctuation(list(CORRECTIONS[('NUM', 'CARD')]))
+
+    # non-speech and 'other' are tagged right away and not given to spaCy
+    # (which tags them wrongly)
+    toAnalyze = []
+    wordLists = []
+    for sentRow, sentWords in sentences_with_words(dataDict):
+        analyzed = []
+        for wordTierRow in sentWords:
+            if wordTierRow[2] in nonspeech:
+                wordTierRow.append('NONSPEECH')
+            elif wordTierRow[2] in other:
+                wordTierRow.extend(['X', 'XY'])
+            else:
+                analyzed.append(wordTierRow)
+
+        if analyzed:
+            toAnalyze.append(analyzed)
+            wordLists.append(cased_words(sentRow[2], analyzed))
+
+    # every sentence becomes one Doc with the words separated by spaces
+    for sentNr, (rows, nlpSentence) in enumerate(zip(toAnalyze,
+                                                    tag_words(nlp,
+                                                              wordLists))):
+        for wordTierRow, nlpWord in zip(rows, nlpSentence):
+            wordTierRow.extend(linguistic_features(
+                nlpWord, pNouns, nouns, numbers, vocab, vectors))
+            wordTierRow.append(token_reference(sentNr, nlpWord))
+
+    return dataDict
+
+
 def write_to_file(data, outfname):
     '''
     '''
@@ -423,86 +620,197 @@ def write_to_file(data, outfname):
     # write number of tiers into the TextGrid header
     TEMPLHEADER[6] = TEMPLHEADER[6].replace('##', str(len(allTiers)))
 
-    # write the header
-    toWrite = []
-    toWrite.extend(TEMPLHEADER)
-
-    # write the tiers
-    column = 3
-    for nr, tierName in enumerate(allTiers[:], 1):
-        # write the header for the current tier
-        tierText = deepcopy(TEMPLTIER)
-        tierText[0] = tierText[0].replace('##', str(nr))
-        tierText[2] = tierText[2].replace('##', tierName)
-
-        # FACTORIZE THE FOLLOWING
-        # processing of the tiers that are already in the original file
-        if tierName in ORGTIERS:
-            # add the tier text to the header of the file
-            tierText[5] = tierText[5].replace('##', str(len(data[tierName])))
-            toWrite.extend(tierText)
-
-            for i, row in enumerate(data[tierName], 1):
-                intervText = deepcopy(TEMPLINTERV)
-                # the number of the intervall
-                intervText[0] = intervText[0].replace('##', str(i))
-                # start
-                intervText[1] = intervText[1].replace('##', row[0])
-                # end
-                intervText[2] = intervText[2].replace('##', row[1])
-                # text
-                intervText[3] = intervText[3].replace('##', row[2])
-
-                toWrite.extend(intervText)
-
-        # processing of the new tiers that will contain the spaCy annotations
-        # all timings / rows are based on the words annotation
-        # hence, pull the information from the dictionary with key 'words'
-        if tierName in LINGUISTICS:
-            tierText[5] = tierText[5].replace('##', str(len(data['words'])))
-            toWrite.extend(tierText)
-
-            for i, row in enumerate(data['words'], 1):
-                intervText = deepcopy(TEMPLINTERV)
-                # the number of the intervall
-                intervText[0] = intervText[0].replace('##', str(i))
-                # start
-                intervText[1] = intervText[1].replace('##', row[0])
-                # end
-                intervText[2] = intervText[2].replace('##', row[1])
-                # text
-                # columns later in the row contain the linguistic information
-                # handle exception when the row/list is shorter
-                # because there was no word but a pause in the intervall
-                try:
-                    intervText[3] = intervText[3].replace('##', str(row[column]))
-                except IndexError:
-                    intervText[3] = intervText[3].replace('##', '')
-
-                toWrite.extend(intervText)
-
-            # prepare for the next newly created tier
-            column += 1
-
     with open(outfname, 'w', encoding='utf-16') as textGridFile:
-        textGridFile.writelines(toWrite)
+        # write the header
+        textGridFile.writelines(TEMPLHEADER)
+
+        # write the tiers; every tier is written when it is complete, so only
+        # the lines of one tier are held in memory at a time
+        column = 3
+        for nr, tierName in enumerate(allTiers[:], 1):
+            toWrite = []
+            # write the header for the current tier
+            tierText = deepcopy(TEMPLTIER)
+            tierText[0] = tierText[0].replace('##', str(nr))
+            tierText[2] = tierText[2].replace('##', tierName)
+
+            # FACTORIZE THE FOLLOWING
+            # processing of the tiers that are already in the original file
+            if tierName in ORGTIERS:
+                # add the tier text to the header of the file
+                tierText[5] = tierText[5].replace('##',
+                                                  str(len(data[tierName])))
+                toWrite.extend(tierText)
+
+                for i, row in enumerate(data[tierName], 1):
+                    intervText = deepcopy(TEMPLINTERV)
+                    # the number of the intervall
+                    intervText[0] = intervText[0].replace('##', str(i))
+                    # start
+                    intervText[1] = intervText[1].replace('##', row[0])
+                    # end
+                    intervText[2] = intervText[2].replace('##', row[1])
+                    # text
+                    intervText[3] = intervText[3].replace('##', row[2])
+
+                    toWrite.extend(intervText)
+
+            # processing of the new tiers that will contain the spaCy
+            # annotations; all timings / rows are based on the words
+            # annotation, hence, pull the information from the dictionary
+            # with key 'words'
+            if tierName in LINGUISTICS:
+                tierText[5] = tierText[5].replace('##',
+                                                  str(len(data['words'])))
+                toWrite.extend(tierText)
+
+                for i, row in enumerate(data['words'], 1):
+                    intervText = deepcopy(TEMPLINTERV)
+                    # the number of the intervall
+                    intervText[0] = intervText[0].replace('##', str(i))
+                    # start
+                    intervText[1] = intervText[1].replace('##', row[0])
+                    # end
+                    intervText[2] = intervText[2].replace('##', row[1])
+                    # text
+                    # columns later in the row contain the linguistic
+                    # information; handle exception when the row/list is
+                    # shorter because there was no word but a pause in the
+                    # intervall
+                    try:
+                        intervText[3] = intervText[3].replace(
+                            '##', str(row[column]))
+                    except IndexError:
+                        intervText[3] = intervText[3].replace('##', '')
+
+                    toWrite.extend(intervText)
+
+                # prepare for the next newly created tier
+                column += 1
+
+            textGridFile.writelines(toWrite)
+
+
+def sentence_vectors(dataDict, vectors, weighted=False, dims=0):
+    '''
+    returns one vector per interval of the tier "sentence": the mean of the
+    vectors of the sentence's non-stop words (optionally weighted by the
+    words' inverse frequency); pauses and sentences without such words get
+    null vectors (of length dims if there are no vectors at all)
+    '''
+    sentences = dataDict['sentence']
+    sentStarts = np.array([float(row[0]) for row in sentences])
+    sentEnds = np.array([float(row[1]) for row in sentences])
+    sentHasText = np.array([row[2] != '' for row in sentences])
+
+    # only words with all linguistic features (i.e. analyzed by spaCy)
+    tagged = [row for row in dataDict['words']
+              if len(row) > 3 + len(LINGUISTICS)]
+    if not tagged or not vectors:
+        return np.zeros((len(sentences), dims), dtype=np.float32)
+
+    types = np.array([int(row[8]) if row[8] != NOVECTOR else -1
+                      for row in tagged])
+    isStop = np.array([row[7] is True for row in tagged])
+    starts = np.array([float(row[0]) for row in tagged])
+    ends = np.array([float(row[1]) for row in tagged])
+
+    # both tiers are sorted, hence the words' sentences are sorted, too
+    sentIndex = np.searchsorted(sentStarts, starts, side='right') - 1
+    clipped = np.clip(sentIndex, 0, None)
+    inSentence = ((sentIndex >= 0) & (ends <= sentEnds[clipped]) &
+                  sentHasText[clipped])
+    keep = inSentence & ~isStop & (types >= 0)
+
+    weights = None
+    if weighted:
+        # relative frequency of every word (type) among all tagged words
+        counts = np.bincount(types[types >= 0], minlength=len(vectors))
+        frequency = counts / max(1, counts.sum())
+        weights = (FREQWEIGHT / (FREQWEIGHT + frequency[types[keep]]))
+        weights = weights.astype(np.float32)
+
+    table = np.vstack(vectors).astype(np.float32)
+
+    return segment_means(table[types[keep]], sentIndex[keep],
+                         len(sentences), weights)
+
+
+def dependency_arrays(dataDict):
+    '''
+    returns for every word (interval of the tier "words" with text) the
+    index of its head among the words and its dependency label; words that
+    were not analyzed get no head and an empty label, heads that are not
+    among the words (e.g. punctuation) make the word a root
+    '''
+    words = [row for row in dataDict['words'] if row[2] != '']
+    analyzed = [len(row) > 3 + len(LINGUISTICS) for row in words]
+
+    # the word of every analyzed token of a sentence
+    wordOfToken = {}
+    for wordNr, row in enumerate(words):
+        if analyzed[wordNr]:
+            sentNr, tokenNr, headNr, label = row[3 + len(LINGUISTICS)]
+            wordOfToken[(sentNr, tokenNr)] = wordNr
+
+    heads = []
+    labels = []
+    for wordNr, row in enumerate(words):
+        if analyzed[wordNr]:
+            sentNr, tokenNr, headNr, label = row[3 + len(LINGUISTICS)]
+            heads.append(wordOfToken.get((sentNr, headNr), wordNr))
+            labels.append(label)
+        else:
+            heads.append(NOHEAD)
+            labels.append('')
+
+    return heads, labels
 
 
 # main programm
 if __name__ == "__main__":
     # read in annotation
-    inFile = sys.argv[1]
+    inFile, vectorDtype, pretokenized, weighted, memoryReport, useDaemon = \
+        parse_arguments()
+    profile = MemoryProfile(enabled=memoryReport is not None)
     oldName = os.path.basename(inFile)
     newName = os.path.splitext(oldName)[0] + '_tagged.TextGrid'
     outFile = inFile.replace(oldName, newName)
 
-    data = read_n_clean(inFile)
+    with profile.stage('read'):
+        data = read_n_clean(inFile, ORGTIERS)
 
-    nlp = spacy.load(MODEL)
-    data = match_n_analyze(data, nlp)
+    vocab = {}
+    vectors = []
+    with profile.stage('analyze'):
+        # the model is held by the tagging daemon if it is running
+        if pretokenized:
+            nlp = load_model(MODEL, DISABLED, useDaemon)
+            data = analyze_pretokenized(data, nlp, vocab, vectors)
+        else:
+            nlp = load_model(MODEL, useDaemon=useDaemon)
+            data = match_n_analyze(data, nlp, vocab, vectors)
 
     # bring data in shape and write them to file
-    write_to_file(data, outFile)
+    with profile.stage('write'):
+        write_to_file(data, outFile)
+
+    with profile.stage('vectors'):
+        # the vectors of the words are stored once per unique word
+        # (keyed by the word's text: spaCy's vectors belong to the text, not
+        # to the lemma)
+        dims = vectors_length(nlp)
+        save_vector_table(outFile, vocab, vectors, vectorDtype, dims)
+        # and the sentences' vectors aligned with the tier "sentence"
+        save_sentence_vectors(outFile,
+                              sentence_vectors(data, vectors, False, dims))
+        if weighted:
+            save_sentence_vectors(outFile,
+                                  sentence_vectors(data, vectors, True, dims),
+                                  True)
+
+    # the dependencies as head indices & labels aligned with the words
+    save_dependencies(outFile, *dependency_arrays(data))
 
     # counter the number of items in the tiers for
     # descriptive statistics
@@ -512,3 +820,6 @@ if __name__ == "__main__":
                 if i[2] != '':
                     counter += 1
             print(tier, counter)
+
+    if memoryReport is not None:
+        profile.report(memoryReport)
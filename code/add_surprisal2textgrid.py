@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+"""
+Adds the lexical frequency and the bigram surprisal of every word to the
+tagged TextGrid(s)
+
+Unigram and bigram counts of the lemmas (or the words) are built over all
+given TextGrids, e.g. the annotations of several movies, and optionally over
+further TextGrids that only contribute to the counts. For every analyzed word
+the new tiers contain:
+    - 'frequency': log10 of the (add-one smoothed) occurrences per million
+    - 'surprisal': -log2 of the probability of the lemma given the previous
+      lemma of the same sentence (the sentence's start for the first one),
+      smoothed by Witten-Bell interpolation with the unigram probability
+
+All items of all files are encoded as integers once; counts and
+probabilities are then computed for all words at once. textgrid2bids.py
+turns the tiers into the columns 'frequency' and 'surprisal'.
+
+Call from the root of the dataset, e.g.:
+python3 code/add_surprisal2textgrid.py \
+    -i annotation/fg_rscut_ad_ger_speech_tagged.TextGrid
+"""
+import argparse
+import os
+import sys
+import numpy as np
+from annotation_io import append_tiers, read_tier_arrays, tier_index
+
+
+# the new tiers and the number of decimals of their values
+TIERS = [('frequency', 3), ('surprisal', 3)]
+
+# tolerance (in seconds) when checking if a sentence contains a word
+EPSILON = 0.0005
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Add lexical frequency and surprisal per word'
+    )
+    parser.add_argument('-i',
+                        nargs='+',
+                        default=['annotation/'
+                                 'fg_rscut_ad_ger_speech_tagged.TextGrid'],
+                        help='the tagged TextGrid(s) to add the tiers to')
+
+    parser.add_argument('-c',
+                        nargs='*',
+                        default=[],
+                        help='further tagged TextGrids that only contribute '
+                        'to the counts')
+
+    parser.add_argument('--level',
+                        choices=['lemma', 'words'],
+                        default='lemma',
+                        help='count lemmas or (lower case) words')
+
+    args = parser.parse_args()
+
+    return args.i, args.c, args.level
+
+
+def read_items(inFile, level):
+    '''
+    returns per interval of the tier 'words' the item to count ('' for
+    pauses and words that were not analyzed), and the index of the
+    interval's sentence (-1 for words outside of sentences)
+    '''
+    tiers = read_tier_arrays(inFile, ['sentence', 'words', 'lemma'])
+    starts, ends, lemmas = tiers['lemma']
+    lemmas = np.array([lemma.strip() for lemma in lemmas], dtype=object)
+
+    if level == 'lemma':
+        items = lemmas
+    else:
+        words = np.array([word.strip().lower() for word in tiers['words'][2]],
+                         dtype=object)
+        items = np.where(lemmas != '', words, '')
+
+    # both tiers are sorted, so the words' sentences are found by bisection
+    sentStarts, sentEnds, sentTexts = tiers['sentence']
+    sentences = np.searchsorted(sentStarts, starts + EPSILON) - 1
+    clipped = np.clip(sentences, 0, None)
+    inSentence = ((sentences >= 0) & (ends <= sentEnds[clipped] + EPSILON) &
+                  (sentTexts[clipped] != ''))
+    sentences[~inSentence] = -1
+
+    return items, sentences
+
+
+def lexical_statistics(corpus):
+    '''
+    returns the log frequency and the surprisal of every item in the corpus
+    (a list of items & sentence indices per file, see read_items); both are
+    NaN for intervals without item
+    '''
+    items = np.concatenate([fileItems for fileItems, sentences in corpus])
+    isToken = items != ''
+
+    # sentences are numbered across files; words outside of sentences are
+    # sentences of their own
+    sentences = []
+    offset = 0
+    for fileItems, fileSentences in corpus:
+        sentences.append(np.where(fileSentences >= 0, fileSentences + offset,
+                                  -1))
+        offset += max(0, fileSentences.max(initial=-1) + 1)
+    sentences = np.concatenate(sentences)[isToken]
+    outside = sentences < 0
+    sentences[outside] = offset + np.arange(outside.sum())
+
+    categories, codes = np.unique(items[isToken].astype(str),
+                                  return_inverse=True)
+    codes = codes.reshape(-1)
+    nrOfTypes = len(categories)
+    nrOfTokens = len(codes)
+
+    # unigram probabilities with add-one smoothing
+    unigrams = np.bincount(codes, minlength=nrOfTypes)
+    pUnigram = (unigrams + 1) / (nrOfTokens + nrOfTypes)
+
+    # the history of every token is the previous token of its sentence or
+    # the start of the sentence (code nrOfTypes)
+    history = np.full(nrOfTokens, nrOfTypes, dtype=np.int64)
+    sameSentence = sentences[1:] == sentences[:-1]
+    history[1:][sameSentence] = codes[:-1][sameSentence]
+
+    # the bigrams as one integer each
+    bigrams = history * (nrOfTypes + 1) + codes
+    seen, inverse, bigramCounts = np.unique(bigrams, return_inverse=True,
+                                            return_counts=True)
+    historyCounts = np.bincount(history, minlength=nrOfTypes + 1)
+    # the number of different items following each history
+    followers = np.bincount(seen // (nrOfTypes + 1),
+                            minlength=nrOfTypes + 1)
+
+    # Witten-Bell: the more different items follow a history, the more
+    # weight the unigram probability gets
+    pBigram = ((bigramCounts[inverse.reshape(-1)] +
+                followers[history] * pUnigram[codes]) /
+               (historyCounts[history] + followers[history]))
+
+    frequency = np.full(len(items), np.nan)
+    surprisal = np.full(len(items), np.nan)
+    frequency[isToken] = np.log10(pUnigram[codes] * 1e6)
+    surprisal[isToken] = -np.log2(pBigram)
+
+    return frequency, surprisal, nrOfTypes, nrOfTokens
+
+
+def value_tier(starts, ends, values, decimals):
+    '''
+    returns the intervals with the values as text; intervals without a value
+    stay empty
+    '''
+    texts = ['' if np.isnan(value) else str(round(float(value), decimals))
+             for value in values]
+
+    return [list(interval)
+            for interval in zip(starts.tolist(), ends.tolist(), texts)]
+
+
+# main programm
+if __name__ == "__main__":
+    inFiles, countFiles, level = parse_arguments()
+
+    newNames = [name for name, decimals in TIERS]
+    for inFile in inFiles:
+        if any(entry[0] in newNames for entry in tier_index(inFile)):
+            sys.exit('%s already contains the tiers %s' % (inFile, newNames))
+
+    corpus = [read_items(inFile, level) for inFile in inFiles + countFiles]
+    frequency, surprisal, nrOfTypes, nrOfTokens = lexical_statistics(corpus)
+
+    # the values of the files are consecutive, in the order of the corpus
+    first = 0
+    for inFile, (items, sentences) in zip(inFiles, corpus):
+        last = first + len(items)
+        starts, ends, texts = read_tier_arrays(inFile, ['words'])['words']
+        newTiers = [(name, value_tier(starts, ends, values[first:last],
+                                      decimals))
+                    for (name, decimals), values
+                    in zip(TIERS, [frequency, surprisal])]
+        first = last
+
+        # write to a temporary file first, so the input can be the output
+        tmpFile = inFile + '.tmp'
+        append_tiers(inFile, tmpFile, newTiers)
+        os.replace(tmpFile, inFile)
+
+    print('%s files, %s counted; %s %s types, %s tokens'
+          % (len(inFiles), len(corpus), nrOfTypes, level, nrOfTokens))
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+"""
+Aligns the annotation's events to the stimulus timing of every subject
+
+SEGMENTS_OFFSETS holds the nominal start of every run (segment) in the movie.
+During the fMRI sessions, the actual start of the movie within a run and the
+speed of the playback differ slightly between subjects. Per subject, a timing
+log (.tsv) with the columns
+    run         the run (1-8)
+    stimulus    a time point of the stimulus in (nominal) run time
+    scanner     the time it was presented at, in seconds since the run's
+                first volume
+(and optionally 'subject', else the subject is the file name up to the first
+'_') gives pairs of nominal and observed times. Per subject and run, an offset
+and a drift are fitted (scanner = offset + drift * stimulus, least squares;
+runs with only one time point just get the offset, runs without any keep the
+nominal timing).
+
+All subjects are fitted at once from sums per subject & run, and the events
+of the annotation are remapped for all subjects at once by broadcasting the
+fits (subjects x runs) over the events. Written are one events file per
+subject and run in run time, and the fits (timing_fits.tsv).
+
+Call from the root of the dataset, e.g.:
+python3 code/align-subject-timing.py \
+    -t sourcedata/timing -o annotation/subjects
+"""
+import argparse
+import csv
+import glob
+import io
+import os
+import os.path
+import sys
+import numpy as np
+from annotation_io import SEGMENTS_OFFSETS, get_runs, read_tsv_cached
+
+
+# number of runs/segments
+NROFRUNS = 8
+
+# number of decimals of the remapped on- & offsets
+DECIMALS = 3
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Remap the annotation to every subject\'s stimulus timing'
+    )
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech_tagged.tsv',
+                        help='the annotation (BIDS .tsv) in movie time')
+
+    parser.add_argument('-t',
+                        nargs='+',
+                        default=['sourcedata/timing'],
+                        help='the timing logs (.tsv), or directories '
+                        'containing them')
+
+    parser.add_argument('-o',
+                        default='annotation/subjects',
+                        help='the directory to write the events files to')
+
+    parser.add_argument('--task',
+                        default='avmovie',
+                        help='the task in the names of the events files')
+
+    args = parser.parse_args()
+
+    timingFiles = []
+    for path in args.t:
+        if os.path.isdir(path):
+            timingFiles.extend(sorted(glob.glob(os.path.join(path, '*.tsv'))))
+        else:
+            timingFiles.append(path)
+
+    return args.i, timingFiles, args.o, args.task
+
+
+def read_timing(timingFiles):
+    '''
+    returns the subjects, and per time point of all logs the subject's
+    index, the run, the nominal and the observed time; exits at rows whose
+    run is not one of the runs (1-8)
+    '''
+    subjects = []
+    columns = {'subject': [], 'run': [], 'stimulus': [], 'scanner': []}
+    for timingFile in timingFiles:
+        fileSubject = os.path.basename(timingFile).split('_')[0]
+        with open(timingFile) as f:
+            reader = csv.DictReader(f, delimiter='\t')
+            for row in reader:
+                subject = row.get('subject', fileSubject)
+                if subject not in subjects:
+                    subjects.append(subject)
+                columns['subject'].append(subjects.index(subject))
+                run = int(row['run'])
+                if not 1 <= run <= NROFRUNS:
+                    sys.exit('%s, line %s: run %s is not within 1-%s'
+                             % (timingFile, reader.line_num, row['run'],
+                                NROFRUNS))
+                columns['run'].append(run)
+                columns['stimulus'].append(float(row['stimulus']))
+                columns['scanner'].append(float(row['scanner']))
+
+    timing = {key: np.array(values, dtype=np.int64 if key in ['subject',
+                                                               'run']
+                            else np.float64)
+              for key, values in columns.items()}
+
+    return subjects, timing
+
+
+def fit_runs(timing, nrOfSubjects):
+    '''
+    returns the offset, the drift, the number of time points and the RMS of
+    the residuals (in seconds) per subject & run (arrays of shape subjects x
+    runs); the least squares fits of all subjects & runs are computed from
+    sums per subject & run
+    '''
+    groups = timing['subject'] * NROFRUNS + (timing['run'] - 1)
+    nrOfGroups = nrOfSubjects * NROFRUNS
+    x = timing['stimulus']
+    y = timing['scanner']
+
+    def group_sum(weights):
+        return np.bincount(groups, weights=weights, minlength=nrOfGroups)
+
+    n = group_sum(None)
+    sumX = group_sum(x)
+    sumY = group_sum(y)
+    sumXX = group_sum(x * x)
+    sumXY = group_sum(x * y)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = n * sumXX - sumX * sumX
+        # runs with fewer than two distinct time points keep the nominal
+        # speed
+        fitted = (n >= 2) & (spread > 1e-9 * np.maximum(1, n * sumXX))
+        drift = np.where(fitted, (n * sumXY - sumX * sumY) / spread, 1.0)
+        offset = np.where(n > 0, (sumY - drift * sumX) / n, 0.0)
+
+        residuals = y - (offset[groups] + drift[groups] * x)
+        rms = np.sqrt(group_sum(residuals ** 2) / n)
+
+    shape = (nrOfSubjects, NROFRUNS)
+
+    return (offset.reshape(shape), drift.reshape(shape),
+            n.astype(np.int64).reshape(shape), rms.reshape(shape))
+
+
+def run_times(onsets):
+    '''
+    returns the run (1-8) of every onset (in movie time) and the onset in
+    nominal run time (movie time minus the run's start plus its offset, see
+    SEGMENTS_OFFSETS)
+    '''
+    runs = np.clip(get_runs(onsets), 1, NROFRUNS)
+    starts = np.array([start for start, offset in SEGMENTS_OFFSETS])
+    offsets = np.array([offset for start, offset in SEGMENTS_OFFSETS])
+
+    return runs, onsets - starts[runs - 1] + offsets[runs - 1]
+
+
+def remap(runs, nominal, durations, offset, drift):
+    '''
+    returns the on- & offsets (subjects x events) of the events in every
+    subject's run time
+    '''
+    eventOffset = offset[:, runs - 1]
+    eventDrift = drift[:, runs - 1]
+    onsets = eventOffset + eventDrift * nominal[np.newaxis, :]
+
+    return onsets, eventDrift * durations[np.newaxis, :]
+
+
+def formatted_cells(content):
+    '''
+    returns the cells after on- & offset of every row as one line of a
+    .tsv; they are the same for all subjects, so they are formatted once
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter='\t', lineterminator='\n')
+    writer.writerows([row[2:] for row in content])
+
+    return buffer.getvalue().split('\n')[:-1]
+
+
+def write_events(outFile, header, onsets, durations, cells):
+    '''
+    writes the events with their remapped on- & offsets (with the line
+    endings of csv.writer, like write_tsv)
+    '''
+    with open(outFile, 'w') as f:
+        f.write('\t'.join(header) + '\r\n')
+        f.writelines(['%s\t%s\t%s\r\n' % line
+                      for line in zip(onsets, durations, cells)])
+
+
+def write_tsv(outFile, header, rows):
+    '''
+    '''
+    with open(outFile, 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, timingFiles, outDir, task = parse_arguments()
+
+    header, content = read_tsv_cached(inFile)
+    onsets = np.array([float(row[0]) for row in content])
+    durations = np.array([float(row[1]) for row in content])
+
+    subjects, timing = read_timing(timingFiles)
+    offset, drift, nrOfPoints, rms = fit_runs(timing, len(subjects))
+
+    runs, nominal = run_times(onsets)
+    subjOnsets, subjDurations = remap(runs, nominal, durations, offset, drift)
+    subjOnsets = np.round(subjOnsets, DECIMALS)
+    subjDurations = np.round(subjDurations, DECIMALS)
+
+    # the events of every run, in the order of the annotation
+    eventsOfRun = {run: np.flatnonzero(runs == run)
+                   for run in range(1, NROFRUNS + 1)}
+    cells = formatted_cells(content)
+    cellsOfRun = {run: [cells[event] for event in events]
+                  for run, events in eventsOfRun.items()}
+
+    for subjNr, subject in enumerate(subjects):
+        subjDir = os.path.join(outDir, subject)
+        os.makedirs(subjDir, exist_ok=True)
+        for run, events in eventsOfRun.items():
+            write_events(os.path.join(subjDir, '%s_task-%s_run-%s_events.tsv'
+                                      % (subject, task, run)),
+                         header,
+                         subjOnsets[subjNr, events].tolist(),
+                         subjDurations[subjNr, events].tolist(),
+                         cellsOfRun[run])
+
+    fits = [[subject, run + 1, round(float(offset[subjNr, run]), 4),
+             round(float(drift[subjNr, run]), 6),
+             int(nrOfPoints[subjNr, run]),
+             'n/a' if nrOfPoints[subjNr, run] == 0
+             else round(float(rms[subjNr, run]), 4)]
+            for subjNr, subject in enumerate(subjects)
+            for run in range(NROFRUNS)]
+    write_tsv(os.path.join(outDir, 'timing_fits.tsv'),
+              ['subject', 'run', 'offset', 'drift', 'time_points',
+               'residual_rms'], fits)
+
+    print('%s subjects, %s events remapped' % (len(subjects), len(onsets)))
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+"""
+Local query service for the annotation (BIDS .tsv)
+
+The annotation is loaded once and indexed in memory: the rows of every level
+(sentences, words, phonemes) are sorted by onset, and the rows of every
+speaker, part-of-speech tag and lemma are kept as arrays of row numbers.
+Queries are answered as JSON over HTTP, either on a local TCP port or on a
+Unix socket; answers to repeated queries come from a cache.
+
+    GET /query?start=60&end=70              rows overlapping 60 s - 70 s
+    GET /query?person=JENNY&level=sentence  sentences of a speaker
+    GET /query?pos=NOUN&lemma=Haus&run=2    filters can be combined
+    GET /info                               levels, speakers, tags, ...
+
+Parameters: level (sentence, word (default), phoneme), start & end (in
+seconds), run (1-8), person, pos, lemma, and limit (default 1000 rows).
+
+Call from the root of the dataset, e.g.:
+python3 code/annotation-server.py --port 8765
+curl 'http://127.0.0.1:8765/query?person=FORREST&start=0&end=600'
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlsplit
+import numpy as np
+from annotation_io import SEGMENTS_OFFSETS, read_tsv_cached
+
+
+# the levels of the rows, by the content of the column 'pos'
+LEVELS = {'SENTENCE': 'sentence', 'PHONEME': 'phoneme'}
+
+# the columns that get an index of their categories
+INDEXED = ['person', 'pos', 'lemma']
+
+# the number of rows returned if the query does not set a limit
+LIMIT = 1000
+
+# number of runs/segments
+NROFRUNS = 8
+
+# the status lines of the answers
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Serve queries of the annotation as JSON'
+    )
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech_tagged.tsv',
+                        help='the annotation to serve')
+
+    parser.add_argument('--host',
+                        default='127.0.0.1',
+                        help='the address to listen on')
+
+    parser.add_argument('--port',
+                        type=int,
+                        default=8765,
+                        help='the port to listen on')
+
+    parser.add_argument('--socket',
+                        default=None,
+                        help='listen on this Unix socket instead of a port')
+
+    parser.add_argument('--cache-size',
+                        type=int,
+                        default=4096,
+                        help='number of answers kept in the cache')
+
+    args = parser.parse_args()
+
+    return args.i, args.host, args.port, args.socket, args.cache_size
+
+
+class AnnotationIndex:
+    '''
+    the rows of the annotation, indexed per level by onset and by the
+    categories of the columns in INDEXED
+    '''
+    def __init__(self, inFile):
+        header, content = read_tsv_cached(inFile)
+        self.header = header
+
+        rows = defaultdict(list)
+        for line in content:
+            level = LEVELS.get(line[4], 'word')
+            rows[level].append(line + [''] * (len(header) - len(line)))
+
+        runStarts = np.array([start for start, offset in SEGMENTS_OFFSETS])
+        self.levels = {}
+        for level, levelRows in rows.items():
+            onsets = np.array([float(row[0]) for row in levelRows])
+            order = np.argsort(onsets, kind='stable')
+            levelRows = [levelRows[nr] for nr in order]
+            onsets = onsets[order]
+            offsets = onsets + np.array([float(row[1]) for row in levelRows])
+
+            index = {}
+            for column in INDEXED:
+                if column not in header:
+                    continue
+                nr = header.index(column)
+                positions = defaultdict(list)
+                for position, row in enumerate(levelRows):
+                    positions[row[nr]].append(position)
+                index[column] = {value: np.array(found, dtype=np.int64)
+                                 for value, found in positions.items()}
+
+            self.levels[level] = {
+                'rows': levelRows,
+                'onsets': onsets,
+                'offsets': offsets,
+                # no row can start earlier than that before a window and
+                # still overlap it
+                'longest': float((offsets - onsets).max(initial=0)),
+                'runs': np.searchsorted(runStarts, onsets, side='right'),
+                'index': index}
+
+    def info(self):
+        '''
+        returns the levels with their number of rows, and the categories of
+        the indexed columns
+        '''
+        return {level: {'rows': len(data['rows']),
+                        'categories': {column: sorted(values)
+                                       for column, values
+                                       in data['index'].items()}}
+                for level, data in self.levels.items()}
+
+    def query(self, level='word', start=None, end=None, run=None,
+              limit=LIMIT, **categories):
+        '''
+        returns the number of matching rows and (up to limit) the rows as
+        dicts, sorted by onset
+        '''
+        data = self.levels.get(level)
+        if data is None:
+            raise ValueError('unknown level: %s' % level)
+        if limit < 0:
+            raise ValueError('limit must not be negative: %s' % limit)
+        if run is not None and not 1 <= run <= NROFRUNS:
+            raise ValueError('run must be within 1-%s: %s' % (NROFRUNS, run))
+
+        # the rows overlapping the time window
+        first = 0
+        last = len(data['onsets'])
+        if start is not None:
+            first = np.searchsorted(data['onsets'], start - data['longest'])
+        if end is not None:
+            last = np.searchsorted(data['onsets'], end, side='left')
+        positions = np.arange(first, last)
+        if start is not None:
+            positions = positions[data['offsets'][positions] > start]
+
+        if run is not None:
+            positions = positions[data['runs'][positions] == run]
+
+        for column, value in categories.items():
+            if column not in data['index']:
+                raise ValueError('not indexed: %s' % column)
+            found = data['index'][column].get(value, np.zeros(0, np.int64))
+            # both are sorted, so the intersection keeps the onset order
+            positions = np.intersect1d(positions, found, assume_unique=True)
+
+        rows = [dict(zip(self.header, data['rows'][position]))
+                for position in positions[:limit]]
+        for row in rows:
+            row['onset'] = float(row['onset'])
+            row['duration'] = float(row['duration'])
+
+        return {'count': int(len(positions)), 'rows': rows}
+
+
+def parse_query(query):
+    '''
+    returns the keyword arguments of AnnotationIndex.query from the query
+    string of a URL
+    '''
+    arguments = {}
+    for key, value in parse_qsl(query):
+        if key in ['start', 'end']:
+            arguments[key] = float(value)
+        elif key in ['run', 'limit']:
+            arguments[key] = int(value)
+        elif key == 'level' or key in INDEXED:
+            arguments[key] = value
+        else:
+            raise ValueError('unknown parameter: %s' % key)
+
+    return arguments
+
+
+def make_answer(index, cacheSize):
+    '''
+    returns a function that turns a request's target into the status and the
+    JSON body; answers are cached per (normalized) target
+    '''
+    @lru_cache(maxsize=cacheSize)
+    def cached(path, query):
+        if path == '/info':
+            return 200, json.dumps(index.info()).encode()
+        if path != '/query':
+            return 404, json.dumps({'error': 'unknown path'}).encode()
+        try:
+            result = index.query(**parse_query(query))
+        except ValueError as error:
+            return 400, json.dumps({'error': str(error)}).encode()
+
+        return 200, json.dumps(result, ensure_ascii=False).encode()
+
+    def answer(target):
+        url = urlsplit(target)
+        # the order of the parameters does not matter for the cache
+        query = '&'.join(sorted(url.query.split('&'))) if url.query else ''
+        return cached(url.path, query)
+
+    return answer
+
+
+async def handle(reader, writer, answer):
+    '''
+    answers the GET requests of one connection (kept alive until the client
+    closes it or asks to)
+    '''
+    try:
+        while True:
+            requestLine = await reader.readline()
+            if not requestLine:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in [b'\r\n', b'\n', b'']:
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip().lower()
+
+            parts = requestLine.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] != 'GET':
+                status, body = 400, b'{"error": "only GET is supported"}'
+            else:
+                status, body = answer(parts[1])
+
+            close = headers.get('connection') == 'close'
+            writer.write(('HTTP/1.1 %s %s\r\n'
+                          'Content-Type: application/json; charset=utf-8\r\n'
+                          'Content-Length: %s\r\n'
+                          'Connection: %s\r\n\r\n'
+                          % (status, STATUS[status], len(body),
+                             'close' if close else 'keep-alive')).encode())
+            writer.write(body)
+            await writer.drain()
+            if close:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(answer, host, port, socketPath):
+    '''
+    '''
+    def client(reader, writer):
+        return handle(reader, writer, answer)
+
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        server = await asyncio.start_unix_server(client, path=socketPath)
+        print('serving on %s' % socketPath, file=sys.stderr)
+    else:
+        server = await asyncio.start_server(client, host, port)
+        print('serving on http://%s:%s' % (host, port), file=sys.stderr)
+
+    async with server:
+        await server.serve_forever()
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, host, port, socketPath, cacheSize = parse_arguments()
+
+    # the annotation is loaded and indexed once at startup
+    index = AnnotationIndex(inFile)
+    answer = make_answer(index, cacheSize)
+
+    try:
+        asyncio.run(serve(answer, host, port, socketPath))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,576 @@
+#!/usr/bin/python3
+"""
+Helpers shared by the scripts that read the annotation
+
+TextGrid format specifications:
+http://www.fon.hum.uva.nl/praat/manual/TextGrid_file_formats.html
+"""
+import codecs
+import csv
+import gc
+import hashlib
+import json
+import mmap
+import os
+from contextlib import contextmanager
+import numpy as np
+
+
+# start of the segments/runs in the movie and their offsets
+SEGMENTS_OFFSETS = (
+    (0.00, 0.00),
+    (886.00, 0.00),
+    (1752.08, 0.08),  # third segment's start
+    (2612.16, 0.16),
+    (3572.20, 0.20),
+    (4480.28, 0.28),
+    (5342.36, 0.36),
+    (6410.44, 0.44),  # last segment's start
+    (7086.00, 0.00))  # movie's last time point
+
+# bytes at the beginning and the end of a file that are hashed to tell if a
+# cached snapshot still belongs to the file (together with size & mtime)
+HASHEDBYTES = 1 << 20
+
+# separates the strings of a string table (cannot occur in the annotation)
+SEPARATOR = '\x00'
+
+
+def time_stamp_to_msec(t_stamp='01:50:34:01'):
+    '''
+    Input:
+        time stamp (str) in format HH:MM:SS:Frame
+
+    Output:
+        time point in milliseconds (int)
+    '''
+    splitted_stamp = t_stamp.split(':')
+    milliseconds = (int(splitted_stamp[0]) * 60 * 60 * 1000) +\
+                   (int(splitted_stamp[1]) * 60 * 1000) +\
+                   (int(splitted_stamp[2]) * 1000) +\
+                   (int(splitted_stamp[3]) * 40)
+
+    return milliseconds
+
+
+def detect_encoding(inFile):
+    '''
+    our TextGrids are UTF-16 (as written by Praat), the ones of the
+    Montreal Forced Aligner are UTF-8
+    '''
+    with open(inFile, 'rb') as f:
+        start = f.read(4)
+
+    if start.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    elif start.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+
+    return encoding
+
+
+def parse_tiers(lines):
+    '''
+    parses the lines of a TextGrid (long text format) into a dict with the
+    tiers' names as keys and lists of [xmin, xmax, text] as values
+    '''
+    tiers = {}
+    inIntervals = False
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith('class = '):
+            inIntervals = False
+        elif line.startswith('name = '):
+            tierName = line.split('"')[1]
+            tiers[tierName] = []
+        elif line.startswith('intervals ['):
+            inIntervals = True
+        elif inIntervals and ' = ' in line:
+            key, value = line.split(' = ', 1)
+            if key == 'xmin':
+                xmin = float(value)
+            elif key == 'xmax':
+                xmax = float(value)
+            elif key == 'text':
+                # Praat escapes quotes in a text by doubling them
+                text = value.strip()[1:-1].replace('""', '"')
+                tiers[tierName].append([xmin, xmax, text])
+
+    return tiers
+
+
+def segment_encoding(inFile):
+    '''
+    returns the codec to decode a part of the file (i.e. without the BOM)
+    and the number of bytes per code unit
+    '''
+    with open(inFile, 'rb') as f:
+        start = f.read(4)
+
+    if start.startswith(codecs.BOM_UTF16_LE):
+        return 'utf-16-le', 2
+    elif start.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16-be', 2
+
+    return 'utf-8', 1
+
+
+def build_tier_index(inFile):
+    '''
+    returns name, first and last byte of every tier in the file; the file is
+    memory-mapped and only searched for the lines starting the tiers
+    '''
+    codec, unit = segment_encoding(inFile)
+    itemStart = 'item ['.encode(codec)
+    nameStart = 'name = "'.encode(codec)
+    quote = '"'.encode(codec)
+
+    starts = []
+    with open(inFile, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = mapped.find(itemStart)
+        while position != -1:
+            # skip the file header ('item []:') and matches that are not
+            # aligned with the code units (UTF-16)
+            nextChar = mapped[position + len(itemStart):
+                              position + len(itemStart) + unit]
+            if position % unit == 0 and nextChar != ']'.encode(codec):
+                nameAt = mapped.find(nameStart, position)
+                nameEnd = mapped.find(quote, nameAt + len(nameStart))
+                name = mapped[nameAt + len(nameStart):nameEnd].decode(codec)
+                starts.append([name, position])
+            position = mapped.find(itemStart, position + unit)
+
+        size = mapped.size()
+
+    index = []
+    for nr, (name, start) in enumerate(starts):
+        end = starts[nr + 1][1] if nr + 1 < len(starts) else size
+        index.append([name, start, end])
+
+    return index
+
+
+def tier_index(inFile):
+    '''
+    returns the tier index (see build_tier_index), which is cached in a
+    small file next to the TextGrid
+    '''
+    indexFile = inFile + '.tiers.json'
+    key = file_key(inFile)
+
+    if os.path.exists(indexFile):
+        with open(indexFile) as f:
+            cached = json.load(f)
+        if cached['key'] == key:
+            return cached['index']
+
+    index = build_tier_index(inFile)
+    try:
+        with open(indexFile, 'w') as f:
+            json.dump({'key': key, 'index': index}, f)
+    except OSError:
+        pass
+
+    return index
+
+
+def read_tiers(inFile, tierNames=None):
+    '''
+    reads a TextGrid and returns its tiers (see parse_tiers); if tierNames
+    are given, only these tiers are read and all others are skipped
+    '''
+    if tierNames is None:
+        with open(inFile, 'r', encoding=detect_encoding(inFile)) as f:
+            tiers = parse_tiers(f)
+
+        return tiers
+
+    codec = segment_encoding(inFile)[0]
+    tiers = {}
+    with open(inFile, 'rb') as f:
+        for name, start, end in tier_index(inFile):
+            if name not in tierNames:
+                continue
+            f.seek(start)
+            segment = f.read(end - start).decode(codec)
+            tiers.update(parse_tiers(segment.splitlines()))
+
+    return tiers
+
+
+def file_key(inFile):
+    '''
+    returns size, modification time and a hash of the file's first and last
+    megabyte; hashing the whole file would take as long as parsing it
+    '''
+    stat = os.stat(inFile)
+    digest = hashlib.md5()
+    with open(inFile, 'rb') as f:
+        digest.update(f.read(HASHEDBYTES))
+        if stat.st_size > HASHEDBYTES:
+            f.seek(max(HASHEDBYTES, stat.st_size - HASHEDBYTES))
+            digest.update(f.read())
+
+    return '%s;%s;%s' % (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+
+
+def snapshot_path(inFile):
+    '''
+    the snapshot is stored next to the file it was parsed from
+    '''
+    return inFile + '.snapshot.npz'
+
+
+def encode_strings(strings):
+    '''
+    returns a string table: the unique strings as one byte array, and the
+    index of every string into the table
+    '''
+    table = {}
+    indices = np.array([table.setdefault(string, len(table))
+                        for string in strings], dtype=np.int32)
+    blob = SEPARATOR.join(table).encode('utf-8')
+
+    return np.frombuffer(blob, dtype=np.uint8), indices
+
+
+def decode_strings(blob, indices):
+    '''
+    returns the strings of a string table (see encode_strings)
+    '''
+    table = np.array(blob.tobytes().decode('utf-8').split(SEPARATOR),
+                     dtype=object)
+
+    return table[indices].tolist()
+
+
+@contextmanager
+def no_garbage_collection():
+    '''
+    the cyclic garbage collector runs over and over while millions of lists
+    are created, which would take longer than creating them
+    '''
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if wasEnabled:
+            gc.enable()
+
+
+def load_snapshot(inFile):
+    '''
+    returns the arrays of the file's snapshot, or None if there is no
+    snapshot or it does not belong to the file's current state
+    '''
+    path = snapshot_path(inFile)
+    if not os.path.exists(path):
+        return None
+
+    snapshot = np.load(path)
+    if decode_strings(snapshot['key'], [0])[0] != file_key(inFile):
+        return None
+
+    return snapshot
+
+
+def save_snapshot(inFile, arrays):
+    '''
+    writes the arrays as snapshot of the file; a directory without write
+    permission just means there is no snapshot
+    '''
+    arrays['key'] = encode_strings([file_key(inFile)])[0]
+    try:
+        with open(snapshot_path(inFile), 'wb') as f:
+            np.savez(f, **arrays)
+    except OSError:
+        pass
+
+    return None
+
+
+def tier_to_arrays(nr, intervals):
+    '''
+    turns the intervals of the file's nr-th tier into arrays: the onsets,
+    the offsets and a string table of the texts
+    '''
+    arrays = {}
+    arrays['xmin%s' % nr] = np.array([x[0] for x in intervals],
+                                     dtype=np.float64)
+    arrays['xmax%s' % nr] = np.array([x[1] for x in intervals],
+                                     dtype=np.float64)
+    blob, indices = encode_strings([x[2] for x in intervals])
+    arrays['strings%s' % nr] = blob
+    arrays['text%s' % nr] = indices
+
+    return arrays
+
+
+def arrays_to_tier(arrays, nr):
+    '''
+    turns the arrays of the file's nr-th tier back into intervals
+    '''
+    with no_garbage_collection():
+        texts = decode_strings(arrays['strings%s' % nr],
+                               arrays['text%s' % nr])
+        intervals = [list(interval) for interval in
+                     zip(arrays['xmin%s' % nr].tolist(),
+                         arrays['xmax%s' % nr].tolist(), texts)]
+
+    return intervals
+
+
+def cached_tier_arrays(inFile, tierNames=None):
+    '''
+    returns the names of all tiers in the file, the positions of the
+    requested tiers, and the snapshot's arrays; tiers that are not in the
+    snapshot yet are parsed and added to it
+    '''
+    names = [entry[0] for entry in tier_index(inFile)]
+    if tierNames is None:
+        tierNames = names
+    positions = [nr for nr, name in enumerate(names) if name in tierNames]
+
+    snapshot = load_snapshot(inFile)
+    # snapshots of .tsv files have no tiers
+    if snapshot is None or 'cached' not in snapshot.files:
+        snapshot = None
+        cached = set()
+    else:
+        cached = set(snapshot['cached'].tolist())
+    missing = [nr for nr in positions if nr not in cached]
+
+    if missing:
+        parsed = read_tiers(inFile, [names[nr] for nr in missing])
+        # keep the tiers of the old snapshot
+        arrays = {}
+        if snapshot is not None:
+            arrays.update({key: snapshot[key] for key in snapshot.files
+                           if key != 'key'})
+        for nr in missing:
+            arrays.update(tier_to_arrays(nr, parsed[names[nr]]))
+        arrays['cached'] = np.array(sorted(cached.union(missing)))
+        save_snapshot(inFile, arrays)
+    else:
+        arrays = snapshot
+
+    return names, positions, arrays
+
+
+def read_tiers_cached(inFile, tierNames=None):
+    '''
+    like read_tiers, but the parsed tiers are stored in a binary snapshot
+    next to the TextGrid and reused as long as the TextGrid does not change
+    '''
+    names, positions, arrays = cached_tier_arrays(inFile, tierNames)
+    tiers = {names[nr]: arrays_to_tier(arrays, nr) for nr in positions}
+
+    return tiers
+
+
+def read_tier_arrays(inFile, tierNames=None):
+    '''
+    like read_tiers_cached, but every tier is returned as arrays of the
+    onsets, the offsets and the texts (dtype object)
+    '''
+    names, positions, arrays = cached_tier_arrays(inFile, tierNames)
+
+    tiers = {}
+    for nr in positions:
+        table = arrays['strings%s' % nr].tobytes().decode('utf-8')
+        table = np.array(table.split(SEPARATOR), dtype=object)
+        tiers[names[nr]] = (arrays['xmin%s' % nr], arrays['xmax%s' % nr],
+                            table[arrays['text%s' % nr]])
+
+    return tiers
+
+
+def read_tsv_cached(inFile):
+    '''
+    returns the header and the rows of a .tsv; like read_tiers_cached, the
+    parsed rows are stored in (and later read from) a binary snapshot
+    '''
+    snapshot = load_snapshot(inFile)
+    if snapshot is not None:
+        header = decode_strings(snapshot['header_strings'],
+                                snapshot['header'])
+        with no_garbage_collection():
+            cells = decode_strings(snapshot['strings'], snapshot['cells'])
+            ends = snapshot['ends'].tolist()
+            starts = [0] + ends[:-1]
+            content = [cells[start:end] for start, end in zip(starts, ends)]
+
+        return header, content
+
+    with open(inFile) as csvfile:
+        reader = csv.reader(csvfile, delimiter='\t')
+        header = next(reader, None)
+        content = [x for x in reader]
+
+    # rows differ in length, so all cells are stored in one array
+    # together with the index where each row ends
+    arrays = {}
+    arrays['header_strings'], arrays['header'] = encode_strings(header)
+    arrays['ends'] = np.cumsum([len(row) for row in content],
+                               dtype=np.int64)
+    arrays['strings'], arrays['cells'] = encode_strings(
+        [cell for row in content for cell in row])
+    save_snapshot(inFile, arrays)
+
+    return header, content
+
+
+def get_runs(onsets):
+    '''
+    returns the run/segment (1-8) of every onset (in seconds)
+    '''
+    starts = np.array([start for start, offset in SEGMENTS_OFFSETS])
+
+    return np.searchsorted(starts, np.asarray(onsets, dtype=np.float64),
+                           side='right')
+
+
+def read_word_columns(inFile):
+    '''
+    returns the rows of words (i.e. no sentences or phonemes) of a BIDS .tsv
+    as dict of columns (arrays); onset and duration are floats, and the
+    columns 'sentence_index' (-1 for words outside of sentences) and 'run'
+    are integers
+    '''
+    header, content = read_tsv_cached(inFile)
+
+    # .tsv files without the column sentence_index list every sentence
+    # right before its words
+    sentIndices = []
+    sentIndex = -1
+    rows = []
+    for line in content:
+        if line[4] == 'SENTENCE':
+            sentIndex += 1
+        elif line[4] != 'PHONEME':
+            rows.append(line + [''] * (len(header) - len(line)))
+            sentIndices.append(sentIndex)
+
+    columns = {}
+    for nr, column in enumerate(header):
+        columns[column] = np.array([row[nr] for row in rows], dtype=object)
+
+    columns['onset'] = columns['onset'].astype(np.float64)
+    columns['duration'] = columns['duration'].astype(np.float64)
+    if 'sentence_index' in header:
+        cells = columns['sentence_index']
+        cells[cells == ''] = -1
+        columns['sentence_index'] = cells.astype(np.int64)
+    else:
+        columns['sentence_index'] = np.array(sentIndices, dtype=np.int64)
+    columns['run'] = get_runs(columns['onset'])
+
+    return columns
+
+
+def fill_gaps(intervals, xmin, xmax):
+    '''
+    returns the sorted, non-overlapping intervals with empty intervals
+    inserted between them, so that they tile the whole range from xmin to xmax
+    (as TextGrid interval tiers require)
+    '''
+    filled = []
+    lastEnd = xmin
+    for start, end, text in intervals:
+        if start > lastEnd:
+            filled.append([lastEnd, start, ''])
+        filled.append([start, end, text])
+        lastEnd = end
+
+    if lastEnd < xmax:
+        filled.append([lastEnd, xmax, ''])
+
+    return filled
+
+
+def format_time(seconds):
+    '''
+    rounds to milliseconds (as in our TextGrids) and drops trailing zeros
+    '''
+    return str(round(float(seconds), 3))
+
+
+def textgrid_lines(tiers, xmin, xmax):
+    '''
+    yields the lines of a TextGrid (long text format); tiers is a list of
+    (name, intervals) and the intervals of every tier need to be filled
+    '''
+    yield 'File type = "ooTextFile"\n'
+    yield 'Object class = "TextGrid"\n'
+    yield '\n'
+    yield 'xmin = %s\n' % format_time(xmin)
+    yield 'xmax = %s\n' % format_time(xmax)
+    yield 'tiers? <exists>\n'
+    yield 'size = %s\n' % len(tiers)
+    yield 'item []:\n'
+
+    for nr, (name, intervals) in enumerate(tiers, 1):
+        yield '    item [%s]:\n' % nr
+        yield '        class = "IntervalTier"\n'
+        yield '        name = "%s"\n' % name
+        yield '        xmin = %s\n' % format_time(xmin)
+        yield '        xmax = %s\n' % format_time(xmax)
+        yield '        intervals: size = %s\n' % len(intervals)
+
+        for i, (start, end, text) in enumerate(intervals, 1):
+            yield '        intervals [%s]:\n' % i
+            yield '            xmin = %s\n' % format_time(start)
+            yield '            xmax = %s\n' % format_time(end)
+            yield '            text = "%s"\n' % text.replace('"', '""')
+
+
+def write_textgrid(outFile, tiers, xmin, xmax, encoding='utf-16'):
+    '''
+    writes the tiers (list of (name, intervals)) into a TextGrid
+    '''
+    with open(outFile, 'w', encoding=encoding) as textGridFile:
+        textGridFile.writelines(textgrid_lines(tiers, xmin, xmax))
+
+    return None
+
+
+def append_tiers(inFile, outFile, tiers):
+    '''
+    copies a TextGrid line by line and appends the tiers (list of
+    (name, intervals)); only the number of tiers in the header is changed
+    '''
+    encoding = detect_encoding(inFile)
+    with open(inFile, 'r', encoding=encoding) as f, \
+            open(outFile, 'w', encoding=encoding) as out:
+        nrOfTiers = None
+        for line in f:
+            stripped = line.strip()
+            if nrOfTiers is None:
+                if stripped.startswith('xmin = '):
+                    xmin = float(stripped.split(' = ')[1])
+                elif stripped.startswith('xmax = '):
+                    xmax = float(stripped.split(' = ')[1])
+                elif stripped.startswith('size = '):
+                    nrOfTiers = int(stripped.split(' = ')[1])
+                    line = line.replace(str(nrOfTiers),
+                                        str(nrOfTiers + len(tiers)))
+            out.write(line)
+        if not line.endswith('\n'):
+            out.write('\n')
+
+        # reuse the writer for the tiers but skip its file header
+        newLines = textgrid_lines(tiers, xmin, xmax)
+        for nr, line in enumerate(newLines):
+            if nr < 8:
+                continue
+            elif line.startswith('    item ['):
+                tierNr = int(line.split('[')[1].split(']')[0])
+                line = '    item [%s]:\n' % (nrOfTiers + tierNr)
+            out.write(line)
+
+    return None
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+"""
+Benchmark of the quantized storage of the word vectors (see word_vectors.py)
+
+For every data type, the script reports the memory and disk footprint of the
+vector table and of the token-level design matrix an encoding model would
+load, the time to dequantize the table chunk by chunk, the reconstruction
+error, and the effect on a ridge regression: simulated responses are
+predicted from the original and from the dequantized vectors, and the
+cross-validated R^2 of both fits is compared.
+
+The original vectors are either the vectors written inline into the vector
+column (annotations created before the vector table) or a table exported as
+float32; a table that is already quantized is refused.
+
+Call from the root of the dataset, e.g.:
+python3 code/benchmark-vector-quantization.py \
+    -i annotation/fg_rscut_ad_ger_speech_tagged.tsv
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from word_vectors import (DTYPES, NOVECTOR, dequantize, load_vector_table,
+                          quantize, resolve_vectors)
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark footprint and accuracy of quantized vectors'
+    )
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech_tagged.tsv',
+                        help='the annotation (.tsv) whose vectors to use')
+
+    parser.add_argument('--targets',
+                        type=int,
+                        default=100,
+                        help='number of simulated responses (e.g. voxels)')
+
+    parser.add_argument('--alpha',
+                        type=float,
+                        default=10.0,
+                        help='regularization of the ridge regression')
+
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='seed of the random number generator')
+
+    args = parser.parse_args()
+
+    return args.i, args.targets, args.alpha, args.seed
+
+
+def read_vector_cells(inFile):
+    '''
+    returns the cells of the column 'vector' of all rows that contain a word
+    '''
+    with open(inFile) as csvfile:
+        content = csv.reader(csvfile, delimiter='\t')
+        header = next(content, None)
+        column = header.index('vector')
+        cells = [line[column] for line in content
+                 if len(line) > column and line[column] != '']
+
+    return cells
+
+
+def reference_table(inFile, cells):
+    '''
+    returns the float32 table the quantized ones are compared to, and the
+    cells as row indices into it; annotations created before the vector
+    table hold the vectors as comma-separated strings, from which the table
+    is built; a stored table has to be float32, since a quantized one cannot
+    be the reference of its own quantization
+    '''
+    if any(',' in cell for cell in cells):
+        inline = sorted(set(cell for cell in cells if ',' in cell))
+        rowOf = {cell: row for row, cell in enumerate(inline)}
+        table = np.array([cell.split(',') for cell in inline],
+                         dtype=np.float32)
+        cells = [str(rowOf[cell]) if cell in rowOf else NOVECTOR
+                 for cell in cells]
+        return table, cells
+
+    stored = load_vector_table(inFile)
+    if stored.dtype != np.float32:
+        sys.exit('the vector table of %s is stored as %s; export it as '
+                 'float32 (the tagger\'s --vector-dtype) to benchmark it'
+                 % (inFile, stored.dtype))
+
+    return np.array(stored), cells
+
+
+def disk_bytes(table, scaleOffset):
+    '''
+    returns the size of the table (and its scales) saved as .npy
+    '''
+    with tempfile.TemporaryDirectory() as tmpDir:
+        size = 0
+        for name, array in [('table', table), ('scale', scaleOffset)]:
+            if array is None:
+                continue
+            path = os.path.join(tmpDir, name + '.npy')
+            np.save(path, array)
+            size += os.path.getsize(path)
+
+    return size
+
+
+def ridge_r2(X, Y, alpha, nTrain):
+    '''
+    fits a ridge regression on the first nTrain rows and returns the mean R^2
+    over all targets in the remaining rows
+    '''
+    X = X.astype(np.float64)
+    xTrain, xTest = X[:nTrain], X[nTrain:]
+    yTrain, yTest = Y[:nTrain], Y[nTrain:]
+
+    gram = xTrain.T @ xTrain + alpha * np.eye(X.shape[1])
+    weights = np.linalg.solve(gram, xTrain.T @ yTrain)
+
+    residuals = ((yTest - xTest @ weights) ** 2).sum(axis=0)
+    total = ((yTest - yTest.mean(axis=0)) ** 2).sum(axis=0)
+
+    return (1 - residuals / total).mean()
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, nTargets, alpha, seed = parse_arguments()
+    rng = np.random.default_rng(seed)
+
+    # the original float32 vectors are the reference
+    table, cells = reference_table(inFile, read_vector_cells(inFile))
+    X = resolve_vectors(table, cells)
+
+    # simulate responses of an encoding model with known weights
+    weights = rng.standard_normal((X.shape[1], nTargets))
+    Y = X @ weights
+    Y += rng.standard_normal(Y.shape) * Y.std(axis=0)
+    nTrain = int(len(X) * 0.8)
+    refR2 = ridge_r2(X, Y, alpha, nTrain)
+
+    print('types: %s\ttokens: %s\tdimensions: %s'
+          % (table.shape[0], X.shape[0], table.shape[1]))
+    header = ['dtype', 'table MB', 'disk MB', 'tokens MB', 'dequant ms',
+              'RMSE', 'max error', 'cosine', 'R2', 'R2 diff']
+    print('\t'.join(header))
+
+    for dtype in DTYPES:
+        quantized, scaleOffset = quantize(table, dtype)
+
+        # dequantize chunk by chunk as the loader does
+        start = time.perf_counter()
+        restored = np.vstack([dequantize(quantized[i:i + 4096], scaleOffset)
+                              for i in range(0, len(quantized), 4096)])
+        dequantTime = (time.perf_counter() - start) * 1000
+
+        error = restored - table
+        norms = (np.linalg.norm(table, axis=1) *
+                 np.linalg.norm(restored, axis=1))
+        norms[norms == 0] = 1
+        cosine = ((table * restored).sum(axis=1) / norms).mean()
+
+        r2 = ridge_r2(resolve_vectors(restored, cells), Y, alpha, nTrain)
+
+        line = [dtype,
+                '%.2f' % (quantized.nbytes / 1e6),
+                '%.2f' % (disk_bytes(quantized, scaleOffset) / 1e6),
+                '%.2f' % (X.shape[0] * X.shape[1] * quantized.itemsize / 1e6),
+                '%.1f' % dequantTime,
+                '%.2e' % np.sqrt((error ** 2).mean()),
+                '%.2e' % np.absolute(error).max(),
+                '%.6f' % cosine,
+                '%.4f' % r2,
+                '%+.2e' % (r2 - refR2)]
+        print('\t'.join(line))
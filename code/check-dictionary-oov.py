@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+"""
+Reports words that are missing in the pronunciation dictionary
+(out-of-vocabulary, OOV) before the Montreal Forced Aligner is run
+
+The dictionary is loaded into a hash index that is cached as binary file next
+to the dictionary (<dictionary>.idx); the cache is rebuilt when size or
+modification time of the dictionary change.
+
+Input are TextGrids (tier 'words' or 'sentence') or the manual annotation
+(speech-vocal.csv); each OOV is reported with its on- and offset.
+
+Call from the root of the dataset, e.g.:
+python3 code/check-dictionary-oov.py -i annotation/speech-vocal.csv
+"""
+import argparse
+import csv
+import os
+import pickle
+import sys
+from annotation_io import read_tiers, time_stamp_to_msec
+
+
+# characters the aligner strips from the beginning & end of words
+PUNCTUATION = '.,;:!?"\'()[]{}<>«»„“”‚‘’–—…'
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Report words missing in the pronunciation dictionary'
+    )
+    parser.add_argument('-i',
+                        nargs='+',
+                        default=['bin/montreal-data/corpus/'
+                                 'speech-vocal.TextGrid'],
+                        help='TextGrid(s) and/or speech-vocal.csv to check')
+
+    parser.add_argument('-d',
+                        default='bin/montreal-data/dictionary/de.dict',
+                        help='the pronunciation dictionary')
+
+    parser.add_argument('-t',
+                        default='sentence',
+                        help='the TextGrid tier to check (words or sentence)')
+
+    parser.add_argument('-o',
+                        required=False,
+                        default=None,
+                        help='the .tsv to write the OOVs to (default: stdout)')
+
+    args = parser.parse_args()
+
+    return args.i, args.d, args.t, args.o
+
+
+def read_dictionary(dictFile):
+    '''
+    returns the set of all words in the dictionary; every line contains the
+    word followed by its phones
+    '''
+    with open(dictFile, encoding='utf-8') as f:
+        words = frozenset(line.split(None, 1)[0].lower()
+                          for line in f if line.strip())
+
+    return words
+
+
+def load_index(dictFile):
+    '''
+    returns the dictionary's words from the cached index, or builds (and
+    caches) the index if it is missing, out of date or unreadable; a
+    directory without write permission just means there is no index
+    '''
+    cacheFile = dictFile + '.idx'
+    stat = os.stat(dictFile)
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    try:
+        with open(cacheFile, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['key'] == key:
+            return cached['words']
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError):
+        pass
+
+    words = read_dictionary(dictFile)
+    # written to a temporary file first, so an interrupted run leaves no
+    # truncated index
+    tmpFile = '%s.%s.tmp' % (cacheFile, os.getpid())
+    try:
+        with open(tmpFile, 'wb') as f:
+            pickle.dump({'key': key, 'words': words}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpFile, cacheFile)
+    except OSError:
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+
+    return words
+
+
+def normalize(token):
+    '''
+    '''
+    return token.lower().strip(PUNCTUATION)
+
+
+def is_known(word, index):
+    '''
+    '''
+    if word in index:
+        return True
+    # the aligner looks up the parts of hyphenated compounds separately
+    elif '-' in word:
+        parts = [part for part in word.split('-') if part]
+        return len(parts) > 0 and all(part in index for part in parts)
+
+    return False
+
+
+def textgrid_tokens(inFile, tierName):
+    '''
+    yields on- and offset, token and the interval's text of a TextGrid tier
+    '''
+    tiers = read_tiers(inFile)
+    for xmin, xmax, text in tiers[tierName]:
+        for token in text.split():
+            yield xmin, xmax, token, text
+
+
+def csv_tokens(inFile):
+    '''
+    yields on- and offset, token and the row's text of speech-vocal.csv;
+    rows are filtered like in convert_speech-vocal-csv2textgrid.py
+    '''
+    with open(inFile) as csvFile:
+        data = csv.reader(csvFile)
+        # skip the file header
+        next(data, None)
+
+        for row in data:
+            # filter rows with unknown timing
+            if '#' in row[0] or '#' in row[1]:
+                continue
+            # filter rows with Soundtracks or (longer) songs
+            if 'OST' in row[2] or 'song' in row[4]:
+                continue
+
+            start = time_stamp_to_msec(row[0]) / 1000.0
+            end = time_stamp_to_msec(row[1]) / 1000.0
+            for token in row[7].split():
+                yield start, end, token, row[7]
+
+
+# main programm
+if __name__ == "__main__":
+    inFiles, dictFile, tierName, outFile = parse_arguments()
+
+    index = load_index(dictFile)
+
+    oovs = []
+    nrOfTokens = 0
+    for inFile in inFiles:
+        if inFile.endswith('.csv'):
+            tokens = csv_tokens(inFile)
+        else:
+            tokens = textgrid_tokens(inFile, tierName)
+
+        for start, end, token, text in tokens:
+            word = normalize(token)
+            # tokens that are only punctuation
+            if word == '':
+                continue
+            nrOfTokens += 1
+            if not is_known(word, index):
+                oovs.append([inFile, start, end, word, text])
+
+    if outFile is None:
+        tsvFile = sys.stdout
+    else:
+        tsvFile = open(outFile, 'w')
+    writer = csv.writer(tsvFile, delimiter='\t')
+    writer.writerow(['file', 'onset', 'offset', 'word', 'text'])
+    writer.writerows(oovs)
+    if outFile is not None:
+        tsvFile.close()
+
+    nrOfTypes = len(set(oov[3] for oov in oovs))
+    print('%s of %s tokens (%s types) are not in %s'
+          % (len(oovs), nrOfTokens, nrOfTypes, dictFile), file=sys.stderr)
+
+    # a non-zero exit status lets pipelines stop before the alignment
+    sys.exit(1 if oovs else 0)
@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+"""
+Checks the peak memory of the stages of the pipeline against ceilings
+
+A synthetic corpus (a TextGrid as the manually revised one and a tagged
+version of it) that is several times larger than the movie's annotation is
+written to a temporary directory. The scripts are run on it with the option
+--memory-report (see memory_profile.py), and the traced peak of every stage
+and the peak resident memory (RSS) of every script are compared to the
+ceilings in BUDGETS (MB). The exit status is 1 if any ceiling is exceeded, so
+the check can gate changes of the scripts.
+
+The tagger needs spaCy's German model and is only run with --tagger.
+
+Call from the root of the dataset, e.g.:
+python3 code/check-memory-budget.py --budget textgrid2bids:rows=400
+"""
+import argparse
+import json
+import os
+import os.path
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from annotation_io import fill_gaps, write_textgrid
+
+
+# ceilings (MB) of the traced peak of a stage ('script:stage') and of the
+# peak resident memory of a script ('script') for the default corpus size;
+# the traced peak of a stage includes what earlier stages still hold
+BUDGETS = {
+    'add_part-of-speech-tagging2textgrid': 2500,
+    'add_part-of-speech-tagging2textgrid:read': 300,
+    'add_part-of-speech-tagging2textgrid:analyze': 1500,
+    'add_part-of-speech-tagging2textgrid:write': 600,
+    'add_part-of-speech-tagging2textgrid:vectors': 600,
+    'textgrid2bids': 1100,
+    'textgrid2bids:read': 300,
+    'textgrid2bids:link': 250,
+    'textgrid2bids:rows': 350,
+    'textgrid2bids:write': 350,
+    'descriptive-statistics': 800,
+    'descriptive-statistics:count': 350,
+    'descriptive-statistics:latex': 250,
+}
+
+# the synthetic corpus
+PERSONS = ['FORREST', 'JENNY', 'ERZAEHLER', 'DAN', 'BUBBA', 'MRS. GUMP']
+WORDS = ['und', 'ich', 'Forrest', 'Haus', 'Mama', 'sagte', 'immer', 'Leben',
+         'ist', 'wie', 'eine', 'Schachtel', 'Pralinen', 'Jenny', 'lief']
+POS = ['NOUN', 'VERB', 'PROPN', 'PRON', 'CCONJ', 'ADV', 'DET']
+PHONES = ['a', 'b', 'd', 'e', 'f', 'h', 'i', 'l', 'm', 'n', 'S', 't', 'u']
+
+# length of the synthetic words and phonemes (in seconds)
+WORDLEN = 0.4
+PHONELEN = 0.1
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Check the peak memory of the pipeline\'s stages'
+    )
+    parser.add_argument('--sentences',
+                        type=int,
+                        default=6000,
+                        help='number of sentences of the synthetic corpus')
+
+    parser.add_argument('--words',
+                        type=int,
+                        default=8,
+                        help='number of words per sentence')
+
+    parser.add_argument('--budget',
+                        action='append',
+                        default=[],
+                        metavar='STAGE=MB',
+                        help='override a ceiling, e.g. textgrid2bids:rows=400'
+                        ' (can be given several times)')
+
+    parser.add_argument('--tagger',
+                        action='store_true',
+                        help='also run the tagger (needs spaCy\'s model)')
+
+    parser.add_argument('-o',
+                        default=None,
+                        help='the .json to write all reports to')
+
+    parser.add_argument('--keep',
+                        default=None,
+                        help='write the corpus into this directory and keep '
+                        'it (default: a temporary directory)')
+
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for budget in args.budget:
+        stage, megabytes = budget.split('=')
+        budgets[stage] = float(megabytes)
+
+    return (args.sentences, args.words, budgets, args.tagger, args.o,
+            args.keep)
+
+
+def synthetic_corpus(nrOfSentences, nrOfWords, seed=0):
+    '''
+    returns the tiers of the revised TextGrid and the tagging tiers, and the
+    end of the TextGrid (in seconds)
+    '''
+    rng = random.Random(seed)
+    tiers = {name: [] for name in ['person', 'sentence', 'words', 'descr',
+                                   'phones', 'pos', 'tag', 'dep', 'lemma',
+                                   'stop', 'vector']}
+    start = 0.0
+    for nr in range(nrOfSentences):
+        person = rng.choice(PERSONS)
+        sentWords = [rng.choice(WORDS) for word in range(nrOfWords)]
+        end = round(start + nrOfWords * WORDLEN, 3)
+        tiers['person'].append([start, end, person])
+        tiers['sentence'].append([start, end, ' '.join(sentWords)])
+
+        for wordNr, word in enumerate(sentWords):
+            wStart = round(start + wordNr * WORDLEN, 3)
+            wEnd = round(wStart + WORDLEN, 3)
+            tiers['words'].append([wStart, wEnd, word])
+            tiers['pos'].append([wStart, wEnd, rng.choice(POS)])
+            tiers['tag'].append([wStart, wEnd, 'NN'])
+            tiers['dep'].append([wStart, wEnd, 'nk;%s;-' % word.upper()])
+            tiers['lemma'].append([wStart, wEnd, word.lower()])
+            tiers['stop'].append([wStart, wEnd, str(rng.random() < 0.5)])
+            tiers['vector'].append([wStart, wEnd,
+                                    str(WORDS.index(word))])
+            if word == 'Haus':
+                tiers['descr'].append([wStart, wEnd, 'Haus'])
+
+            for phoneNr in range(int(WORDLEN / PHONELEN)):
+                pStart = round(wStart + phoneNr * PHONELEN, 3)
+                tiers['phones'].append([pStart, round(pStart + PHONELEN, 3),
+                                        rng.choice(PHONES)])
+
+        # a pause between the sentences
+        start = round(end + 0.5, 3)
+
+    return tiers, start
+
+
+def write_corpus(outDir, nrOfSentences, nrOfWords):
+    '''
+    writes the synthetic TextGrids and returns their paths
+    '''
+    tiers, xmax = synthetic_corpus(nrOfSentences, nrOfWords)
+    revisedFile = os.path.join(outDir, 'synthetic_speech.TextGrid')
+    taggedFile = os.path.join(outDir, 'synthetic_speech_tagged.TextGrid')
+
+    revised = ['person', 'sentence', 'words', 'descr', 'phones']
+    tagged = ['person', 'sentence', 'words', 'pos', 'tag', 'dep', 'lemma',
+              'stop', 'descr', 'vector', 'phones']
+    for outFile, names in [(revisedFile, revised), (taggedFile, tagged)]:
+        write_textgrid(outFile,
+                       [(name, fill_gaps(tiers[name], 0, xmax))
+                        for name in names], 0, xmax)
+
+    return revisedFile, taggedFile
+
+
+def run_stage(script, arguments, reportFile):
+    '''
+    runs a script of the pipeline with memory tracing and returns its report
+    '''
+    codeDir = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(codeDir, script + '.py')]
+    command.extend(arguments + ['--memory-report', reportFile])
+
+    # only the peaks are needed, not the allocation sites
+    env = dict(os.environ, MEMORY_PROFILE_SITES='0')
+    completed = subprocess.run(command, stdout=subprocess.DEVNULL, env=env)
+    if completed.returncode != 0:
+        sys.exit('%s failed with exit status %s' % (script,
+                                                      completed.returncode))
+
+    with open(reportFile) as f:
+        return json.load(f)
+
+
+def exceeded(script, report, budgets):
+    '''
+    returns the stages (and the script) whose peak exceeds their ceiling
+    '''
+    found = []
+    if report['rss_peak_mb'] > budgets.get(script, float('inf')):
+        found.append([script, report['rss_peak_mb'], budgets[script]])
+
+    for stage in report['stages']:
+        key = '%s:%s' % (script, stage['stage'])
+        if stage['peak_mb'] > budgets.get(key, float('inf')):
+            found.append([key, stage['peak_mb'], budgets[key]])
+
+    return found
+
+
+# main programm
+if __name__ == "__main__":
+    nrOfSentences, nrOfWords, budgets, tagger, outFile, keepDir = \
+        parse_arguments()
+
+    workDir = keepDir if keepDir is not None else tempfile.mkdtemp()
+    os.makedirs(workDir, exist_ok=True)
+
+    revisedFile, taggedFile = write_corpus(workDir, nrOfSentences, nrOfWords)
+    tsvFile = taggedFile.replace('.TextGrid', '.tsv')
+
+    stages = []
+    if tagger:
+        stages.append(('add_part-of-speech-tagging2textgrid', [revisedFile]))
+    stages.append(('textgrid2bids', [taggedFile]))
+    stages.append(('descriptive-statistics',
+                   ['-i', tsvFile, '-o', os.path.join(workDir, 'stats.tex')]))
+
+    reports = {}
+    failed = []
+    for script, arguments in stages:
+        reportFile = os.path.join(workDir, script + '_memory.json')
+        reports[script] = run_stage(script, arguments, reportFile)
+        failed.extend(exceeded(script, reports[script], budgets))
+
+    if keepDir is None:
+        shutil.rmtree(workDir)
+
+    print('stage\tpeak MB\tceiling MB')
+    for script, report in reports.items():
+        print('%s\t%s\t%s' % (script, report['rss_peak_mb'],
+                              budgets.get(script, '-')))
+        for stage in report['stages']:
+            key = '%s:%s' % (script, stage['stage'])
+            print('%s\t%s\t%s' % (key, stage['peak_mb'],
+                                  budgets.get(key, '-')))
+
+    if outFile is not None:
+        with open(outFile, 'w') as f:
+            json.dump({'budgets': budgets, 'reports': reports,
+                       'exceeded': failed}, f, indent=2)
+
+    for key, peak, ceiling in failed:
+        print('%s exceeds its ceiling: %s MB > %s MB' % (key, peak, ceiling),
+              file=sys.stderr)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+"""
+Checks the consistency of the tiers of a (tagged) TextGrid
+
+All tiers are loaded as arrays and every check is a vectorized comparison of
+these arrays. Checked are:
+    - gaps and overlaps between the consecutive intervals of every tier
+    - intervals without (or with negative) duration
+    - sentences without a person speaking them
+    - words outside of any sentence, and sentences without any word
+    - phonemes outside of any word
+    - tiers of the tagging whose number or boundaries of intervals differ from
+      the tier 'words'
+    - words that did not get a part-of-speech tag
+
+The report is written as JSON; the exit status is 1 if any check failed, so
+the checker can gate every run of the pipeline.
+
+Call from the root of the dataset, e.g.:
+python3 code/check-textgrid-consistency.py \
+    -i annotation/fg_rscut_ad_ger_speech_tagged.TextGrid
+"""
+import argparse
+import json
+import sys
+import numpy as np
+from annotation_io import read_tier_arrays
+
+
+# tolerance (in seconds) when comparing boundaries
+EPSILON = 0.0005
+
+# tiers that are not aligned with the tier 'words'
+UNALIGNED = ['person', 'sentence', 'words', 'descr', 'phones',
+             'sentence_rms', 'sentence_pitch']
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Check the consistency of the tiers of a TextGrid'
+    )
+    parser.add_argument('-i',
+                        default='annotation/'
+                        'fg_rscut_ad_ger_speech_tagged.TextGrid',
+                        help='the TextGrid to check')
+
+    parser.add_argument('-o',
+                        required=False,
+                        default=None,
+                        help='the .json to write the report to '
+                        '(default: stdout)')
+
+    parser.add_argument('--examples',
+                        type=int,
+                        default=10,
+                        help='number of examples listed per failed check')
+
+    args = parser.parse_args()
+
+    return args.i, args.o, args.examples
+
+
+def has_text(texts):
+    '''
+    returns a mask of the texts that are not empty (or only whitespace);
+    the check is done once per unique text
+    '''
+    unique, inverse = np.unique(texts.astype(str), return_inverse=True)
+    uniqueHasText = np.char.strip(unique) != ''
+
+    return uniqueHasText[inverse.reshape(-1)]
+
+
+def containing(xmin, xmax, parent):
+    '''
+    returns for every interval the index of the parent tier's interval with
+    text that contains it (-1 if there is none)
+    '''
+    pMin, pMax, pTexts, pHasText = parent
+    index = np.searchsorted(pMin, xmin + EPSILON, side='right') - 1
+    clipped = np.clip(index, 0, None)
+
+    inside = ((index >= 0) & (xmax <= pMax[clipped] + EPSILON) &
+              pHasText[clipped])
+
+    return np.where(inside, index, -1)
+
+
+def result(mask, xmin, xmax, texts, nrOfExamples):
+    '''
+    returns the number of intervals where mask is true and some examples
+    '''
+    found = np.flatnonzero(mask)
+    examples = [{'interval': int(i) + 1,
+                 'xmin': float(xmin[i]),
+                 'xmax': float(xmax[i]),
+                 'text': str(texts[i])}
+                for i in found[:nrOfExamples]]
+
+    return {'count': int(len(found)), 'examples': examples}
+
+
+def check_tier(arrays, nrOfExamples):
+    '''
+    checks the intervals of a single tier
+    '''
+    xmin, xmax, texts, hasText = arrays
+    checks = {}
+
+    # the next interval should start where the current one ends
+    step = xmin[1:] - xmax[:-1]
+    checks['gaps'] = result(step > EPSILON,
+                            xmax[:-1], xmin[1:], texts[:-1], nrOfExamples)
+    checks['overlaps'] = result(step < -EPSILON,
+                                xmin[1:], xmax[:-1], texts[1:], nrOfExamples)
+    checks['durations'] = result(xmax - xmin <= 0,
+                                 xmin, xmax, texts, nrOfExamples)
+
+    return checks
+
+
+def check_alignment(arrays, words, nrOfExamples):
+    '''
+    checks that a tier of the tagging has the intervals of the tier 'words'
+    '''
+    xmin, xmax, texts, hasText = arrays
+    wMin, wMax, wTexts, wHasText = words
+
+    if len(xmin) != len(wMin):
+        return {'count': 1,
+                'examples': [{'intervals': int(len(xmin)),
+                              'words': int(len(wMin))}]}
+
+    differs = ((np.absolute(xmin - wMin) > EPSILON) |
+               (np.absolute(xmax - wMax) > EPSILON))
+
+    return result(differs, xmin, xmax, texts, nrOfExamples)
+
+
+def check_textgrid(tiers, nrOfExamples):
+    '''
+    runs all checks on the tiers (on- & offsets and texts as arrays) and
+    returns the report
+    '''
+    arrays = {name: (xmin, xmax, texts, has_text(texts))
+              for name, (xmin, xmax, texts) in tiers.items()}
+    report = {}
+
+    for name in arrays:
+        for check, found in check_tier(arrays[name], nrOfExamples).items():
+            report['%s: %s' % (name, check)] = found
+
+    if 'sentence' in arrays and 'person' in arrays:
+        sMin, sMax, sTexts, sHasText = arrays['sentence']
+        person = containing(sMin, sMax, arrays['person'])
+        report['sentences without person'] = result(
+            sHasText & (person < 0), sMin, sMax, sTexts, nrOfExamples)
+
+    if 'sentence' in arrays and 'words' in arrays:
+        wMin, wMax, wTexts, wHasText = arrays['words']
+        sMin, sMax, sTexts, sHasText = arrays['sentence']
+        sentence = containing(wMin, wMax, arrays['sentence'])
+        report['words outside of sentences'] = result(
+            wHasText & (sentence < 0), wMin, wMax, wTexts, nrOfExamples)
+
+        # count the words within every sentence
+        nrOfWords = np.bincount(sentence[wHasText & (sentence >= 0)],
+                                minlength=len(sMin))
+        report['sentences without words'] = result(
+            sHasText & (nrOfWords == 0), sMin, sMax, sTexts, nrOfExamples)
+
+    if 'words' in arrays and 'phones' in arrays:
+        pMin, pMax, pTexts, pHasText = arrays['phones']
+        word = containing(pMin, pMax, arrays['words'])
+        report['phones outside of words'] = result(
+            pHasText & (word < 0), pMin, pMax, pTexts, nrOfExamples)
+
+    if 'words' in arrays:
+        for name in arrays:
+            if name in UNALIGNED:
+                continue
+            report['%s: alignment with words' % name] = check_alignment(
+                arrays[name], arrays['words'], nrOfExamples)
+
+    if 'words' in arrays and 'pos' in arrays:
+        wMin, wMax, wTexts, wHasText = arrays['words']
+        posHasText = arrays['pos'][3]
+        if len(posHasText) == len(wHasText):
+            report['words without tags'] = result(
+                wHasText & ~posHasText, wMin, wMax, wTexts, nrOfExamples)
+
+    return report
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, outFile, nrOfExamples = parse_arguments()
+
+    tiers = read_tier_arrays(inFile)
+    report = check_textgrid(tiers, nrOfExamples)
+
+    failed = [check for check in report if report[check]['count'] > 0]
+    summary = {'file': inFile,
+               'failed': failed,
+               'checks': report}
+
+    if outFile is None:
+        json.dump(summary, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        with open(outFile, 'w') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    for check in failed:
+        print('%s: %s' % (check, report[check]['count']), file=sys.stderr)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+"""
+Cuts the audio track into one WAV + TextGrid pair per sentence, so that the
+forced alignment can be run as many small jobs (distributed over cores)
+instead of one job over the whole movie
+
+The WAV is memory-mapped, hence only the samples of the current sentence are
+read. Every chunk is padded with some context before and after the sentence.
+A manifest (chunks.tsv) lists for every chunk its time in the movie, which is
+needed to shift the aligner's output back to movie time.
+
+Call from the root of the dataset, e.g.:
+python3 code/chunk-speech-wav.py -o bin/montreal-data/chunks
+"""
+import argparse
+import csv
+import os
+import os.path
+from multiprocessing import Pool
+from annotation_io import fill_gaps, read_tiers, write_textgrid
+from wav_io import memmap_wav, write_wav
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Cut the audio track into per-sentence chunks'
+    )
+    parser.add_argument('-w',
+                        default='bin/montreal-data/corpus/speech-vocal.wav',
+                        help='the audio track')
+
+    parser.add_argument('-t',
+                        default='bin/montreal-data/corpus/'
+                        'speech-vocal.TextGrid',
+                        help='the TextGrid with the tier "sentence"')
+
+    parser.add_argument('-o',
+                        default='bin/montreal-data/chunks',
+                        help='the directory to write the chunks to')
+
+    parser.add_argument('--padding',
+                        type=float,
+                        default=0.25,
+                        help='seconds of context before & after a sentence')
+
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='number of parallel processes')
+
+    args = parser.parse_args()
+
+    return args.w, args.t, args.o, args.padding, args.jobs
+
+
+def plan_chunks(sentences, padding, duration, stem):
+    '''
+    returns one row per non-empty sentence: the chunk's name, the chunk's
+    start & end in the movie (incl. padding), the sentence's on- & offset,
+    and the sentence's text
+    '''
+    chunks = []
+    for start, end, text in sentences:
+        if text.strip() in ['', '_']:
+            continue
+        name = '%s_%05d' % (stem, len(chunks) + 1)
+        chunkStart = max(0.0, start - padding)
+        chunkEnd = min(duration, end + padding)
+        chunks.append([name, round(chunkStart, 3), round(chunkEnd, 3),
+                       start, end, text])
+
+    return chunks
+
+
+def init_worker(wavFile):
+    '''
+    every process maps the WAV once
+    '''
+    global samples, rate
+    samples, rate = memmap_wav(wavFile)
+
+
+def write_chunk(args):
+    '''
+    writes the samples and the TextGrid (in chunk time) of one chunk
+    '''
+    outDir, name, chunkStart, chunkEnd, start, end, text = args
+
+    first = int(round(chunkStart * rate))
+    last = int(round(chunkEnd * rate))
+    write_wav(os.path.join(outDir, name + '.wav'), samples[first:last], rate)
+
+    length = (last - first) / rate
+    sentence = [[max(0.0, start - chunkStart),
+                 min(length, end - chunkStart), text]]
+    write_textgrid(os.path.join(outDir, name + '.TextGrid'),
+                   [('sentence', fill_gaps(sentence, 0, length))],
+                   0, length)
+
+    return name
+
+
+# main programm
+if __name__ == "__main__":
+    wavFile, textGridFile, outDir, padding, jobs = parse_arguments()
+
+    os.makedirs(outDir, exist_ok=True)
+
+    samples, rate = memmap_wav(wavFile)
+    duration = len(samples) / rate
+    stem = os.path.splitext(os.path.basename(wavFile))[0]
+
+    sentences = read_tiers(textGridFile)['sentence']
+    chunks = plan_chunks(sentences, padding, duration, stem)
+
+    # write the manifest first, so the chunks can be merged back later
+    with open(os.path.join(outDir, 'chunks.tsv'), 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['name', 'chunk_start', 'chunk_end',
+                         'onset', 'offset', 'text'])
+        writer.writerows(chunks)
+
+    toWrite = [[outDir] + chunk for chunk in chunks]
+    with Pool(jobs, initializer=init_worker, initargs=(wavFile,)) as pool:
+        for nr, name in enumerate(pool.imap_unordered(write_chunk, toWrite,
+                                                      chunksize=64), 1):
+            if nr % 500 == 0:
+                print('%s of %s chunks written' % (nr, len(toWrite)))
+
+    print('%s chunks written to %s' % (len(toWrite), outDir))
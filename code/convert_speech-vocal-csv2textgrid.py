@@ -15,23 +15,7 @@ play intervall: Tab
 import csv
 import os
 import sys
-
-
-def time_stamp_to_msec(t_stamp='01:50:34:01'):
-    '''
-    Input:
-        time stamp (str) in format HH:MM:SS:Frame
-
-    Output:
-        time point in milliseconds (int)
-    '''
-    splitted_stamp = t_stamp.split(':')
-    milliseconds = (int(splitted_stamp[0]) * 60 * 60 * 1000) +\
-                   (int(splitted_stamp[1]) * 60 * 1000) +\
-                   (int(splitted_stamp[2]) * 1000) +\
-                   (int(splitted_stamp[3]) * 40)
-
-    return milliseconds
+from annotation_io import time_stamp_to_msec
 
 
 def sec_to_time_stamp(seconds=6634.040):
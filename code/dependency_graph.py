@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""
+Compact storage of the syntactic dependencies as arrays.
+
+The tier 'dep' holds the dependencies as text ('label;HEAD;child1,child2'),
+which identifies the head only by its text and is ambiguous for words that
+occur twice in a sentence. The tagger hence also writes a sidecar file next
+to the annotation:
+
+    <annotation>_dependencies.npz
+        heads       int32, the index of every word's head (a root is its own
+                    head; -1 for words that were not analyzed, e.g.
+                    non-speech)
+        labels      int16, the index of every word's dependency label into
+                    'names' (-1 for words that were not analyzed)
+        names       the dependency labels
+
+The arrays are aligned with the words, i.e. the intervals of the tier
+'words' that contain text, in the order of the column 'word_index' of the
+BIDS .tsv created from the TextGrid (which shares the sidecar's stem).
+
+Depth, dependency distance and subtree size of all words of the movie are
+computed at once by the functions below, without walking the trees word by
+word.
+"""
+
+import os.path
+import numpy as np
+
+
+# head & label of words without dependency
+NOHEAD = -1
+
+
+def dependencies_path(annoFile):
+    '''
+    returns the path of the dependency arrays belonging to an annotation file
+    '''
+    return os.path.splitext(annoFile)[0] + '_dependencies.npz'
+
+
+def save_dependencies(annoFile, heads, labels):
+    '''
+    writes the heads (word indices) and the labels (strings; '' for words
+    without dependency) next to the annotation file
+    '''
+    names = sorted(set(labels) - {''})
+    codes = {name: code for code, name in enumerate(names)}
+
+    np.savez(dependencies_path(annoFile),
+             heads=np.asarray(heads, dtype=np.int32),
+             labels=np.array([codes.get(label, NOHEAD) for label in labels],
+                             dtype=np.int16),
+             names=np.array(names, dtype=str))
+
+    return None
+
+
+def load_dependencies(annoFile):
+    '''
+    returns the heads, the label indices, and the label names
+    '''
+    with np.load(dependencies_path(annoFile)) as arrays:
+        return (arrays['heads'], arrays['labels'],
+                [str(name) for name in arrays['names']])
+
+
+def roots_as_own_heads(heads):
+    '''
+    returns the heads with words without dependency turned into roots (i.e.
+    their own heads), and the mask of the words that have a dependency
+    '''
+    heads = np.asarray(heads, dtype=np.int64)
+    analyzed = heads != NOHEAD
+    ownIndex = np.arange(len(heads))
+
+    return np.where(analyzed, heads, ownIndex), analyzed
+
+
+def tree_depth(heads):
+    '''
+    returns the number of arcs between every word and its sentence's root
+    (0 for roots, -1 for words without dependency); the ancestors are
+    followed by pointer jumping, i.e. in log2(depth) steps over all words
+    '''
+    parents, analyzed = roots_as_own_heads(heads)
+    ownIndex = np.arange(len(parents))
+
+    depth = (parents != ownIndex).astype(np.int64)
+    ancestors = parents
+    # after every step, ancestors point twice as far up the trees, so no
+    # tree needs more steps than the log2 of the number of words
+    nrOfSteps = int(np.ceil(np.log2(max(2, len(parents)))))
+    for step in range(nrOfSteps):
+        if np.array_equal(ancestors[ancestors], ancestors):
+            break
+        depth = depth + depth[ancestors]
+        ancestors = ancestors[ancestors]
+
+    return np.where(analyzed, depth, NOHEAD)
+
+
+def dependency_distance(heads):
+    '''
+    returns the position of every word's head relative to the word (e.g. 1
+    for the next word, -1 for the previous one, 0 for roots, and NaN for
+    words without dependency)
+    '''
+    parents, analyzed = roots_as_own_heads(heads)
+    distance = (parents - np.arange(len(parents))).astype(np.float64)
+
+    return np.where(analyzed, distance, np.nan)
+
+
+def subtree_size(heads, depth=None):
+    '''
+    returns the number of words in every word's subtree (including the word
+    itself; 0 for words without dependency); the sizes are passed up to the
+    heads level by level, starting at the deepest words
+    '''
+    parents, analyzed = roots_as_own_heads(heads)
+    if depth is None:
+        depth = tree_depth(heads)
+
+    size = analyzed.astype(np.int64)
+    for level in range(int(depth.max(initial=0)), 0, -1):
+        words = np.flatnonzero(depth == level)
+        np.add.at(size, parents[words], size[words])
+
+    return size
@@ -4,22 +4,25 @@ author: Christian Olaf Haeusler
 created on Friday October 22th 2019
 """
 import argparse
+import bisect
 import csv
-import spacy
+import heapq
+import json
+import os
+import os.path
 import sys
 from collections import defaultdict
+from itertools import islice
+from multiprocessing import Pool
+from annotation_io import SEGMENTS_OFFSETS, read_tsv_cached
+from memory_profile import MemoryProfile
+from tagging_client import explain
 
 
-SEGMENTS_OFFSETS = (
-    (0.00, 0.00),
-    (886.00, 0.00),
-    (1752.08, 0.08),  # third segment's start
-    (2612.16, 0.16),
-    (3572.20, 0.20),
-    (4480.28, 0.28),
-    (5342.36, 0.36),
-    (6410.44, 0.44),  # last segment's start
-    (7086.00, 0.00))  # movie's last time point
+# columns of the BIDS .tsv that contain categories of words
+# (not e.g. the vector or acoustic features)
+CATEGORICAL = ['person', 'text', 'pos', 'tag', 'dep', 'lemma', 'stop',
+               'descr']
 
 
 def parse_arguments():
@@ -29,44 +32,99 @@ def parse_arguments():
         description='Show decriptive statistics for the annotation of speech'
     )
     parser.add_argument('-i',
-                        default='annotation/fg_rscut_ad_ger_speech_tagged.tsv',
-                        help='The input file')
+                        nargs='+',
+                        default=['annotation/'
+                                 'fg_rscut_ad_ger_speech_tagged.tsv'],
+                        help='The input file(s); the counts of several files '
+                        '(or of their summaries, .json) are added up')
 
     parser.add_argument('-o',
                         required=False,
                         default=None,
                         help='the tex-file the statistics to write to')
 
+    parser.add_argument('--chunk-size',
+                        type=int,
+                        default=None,
+                        help='stream the input in chunks of that many rows '
+                        'instead of reading it at once')
+
+    parser.add_argument('--memory-report',
+                        default=None,
+                        help='trace the memory of every stage and write '
+                        'the report (.json) to this file')
+
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='number of processes counting the files')
+
+    parser.add_argument('--summaries',
+                        default=None,
+                        help='write the counts of every file as summary '
+                        '(.json) into this directory')
+
+    parser.add_argument('--per-file',
+                        action='store_true',
+                        help='with several input files, also report the '
+                        'statistics of every single file')
+
     args = parser.parse_args()
 
-    inFile = args.i
+    inFiles = args.i
     outFile = args.o
+    chunkSize = args.chunk_size
+    memoryReport = args.memory_report
 
-    return inFile, outFile
+    return (inFiles, outFile, chunkSize, memoryReport, args.jobs,
+            args.summaries, args.per_file)
 
 
 def read_file(inFile):
     '''
     '''
+    # parsed rows are cached in a binary snapshot next to the .tsv
+    header, content = read_tsv_cached(inFile)
+
+    return header, content
+
+
+def iter_chunks(inFile, chunkSize):
+    '''
+    yields the file's header and its rows in chunks of chunkSize rows, so
+    only one chunk is held in memory at a time
+    '''
     with open(inFile) as csvfile:
         content = csv.reader(csvfile, delimiter='\t')
         header = next(content, None)
-        content = [x for x in content]
-
-    return header, content
+        while True:
+            chunk = list(islice(content, chunkSize))
+            if not chunk:
+                break
+            yield header, chunk
 
 
 def get_run_number(starts, onset):
     '''
+    starts need to be sorted ascending (as in SEGMENTS_OFFSETS)
     '''
-    for start in sorted(starts, reverse=True):
-        if float(onset) >= start:
-            run = starts.index(start)
-            break
+    run = bisect.bisect_right(starts, float(onset)) - 1
 
     return run
 
 
+def top_categories(categories, topNr):
+    '''
+    returns the categories (lists with the name followed by the count of the
+    whole stimulus) with the highest counts, most first; a heap is used to
+    select the top x, so the whole list does not have to be sorted
+    '''
+    if topNr > 0:
+        return heapq.nlargest(topNr, categories, key=lambda x: x[1])
+
+    return sorted(categories, key=lambda x: -x[1])[:topNr]
+
+
 def populate_name_count(sent, nonSpeech, phones, data):
     '''
     '''
@@ -96,7 +154,7 @@ def populate_name_count(sent, nonSpeech, phones, data):
     return sent, nonSpeech, phones
 
 
-def populate_column_cat_count(columnDict, data):
+def populate_column_cat_count(columnDict, data, header):
     '''
     '''
     segmStarts = [start for start, offset in SEGMENTS_OFFSETS]
@@ -107,8 +165,10 @@ def populate_column_cat_count(columnDict, data):
         segment = str(run + 1)
 
         # does the row contain a word?
-        if len(line) >= 6:
-            for column in header[2:-1]:
+        # (rows of sentences and phonemes are padded if the file contains
+        # acoustic features)
+        if len(line) >= 6 and line[4] not in ['SENTENCE', 'PHONEME']:
+            for column in [col for col in header if col in CATEGORICAL]:
                 # NON-SPECH and X, XY (=other) have 6 not 11 columns
                 # so try for all columns in the header
                 try:
@@ -128,6 +188,126 @@ def populate_column_cat_count(columnDict, data):
     return columnDict
 
 
+def to_plain(counts):
+    '''
+    turns nested defaultdicts of counts into plain dicts (e.g. for JSON)
+    '''
+    if isinstance(counts, dict):
+        return {key: to_plain(value) for key, value in counts.items()}
+
+    return counts
+
+
+def to_counts(plain, depth):
+    '''
+    turns plain dicts of counts (nested depth times) back into defaultdicts
+    '''
+    if depth == 1:
+        return defaultdict(int, plain)
+
+    counts = defaultdict(lambda: to_counts({}, depth - 1))
+    for key, value in plain.items():
+        counts[key] = to_counts(value, depth - 1)
+
+    return counts
+
+
+def merge_counts(total, counts):
+    '''
+    adds nested plain dicts of counts to the total (in place)
+    '''
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            merge_counts(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+    return total
+
+
+def count_file(job):
+    '''
+    map step: returns the counts of one file as summary (plain dicts that can
+    be stored as JSON and added up); summaries (.json) are just loaded
+    '''
+    inFile, chunkSize = job
+    if inFile.endswith('.json'):
+        with open(inFile) as f:
+            return json.load(f)
+
+    countsSen = defaultdict(lambda: defaultdict(int))
+    countsNon = defaultdict(lambda: defaultdict(int))
+    countsPho = defaultdict(lambda: defaultdict(int))
+    countsWor = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+    # without a chunk size, the whole file is one chunk
+    if chunkSize is None:
+        chunks = [read_file(inFile)]
+    else:
+        chunks = iter_chunks(inFile, chunkSize)
+
+    # loop through the annotation content and populate the dictionaries;
+    # the counts are only ever increased, so every chunk simply adds to them
+    header = []
+    for header, fContent in chunks:
+        # sentences, non-speech und phonemes
+        countsSen, countsNon, countsPho = populate_name_count(
+            countsSen, countsNon, countsPho, fContent)
+        # single words and their additional columns with linguistic features
+        countsWor = populate_column_cat_count(countsWor, fContent, header)
+
+    return {'files': [inFile],
+            'header': header,
+            'sentences': to_plain(countsSen),
+            'nonspeech': to_plain(countsNon),
+            'phones': to_plain(countsPho),
+            'words': to_plain(countsWor)}
+
+
+def merge_summaries(summaries):
+    '''
+    reduce step: adds up the counts of the summaries; the header gets the
+    columns of all files (in the order they first occur)
+    '''
+    total = {'files': [], 'header': [], 'sentences': {}, 'nonspeech': {},
+             'phones': {}, 'words': {}}
+    for summary in summaries:
+        total['files'].extend(summary['files'])
+        total['header'].extend([column for column in summary['header']
+                                if column not in total['header']])
+        for key in ['sentences', 'nonspeech', 'phones', 'words']:
+            merge_counts(total[key], summary[key])
+
+    return total
+
+
+def file_stems(inFiles):
+    '''
+    returns per input file the name its own outputs are named by: its path
+    relative to the directory all inputs are in, without extension and with
+    '_' for the separators (i.e. the file's name if all are in the same
+    directory); exits if two files would get the same name
+    '''
+    paths = [os.path.abspath(inFile) for inFile in inFiles]
+    common = os.path.dirname(paths[0]) if len(paths) == 1 else \
+        os.path.commonpath([os.path.dirname(path) for path in paths])
+    stems = [os.path.splitext(os.path.relpath(path, common))[0]
+             .replace(os.sep, '_') for path in paths]
+
+    duplicates = sorted(set(stem for stem in stems if stems.count(stem) > 1))
+    if duplicates:
+        sys.exit('several input files have the name(s) %s'
+                 % ', '.join(duplicates))
+
+    return stems
+
+
+def summary_path(summaryDir, stem):
+    '''
+    '''
+    return os.path.join(summaryDir, stem + '_counts.json')
+
+
 def print_name_per_run(statsFor, countsDict, topNr):
     '''
     '''
@@ -145,10 +325,10 @@ def print_name_per_run(statsFor, countsDict, topNr):
         speaker.extend(allRuns)
     # sort the list from speaker with most spoken sentences to
     # speaker with least spoken sentences
-    speakers = sorted(speakers, key=lambda x: -x[1])
+    speakers = top_categories(speakers, topNr)
 
     # PRINTING FOR SENTENCES
-    for speaker in speakers[:topNr]:
+    for speaker in speakers:
         x = [str(index) for index in speaker]
         print('\t'.join(x))
 
@@ -157,7 +337,7 @@ def print_name_per_run(statsFor, countsDict, topNr):
     return None
 
 
-def print_words_and_columns(countsWor, topNr):
+def print_words_and_columns(header, countsWor, topNr):
     '''
     '''
     # count & print the total number of words
@@ -183,7 +363,7 @@ def print_words_and_columns(countsWor, topNr):
             if column in ['pos', 'tag', 'dep']:
                 allRuns = [countsWor[column][category[0]][str(x)]
                            for x in range(0, 9)]
-                allRuns.append(spacy.explain(category[0]))
+                allRuns.append(explain(category[0]))
             else:
                 allRuns = [countsWor[column][category[0]][str(x)]
                            for x in range(0, 9)]
@@ -191,11 +371,11 @@ def print_words_and_columns(countsWor, topNr):
             # add the information of all runs
             category.extend(allRuns)
 
-        categories = sorted(categories, key=lambda x: -x[1])
+        categories = top_categories(categories, topNr)
 
         # PRINTING FOR WORDS
         print(column)
-        for x in categories[:topNr]:
+        for x in categories:
             x = [str(index) for index in x]
             print('\t'.join(x))
         print('\n')
@@ -203,7 +383,7 @@ def print_words_and_columns(countsWor, topNr):
     return None
 
 
-def write_tex_file(outFile):
+def write_tex_file(outFile, countsSen, countsWor, countsPho):
     '''
     '''
     # this is used to generate the .tex-file for the reproducible paper
@@ -322,7 +502,7 @@ def statsWords(countsWor):
     return(linesForLatex)
 
 
-def sentsBySpeaker(countSen, topNr):
+def sentsBySpeaker(countsSen, topNr):
     '''
     '''
     # get a list of all speakers
@@ -335,9 +515,9 @@ def sentsBySpeaker(countSen, topNr):
     # sort the list from speaker with most spoken sentences to
     # speaker with least spoken sentences
     # sort by count, most first
-    speakers = sorted(speakers, key=lambda x: -x[1])
+    speakers = top_categories(speakers, topNr)
     # sort top x alphabetically
-    speakers = sorted(speakers[:topNr])
+    speakers = sorted(speakers)
 
     # PRINTING FOR SENTENCES
     for speaker in speakers[:topNr]:
@@ -371,15 +551,15 @@ def statsWordsColumns(colName, currentColumnDict, topNr):
         # add explanation of categories of 'pos', 'tag', and 'dep'
         allRuns = [currentColumnDict[category[0]][str(x)]
                     for x in range(0, 9)]
-        allRuns.append(spacy.explain(category[0]))
+        allRuns.append(explain(category[0]))
 
         # add the information of all runs
         category.extend(allRuns)
 
     # sort by count, most first
-    categories = sorted(categories, key=lambda x: -x[1])
+    categories = top_categories(categories, topNr)
     # sort by top x by alphabetically
-    categories = sorted(categories[:topNr])
+    categories = sorted(categories)
 
     for x in categories[:topNr]:
         x = [str(index) for index in x]
@@ -410,26 +590,15 @@ def statsWordsColumns(colName, currentColumnDict, topNr):
     return linesForLatex
 
 
-# main programm
-if __name__ == "__main__":
-    # read the BIDS .tsv
-    inFile, outFile = parse_arguments()
-
-    header, fContent = read_file(inFile)
-
-    # get data in shape to do the descriptive statistics
-    # initialize the dictionaries
-    countsSen = defaultdict(lambda: defaultdict(int))
-    countsNon = defaultdict(lambda: defaultdict(int))
-    countsPho = defaultdict(lambda: defaultdict(int))
-    countsWor = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-
-    # loop through the annotation content and populate the dictionaries
-    # sentences, non-speech und phonemes
-    countsSen, countsNon, countsPho = populate_name_count(
-        countsSen, countsNon, countsPho, fContent)
-    # single words and their additional columns with linguistic features
-    countsWor = populate_column_cat_count(countsWor, fContent)
+def report(summary, outFile):
+    '''
+    prints the statistics of a (merged) summary or writes them as LaTeX
+    '''
+    header = summary['header']
+    countsSen = to_counts(summary['sentences'], 2)
+    countsNon = to_counts(summary['nonspeech'], 2)
+    countsPho = to_counts(summary['phones'], 2)
+    countsWor = to_counts(summary['words'], 3)
 
     if outFile == None:
         # this was used for exploratory analyses of the
@@ -438,8 +607,56 @@ if __name__ == "__main__":
         # last argument ist the top count of categories to print
         print_name_per_run('Sentences:', countsSen, -1)
         print_name_per_run('Non-Speech:', countsNon, -1)
-        print_words_and_columns(countsWor, -1)
+        print_words_and_columns(header, countsWor, -1)
         print_name_per_run('Phonemes:', countsPho, -1)
 
     if outFile != None:
-        write_tex_file(outFile)
+        write_tex_file(outFile, countsSen, countsWor, countsPho)
+
+    return None
+
+
+# main programm
+if __name__ == "__main__":
+    # read the BIDS .tsv file(s)
+    (inFiles, outFile, chunkSize, memoryReport, jobs, summaryDir,
+     perFile) = parse_arguments()
+    # the names of the outputs per file
+    stems = file_stems(inFiles)
+    profile = MemoryProfile(enabled=memoryReport is not None)
+
+    # get data in shape to do the descriptive statistics;
+    # every file is counted in its own process (map), and the counts of all
+    # files are added up afterwards (reduce)
+    with profile.stage('count'):
+        toCount = [(inFile, chunkSize) for inFile in inFiles]
+        if len(toCount) == 1 or jobs == 1:
+            summaries = [count_file(job) for job in toCount]
+        else:
+            with Pool(min(jobs, len(toCount))) as pool:
+                summaries = pool.map(count_file, toCount)
+
+        if summaryDir is not None:
+            os.makedirs(summaryDir, exist_ok=True)
+            for inFile, stem, summary in zip(inFiles, stems, summaries):
+                if inFile.endswith('.json'):
+                    continue
+                with open(summary_path(summaryDir, stem), 'w') as f:
+                    json.dump(summary, f, ensure_ascii=False)
+
+        corpus = merge_summaries(summaries)
+
+    with profile.stage('latex'):
+        report(corpus, outFile)
+
+        if perFile and len(summaries) > 1:
+            for inFile, stem, summary in zip(inFiles, stems, summaries):
+                if outFile == None:
+                    print('\n%% %s' % inFile)
+                    report(summary, None)
+                else:
+                    report(summary,
+                           '%s_%s.tex' % (os.path.splitext(outFile)[0], stem))
+
+    if memoryReport is not None:
+        profile.report(memoryReport)
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+"""
+Detects simultaneous speech in the raw annotation (speech-vocal.csv)
+
+convert_speech-vocal-csv2textgrid.py writes a single tier 'sentence' and
+hence rejects rows that start before the previous row ends. Here, all rows
+are kept: a sweep line over the rows sorted by onset keeps the rows that are
+still running in a heap (sorted by offset); every new row overlaps exactly
+the rows left in the heap after the ones that ended were removed. This takes
+O(n log n + number of overlaps) instead of comparing all pairs of rows.
+
+Written are
+    - an event table (.tsv) with one row per pair of overlapping rows
+    - per input file a TextGrid with one tier per speaker, and a tier
+      'overlap' with the times two or more speakers speak at once
+
+Several files (e.g. of several movies) can be given; every file is
+processed on its own. The TextGrids are named after the files, prefixed by
+their directory if several files have the same name; the event table names
+the file of every row by its path.
+
+Call from the root of the dataset, e.g.:
+python3 code/detect-overlapping-speech.py -o annotation/overlaps
+"""
+import argparse
+import csv
+import heapq
+import os
+import os.path
+import sys
+from annotation_io import fill_gaps, time_stamp_to_msec, write_textgrid
+
+
+# tolerance (in seconds); rows that overlap less are treated as consecutive
+EPSILON = 0.0005
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Detect overlapping speech in speech-vocal.csv'
+    )
+    parser.add_argument('-i',
+                        nargs='+',
+                        default=['annotation/speech-vocal.csv'],
+                        help='the raw annotation(s)')
+
+    parser.add_argument('-o',
+                        default='annotation/overlaps',
+                        help='the directory to write the results to')
+
+    parser.add_argument('--songs',
+                        action='store_true',
+                        help='keep soundtracks (OST) and songs, which span '
+                        'over longer times with speech within them')
+
+    args = parser.parse_args()
+
+    return args.i, args.o, args.songs
+
+
+def read_rows(inFile, songs=False):
+    '''
+    returns on- & offset (in seconds), person, and text of the rows with
+    known timing, sorted by onset
+    '''
+    with open(inFile) as csvFile:
+        data = csv.reader(csvFile)
+        # skip the file header
+        next(data, None)
+
+        rows = []
+        for row in data:
+            # filter rows with unknown timing
+            if '#' in row[0] or '#' in row[1]:
+                continue
+            # filter rows with Soundtracks or (longer) songs
+            if not songs and ('OST' in row[2] or 'song' in row[4]):
+                continue
+            rows.append([time_stamp_to_msec(row[0]) / 1000.0,
+                         time_stamp_to_msec(row[1]) / 1000.0,
+                         row[2].strip(),
+                         row[7].strip()])
+
+    return sorted(rows, key=lambda row: (row[0], row[1]))
+
+
+def overlapping_pairs(rows):
+    '''
+    returns the indices of every pair of overlapping rows (earlier row first)
+    and the start & end of their overlap; rows have to be sorted by onset
+    '''
+    pairs = []
+    running = []
+    for index, (start, end, person, text) in enumerate(rows):
+        # rows ending before the current one starts are done
+        while running and running[0][0] <= start + EPSILON:
+            heapq.heappop(running)
+
+        # all rows that are still running overlap the current one
+        for otherEnd, other in running:
+            pairs.append([other, index, start, min(end, otherEnd)])
+
+        heapq.heappush(running, (end, index))
+
+    return sorted(pairs, key=lambda pair: (pair[2], pair[3]))
+
+
+def speaker_tiers(rows):
+    '''
+    returns one tier per speaker; rows of a speaker that overlap each other
+    are merged into one interval
+    '''
+    tiers = {}
+    for start, end, person, text in rows:
+        intervals = tiers.setdefault(person, [])
+        if intervals and start < intervals[-1][1] - EPSILON:
+            intervals[-1][1] = max(intervals[-1][1], end)
+            intervals[-1][2] = intervals[-1][2] + ' ' + text
+        elif intervals:
+            # rows that overlap less than the tolerance just touch
+            intervals.append([max(start, intervals[-1][1]), end, text])
+        else:
+            intervals.append([start, end, text])
+
+    return tiers
+
+
+def output_names(inFiles):
+    '''
+    returns the name of the TextGrid of every input file: the file's name
+    without extension, prefixed by the name of its directory if several
+    files have the same name
+    '''
+    stems = [os.path.splitext(os.path.basename(inFile))[0]
+             for inFile in inFiles]
+    names = []
+    for inFile, stem in zip(inFiles, stems):
+        if stems.count(stem) > 1:
+            parent = os.path.basename(os.path.dirname(os.path.abspath(inFile)))
+            stem = parent + '_' + stem
+        names.append(stem)
+
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        sys.exit('several input files would be written to %s'
+                 % ', '.join(name + '_speakers.TextGrid'
+                             for name in duplicates))
+
+    return names
+
+
+def overlap_tier(rows, pairs):
+    '''
+    returns the union of all overlaps, with the speakers involved as text;
+    pairs have to be sorted by the overlaps' starts
+    '''
+    intervals = []
+    for first, second, start, end in pairs:
+        persons = {rows[first][2], rows[second][2]}
+        if intervals and start <= intervals[-1][1] + EPSILON:
+            intervals[-1][1] = max(intervals[-1][1], end)
+            intervals[-1][2] |= persons
+        else:
+            intervals.append([start, end, persons])
+
+    return [[start, end, ' + '.join(sorted(persons))]
+            for start, end, persons in intervals]
+
+
+# main programm
+if __name__ == "__main__":
+    inFiles, outDir, songs = parse_arguments()
+
+    os.makedirs(outDir, exist_ok=True)
+
+    events = []
+    for inFile, name in zip(inFiles, output_names(inFiles)):
+        rows = read_rows(inFile, songs)
+        pairs = overlapping_pairs(rows)
+
+        for first, second, start, end in pairs:
+            events.append([inFile, round(start, 3), round(end, 3),
+                           round(end - start, 3),
+                           rows[first][2], rows[second][2],
+                           rows[first][3], rows[second][3]])
+
+        xmax = max([row[1] for row in rows], default=0)
+        tiers = [(person, fill_gaps(intervals, 0, xmax))
+                 for person, intervals in sorted(speaker_tiers(rows).items())]
+        tiers.append(('overlap', fill_gaps(overlap_tier(rows, pairs),
+                                           0, xmax)))
+        write_textgrid(os.path.join(outDir, name + '_speakers.TextGrid'),
+                       tiers, 0, xmax)
+
+        print('%s: %s rows, %s overlapping pairs' % (inFile, len(rows),
+                                                     len(pairs)))
+
+    with open(os.path.join(outDir, 'overlaps.tsv'), 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['file', 'onset', 'offset', 'duration',
+                         'person1', 'person2', 'text1', 'text2'])
+        writer.writerows(events)
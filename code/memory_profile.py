@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+"""
+Peak-memory instrumentation of the stages of a script
+
+A script wraps each of its stages (reading, analyzing, writing, ...) in
+profile.stage('name'). When profiling is enabled (the scripts' option
+--memory-report), tracemalloc traces every allocation of Python objects;
+per stage, the peak of the traced memory, the process' resident memory
+(RSS) and the code lines holding the most memory at the end of the stage are
+recorded. The report is written as JSON and summarized on stderr.
+
+When profiling is disabled, the stages cost (next to) nothing, because
+tracing slows Python down considerably. Grouping millions of traces by code
+line takes a while, too; with the environment variable
+MEMORY_PROFILE_SITES=0, only the peaks are recorded.
+
+check-memory-budget.py runs the scripts on a large synthetic corpus and
+compares the reports to ceilings per stage.
+"""
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# number of allocation sites reported per stage (0: only the peaks)
+NROFSITES = int(os.environ.get('MEMORY_PROFILE_SITES', 10))
+
+# allocations of these files are not sites of interest
+IGNORED = [tracemalloc.__file__, '<frozen importlib._bootstrap>',
+           '<frozen importlib._bootstrap_external>', '<unknown>']
+
+MEGABYTE = 1024 * 1024
+
+
+def current_rss():
+    '''
+    returns the current resident memory of the process in bytes (Linux);
+    elsewhere, the peak resident memory is returned instead
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss():
+    '''
+    returns the peak resident memory of the process so far in bytes
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def top_sites(snapshot, nrOfSites):
+    '''
+    returns the code lines that hold the most traced memory
+    '''
+    sites = []
+    for stat in snapshot.statistics('lineno'):
+        frame = stat.traceback[0]
+        if frame.filename in IGNORED:
+            continue
+        sites.append({'site': '%s:%s' % (frame.filename, frame.lineno),
+                      'mb': round(stat.size / MEGABYTE, 2),
+                      'count': stat.count})
+        if len(sites) == nrOfSites:
+            break
+
+    return sites
+
+
+class MemoryProfile:
+    '''
+    collects the memory used by the stages of a script
+    '''
+    def __init__(self, enabled=True, nrOfSites=NROFSITES):
+        self.enabled = enabled
+        self.nrOfSites = nrOfSites
+        self.stages = []
+
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        records the memory used while the block is executed
+        '''
+        if not self.enabled:
+            yield
+            return
+
+        tracemalloc.reset_peak()
+        startTraced = tracemalloc.get_traced_memory()[0]
+        startRss = current_rss()
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            endTraced, peakTraced = tracemalloc.get_traced_memory()
+            sites = []
+            if self.nrOfSites > 0:
+                sites = top_sites(tracemalloc.take_snapshot(), self.nrOfSites)
+            endRss = current_rss()
+            self.stages.append({
+                'stage': name,
+                'seconds': round(time.perf_counter() - startTime, 3),
+                'start_mb': round(startTraced / MEGABYTE, 2),
+                'end_mb': round(endTraced / MEGABYTE, 2),
+                'peak_mb': round(peakTraced / MEGABYTE, 2),
+                'rss_start_mb': round(startRss / MEGABYTE, 2),
+                'rss_end_mb': round(endRss / MEGABYTE, 2),
+                'rss_peak_mb': round(max(peak_rss(), endRss) / MEGABYTE, 2),
+                'sites': sites})
+
+    def report(self, outFile):
+        '''
+        writes the stages as JSON and prints a summary to stderr
+        '''
+        if not self.enabled:
+            return None
+
+        summary = {'script': os.path.basename(sys.argv[0]),
+                   'peak_mb': max([stage['peak_mb'] for stage in self.stages],
+                                  default=0),
+                   'rss_peak_mb': round(peak_rss() / MEGABYTE, 2),
+                   'stages': self.stages}
+
+        with open(outFile, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+        print('stage\tseconds\tpeak MB\tRSS MB', file=sys.stderr)
+        for stage in self.stages:
+            print('%s\t%s\t%s\t%s' % (stage['stage'], stage['seconds'],
+                                      stage['peak_mb'], stage['rss_peak_mb']),
+                  file=sys.stderr)
+            if stage['sites']:
+                top = stage['sites'][0]
+                print('\ttop site: %s (%s MB)' % (top['site'], top['mb']),
+                      file=sys.stderr)
+
+        return None
@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+"""
+Merges the output of the forced alignment (tiers 'words' and 'phones') into
+the manually revised TextGrid
+
+The aligner's output is either one TextGrid of the whole movie or one
+TextGrid per chunk (see chunk-speech-wav.py); the chunks are shifted to movie
+time by their start in the manifest (chunks.tsv). In the revised TextGrid,
+the words and phonemes within the sentences that were aligned are replaced,
+all other intervals (and all other tiers, e.g. 'person', 'sentence',
+'descr') are kept.
+
+All inputs are sorted by time, hence the new and kept intervals are combined
+by a single merge of sorted lists, and the revised TextGrid is written once.
+
+Call from the root of the dataset, e.g.:
+python3 code/merge-alignment2textgrid.py \
+    -a bin/montreal-data/output/chunks -m bin/montreal-data/chunks/chunks.tsv
+"""
+import argparse
+import csv
+import glob
+import heapq
+import os
+import os.path
+import sys
+from annotation_io import fill_gaps, read_tiers, write_textgrid
+
+
+# the tiers of the aligner's output that are merged
+ALIGNED = ['words', 'phones']
+
+# texts of the aligner's silences, which become gaps
+SILENCES = ['', 'sil', 'sp', '<eps>']
+
+# tolerance (in seconds) when comparing boundaries
+EPSILON = 0.0005
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Merge the forced alignment into the revised TextGrid'
+    )
+    parser.add_argument('-a',
+                        nargs='+',
+                        default=['bin/montreal-data/output/'
+                                 'speech-vocal.TextGrid'],
+                        help='the aligner\'s output TextGrid(s), or '
+                        'directories containing them')
+
+    parser.add_argument('-m',
+                        default=None,
+                        help='the manifest (chunks.tsv) of chunked output; '
+                        'without it, the output is in movie time already')
+
+    parser.add_argument('-t',
+                        default='annotation/fg_rscut_ad_ger_speech.TextGrid',
+                        help='the manually revised TextGrid')
+
+    parser.add_argument('-o',
+                        default=None,
+                        help='the TextGrid to write (default: the revised '
+                        'TextGrid)')
+
+    args = parser.parse_args()
+
+    alignedFiles = []
+    for path in args.a:
+        if os.path.isdir(path):
+            alignedFiles.extend(sorted(glob.glob(os.path.join(path,
+                                                              '*.TextGrid'))))
+        else:
+            alignedFiles.append(path)
+
+    outFile = args.o if args.o is not None else args.t
+
+    return alignedFiles, args.m, args.t, outFile
+
+
+def read_manifest(manifestFile):
+    '''
+    returns the chunks' start, and the sentence's on- & offset (in movie
+    time) per chunk name
+    '''
+    chunks = {}
+    with open(manifestFile) as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        for row in reader:
+            chunks[row['name']] = (float(row['chunk_start']),
+                                   float(row['onset']),
+                                   float(row['offset']))
+
+    return chunks
+
+
+def aligned_tier(tiers, tierName):
+    '''
+    returns the tier of the aligner's output; with several speakers, the
+    aligner prefixes the tiers' names with the speaker (e.g. 'x - words')
+    '''
+    for name, intervals in tiers.items():
+        if name == tierName or name.endswith(' - ' + tierName):
+            return intervals
+
+    return []
+
+
+def read_alignments(alignedFiles, chunks):
+    '''
+    returns per tier in ALIGNED a list of sorted interval lists (one per
+    file) in movie time, and the sorted time ranges that were aligned
+    '''
+    shifted = {tierName: [] for tierName in ALIGNED}
+    covered = []
+    for alignedFile in alignedFiles:
+        name = os.path.splitext(os.path.basename(alignedFile))[0]
+        if chunks is None:
+            shift = 0.0
+            cover = None
+        elif name in chunks:
+            shift, onset, offset = chunks[name]
+            cover = [onset, offset]
+        else:
+            print('%s is not in the manifest' % alignedFile, file=sys.stderr)
+            continue
+
+        tiers = read_tiers(alignedFile)
+        for tierName in ALIGNED:
+            intervals = [[round(start + shift, 3), round(end + shift, 3),
+                          text]
+                         for start, end, text in aligned_tier(tiers, tierName)
+                         if text.strip() not in SILENCES]
+            shifted[tierName].append(intervals)
+
+            # output of the whole movie replaces the words it contains
+            if cover is None and intervals:
+                covered.extend([interval[:2] for interval in intervals])
+
+        if cover is not None:
+            covered.append(cover)
+
+    return shifted, united(covered)
+
+
+def united(ranges):
+    '''
+    returns the union of the time ranges, sorted
+    '''
+    union = []
+    for start, end in sorted(ranges):
+        if union and start <= union[-1][1] + EPSILON:
+            union[-1][1] = max(union[-1][1], end)
+        else:
+            union.append([start, end])
+
+    return union
+
+
+def outside(intervals, covered):
+    '''
+    returns the intervals (with text) outside the covered ranges; intervals
+    that lie partly within a covered range are clipped to their longest part
+    outside of it; both are sorted, so one sweep suffices
+    '''
+    kept = []
+    rangeNr = 0
+    for start, end, text in intervals:
+        if text.strip() == '':
+            continue
+        # skip the ranges that end before the interval
+        while (rangeNr < len(covered) and
+               covered[rangeNr][1] <= start + EPSILON):
+            rangeNr += 1
+
+        # the parts of the interval between the ranges it overlaps
+        parts = []
+        partStart = start
+        nr = rangeNr
+        while nr < len(covered) and covered[nr][0] < end - EPSILON:
+            parts.append([partStart, covered[nr][0]])
+            partStart = max(partStart, covered[nr][1])
+            nr += 1
+        parts.append([partStart, end])
+        parts = [part for part in parts if part[1] - part[0] > EPSILON]
+
+        if len(parts) == 1 and parts[0] == [start, end]:
+            kept.append([start, end, text])
+        elif parts:
+            clipped = max(parts, key=lambda part: part[1] - part[0])
+            print('"%s" (%s-%s) partly aligned anew, clipped to %s-%s'
+                  % (text, start, end, clipped[0], clipped[1]),
+                  file=sys.stderr)
+            kept.append(clipped + [text])
+
+    return kept
+
+
+def splice(intervals, covered, aligned):
+    '''
+    returns the revised tier's intervals outside the covered ranges merged
+    with the aligned intervals; intervals overlapping their predecessor
+    (e.g. in the padding of adjacent chunks) are shortened, or dropped if
+    they lie within it, with a warning
+    '''
+    merged = []
+    for start, end, text in heapq.merge(outside(intervals, covered),
+                                        *aligned):
+        if merged and start < merged[-1][1] - EPSILON:
+            previous = merged[-1]
+            if end - previous[1] > EPSILON:
+                print('"%s" (%s-%s) overlaps "%s", clipped to %s-%s'
+                      % (text, start, end, previous[2], previous[1], end),
+                      file=sys.stderr)
+            else:
+                print('"%s" (%s-%s) lies within "%s" (%s-%s), dropped'
+                      % (text, start, end, previous[2], previous[0],
+                         previous[1]), file=sys.stderr)
+            start = previous[1]
+        elif merged:
+            start = max(start, merged[-1][1])
+        if end - start > EPSILON:
+            merged.append([start, end, text])
+
+    return merged
+
+
+# main programm
+if __name__ == "__main__":
+    alignedFiles, manifestFile, textGridFile, outFile = parse_arguments()
+
+    chunks = read_manifest(manifestFile) if manifestFile else None
+    shifted, covered = read_alignments(alignedFiles, chunks)
+
+    tiers = read_tiers(textGridFile)
+    xmax = max([intervals[-1][1] for intervals in tiers.values()
+                if intervals])
+    # the tiers keep their order; missing ones are appended
+    order = list(tiers.keys())
+    order.extend([name for name in ALIGNED if name not in tiers])
+
+    for tierName in ALIGNED:
+        tiers[tierName] = fill_gaps(splice(tiers.get(tierName, []), covered,
+                                           shifted[tierName]), 0, xmax)
+
+    # write to a temporary file first, so the input can be the output
+    tmpFile = outFile + '.tmp'
+    write_textgrid(tmpFile, [(name, tiers[name]) for name in order], 0, xmax)
+    os.replace(tmpFile, outFile)
+
+    print('%s files merged; %s words, %s phones'
+          % (len(alignedFiles),
+             sum([len(x) for x in shifted['words']]),
+             sum([len(x) for x in shifted['phones']])))
@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+"""
+Bigram and co-occurrence statistics of words, lemmas and part-of-speech tags
+for the whole stimulus and every run
+
+The counts are built as sparse matrices (rows: first/one item, columns:
+second/other item) from integer codes of the annotation's columns:
+    - bigrams: two consecutive words within the same sentence
+    - co-occurrence: two different items within the same sentence (each
+      sentence counts once per pair)
+
+The most frequent pairs (of the whole stimulus) are printed with their counts
+per run, and can be written as .tsv and as LaTeX macros (like the ones of
+descriptive-statistics.py).
+
+Call from the root of the dataset, e.g.:
+python3 code/ngram-statistics.py -o paper/ngrams.tex
+"""
+import argparse
+import csv
+import sys
+import numpy as np
+from scipy import sparse
+from annotation_io import read_word_columns
+
+
+# the annotation's columns to compute the statistics for
+LEVELS = ['text', 'lemma', 'pos']
+
+# the statistics to compute
+KINDS = ['bigram', 'cooc']
+
+# number of runs/segments (the whole stimulus is "run" 0)
+NROFRUNS = 8
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Bigram and co-occurrence statistics per run'
+    )
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech_tagged.tsv',
+                        help='The input file')
+
+    parser.add_argument('-o',
+                        required=False,
+                        default=None,
+                        help='the tex-file the statistics to write to')
+
+    parser.add_argument('-t',
+                        required=False,
+                        default=None,
+                        help='the .tsv the top pairs to write to')
+
+    parser.add_argument('--levels',
+                        nargs='+',
+                        choices=LEVELS,
+                        default=LEVELS,
+                        help='the columns to compute the statistics for')
+
+    parser.add_argument('--top',
+                        type=int,
+                        default=15,
+                        help='number of most frequent pairs to report')
+
+    parser.add_argument('--nonspeech',
+                        action='store_true',
+                        help='include non-speech vocalizations')
+
+    args = parser.parse_args()
+
+    return (args.i, args.o, args.t, args.levels, args.top,
+            args.nonspeech)
+
+
+def encode(values):
+    '''
+    returns the unique values and every value's index into them
+    '''
+    categories, codes = np.unique(values.astype(str), return_inverse=True)
+
+    return categories, codes.reshape(-1)
+
+
+def bigram_counts(codes, sentences, runs, nrOfCategories):
+    '''
+    returns a sparse matrix of bigram counts for the whole stimulus (index 0)
+    and every run (indices 1-8)
+    '''
+    # consecutive words within the same sentence
+    pairs = (sentences[1:] == sentences[:-1]) & (sentences[1:] >= 0)
+    first = codes[:-1][pairs]
+    second = codes[1:][pairs]
+    pairRuns = runs[:-1][pairs]
+
+    shape = (nrOfCategories, nrOfCategories)
+    counts = [sparse.coo_matrix((np.ones(len(first)), (first, second)),
+                                shape=shape).tocsr()]
+    for run in range(1, NROFRUNS + 1):
+        inRun = pairRuns == run
+        counts.append(sparse.coo_matrix(
+            (np.ones(inRun.sum()), (first[inRun], second[inRun])),
+            shape=shape).tocsr())
+
+    return counts
+
+
+def cooccurrence_counts(codes, sentences, runs, nrOfCategories):
+    '''
+    returns a sparse matrix (upper triangle) of the number of sentences two
+    different items occur in together, for the whole stimulus (index 0) and
+    every run (indices 1-8)
+    '''
+    inSentence = sentences >= 0
+    codes = codes[inSentence]
+    sentences = sentences[inSentence]
+    runs = runs[inSentence]
+
+    # sentences x items; an item counts once per sentence
+    nrOfSentences = sentences.max() + 1 if len(sentences) else 0
+    incidence = sparse.coo_matrix(
+        (np.ones(len(codes)), (sentences, codes)),
+        shape=(nrOfSentences, nrOfCategories)).tocsr()
+    incidence.data[:] = 1
+
+    # the run of a sentence is the run of its first word
+    sentRuns = np.zeros(nrOfSentences, dtype=np.int64)
+    present, firstWord = np.unique(sentences, return_index=True)
+    sentRuns[present] = runs[firstWord]
+
+    counts = []
+    for run in range(0, NROFRUNS + 1):
+        if run == 0:
+            selected = incidence
+        else:
+            selected = incidence[sentRuns == run]
+        cooc = sparse.triu(selected.T @ selected, k=1).tocsr()
+        counts.append(cooc)
+
+    return counts
+
+
+def top_pairs(counts, topNr):
+    '''
+    returns the indices (first, second) of the topNr pairs with the highest
+    counts of the whole stimulus, most first
+    '''
+    whole = counts[0].tocoo()
+    topNr = min(topNr, whole.nnz)
+    if topNr == 0:
+        return []
+
+    # only the top x are sorted
+    best = np.argpartition(-whole.data, topNr - 1)[:topNr]
+    best = best[np.argsort(-whole.data[best], kind='stable')]
+
+    return list(zip(whole.row[best], whole.col[best]))
+
+
+def pair_table(level, kind, categories, counts, pairs):
+    '''
+    returns one row per pair: level, kind, both items, and the counts of the
+    whole stimulus and every run
+    '''
+    table = []
+    for first, second in pairs:
+        row = [level, kind, categories[first], categories[second]]
+        row.extend([int(matrix[first, second]) for matrix in counts])
+        table.append(row)
+
+    return table
+
+
+# digits spelled out in the names of LaTeX commands
+DIGITS = ['Zero', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven',
+          'Eight', 'Nine']
+
+
+def latex_name(text):
+    '''
+    returns the name of an item in a LaTeX command: its letters and its
+    digits (spelled out), lower case except for the first character
+    '''
+    name = ''.join([DIGITS[int(char)] if char in '0123456789'
+                    else char.lower()
+                    for char in text if char.isalpha() or
+                    char in '0123456789'])
+
+    return name[:1].upper() + name[1:]
+
+
+def latex_lines(table):
+    '''
+    returns the \\newcommand lines for the pairs' counts per run
+    '''
+    linesForLatex = []
+    labels = set()
+    for level, kind, first, second, *runs in table:
+        # items without letters or digits and pairs whose names clash (e.g.
+        # different cases) cannot get a command of their own
+        if not latex_name(first) or not latex_name(second):
+            print('no LaTeX name for (%s, %s), skipped' % (first, second),
+                  file=sys.stderr)
+            continue
+        # 'Then' separates the items
+        label = '%s%s%sThen%s' % (kind.capitalize(), level.capitalize(),
+                                  latex_name(first), latex_name(second))
+        if label in labels:
+            print('(%s, %s) would be \\%s again, skipped'
+                  % (first, second, label), file=sys.stderr)
+            continue
+        labels.add(label)
+        for run, count in enumerate(runs):
+            line = '\\newcommand{\\%sRun%s}{%s}\n' % (label, run, count)
+            linesForLatex.append(line)
+
+        # after every pair, insert a line break
+        linesForLatex.append('\n')
+
+    return linesForLatex
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, outFile, tsvFile, levels, topNr, nonspeech = parse_arguments()
+
+    columns = read_word_columns(inFile)
+    if not nonspeech:
+        keep = columns['pos'] != 'NONSPEECH'
+        columns = {key: values[keep] for key, values in columns.items()}
+
+    print(' \t \tall\tseg1\tseg2\tseg3\tseg4\tseg5\tseg6\tseg7\tseg8')
+
+    table = []
+    for level in levels:
+        values = columns[level]
+        if level == 'text':
+            values = np.array([value.lower() for value in values],
+                              dtype=object)
+        # like in descriptive-statistics.py, empty values (e.g. of words
+        # that were not tagged) are not counted; they count as outside of
+        # sentences, so the words around them do not become a bigram
+        empty = np.array([value == '' for value in values], dtype=bool)
+        sentences = np.where(empty, -1, columns['sentence_index'])
+        categories, codes = encode(values)
+
+        for kind in KINDS:
+            if kind == 'bigram':
+                counts = bigram_counts(codes, sentences, columns['run'],
+                                       len(categories))
+            else:
+                counts = cooccurrence_counts(codes, sentences, columns['run'],
+                                             len(categories))
+
+            pairs = top_pairs(counts, topNr)
+            levelTable = pair_table(level, kind, categories, counts, pairs)
+
+            print('\n%% %s %s:' % (level, kind))
+            for row in levelTable:
+                print('%s %s\t' % (row[2], row[3]) +
+                      '\t'.join([str(x) for x in row[4:]]))
+
+            table.extend(levelTable)
+
+    if tsvFile is not None:
+        with open(tsvFile, 'w') as f:
+            writer = csv.writer(f, delimiter='\t')
+            writer.writerow(['level', 'kind', 'first', 'second'] +
+                            ['run%s' % run for run in range(0, 9)])
+            writer.writerows(table)
+
+    if outFile is not None:
+        with open(outFile, 'w') as f:
+            f.write('% Bigrams and co-occurrences\n')
+            f.writelines(latex_lines(table))
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+"""
+Finds the moments of the movie whose words are semantically close to probe
+words or sentences
+
+The vector table of the annotation (one vector per unique word, see
+word_vectors.py) is loaded once as float32 matrix with rows of unit length.
+A probe is the mean vector of its words that are in the table. Probes are
+answered in batches: one matrix product gives the cosine similarities of a
+whole batch of probes to all words, and only the top k per probe are sorted.
+
+Every word among the top k is returned with all of its occurrences in the
+movie (onset, duration, run, and speaker).
+
+Call from the root of the dataset, e.g.:
+python3 code/semantic-search.py Mutter Krieg "mit dem Boot"
+"""
+import argparse
+import csv
+import sys
+import time
+import numpy as np
+from annotation_io import read_word_columns
+from word_vectors import NOVECTOR, load_normalized_table, load_vocab
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Nearest-neighbour search over the word vectors'
+    )
+    parser.add_argument('probes',
+                        nargs='*',
+                        help='probe words or sentences')
+
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech_tagged.tsv',
+                        help='the annotation (its vector table is next to it)')
+
+    parser.add_argument('-q',
+                        required=False,
+                        default=None,
+                        help='a file with one probe per line')
+
+    parser.add_argument('-o',
+                        required=False,
+                        default=None,
+                        help='the .tsv to write the hits to (default: stdout)')
+
+    parser.add_argument('-k',
+                        type=int,
+                        default=10,
+                        help='number of most similar words per probe')
+
+    parser.add_argument('--batch',
+                        type=int,
+                        default=1024,
+                        help='number of probes per matrix product')
+
+    parser.add_argument('--benchmark',
+                        type=int,
+                        default=0,
+                        help='time that many random probes of the vocabulary')
+
+    args = parser.parse_args()
+
+    probes = list(args.probes)
+    if args.q is not None:
+        with open(args.q) as f:
+            probes.extend([line.strip() for line in f if line.strip()])
+
+    return args.i, probes, args.o, args.k, args.batch, args.benchmark
+
+
+def token_types(columns, annoFile):
+    '''
+    returns every token's row in the vector table (-1 for tokens without
+    vector), the word of every row, and the normalized table; annotations
+    created before the vector table hold the vectors as comma-separated
+    strings, for which a table is built here instead of loading the sidecars
+    '''
+    cells = columns['vector']
+    # all cells are checked: the first ones may be words without vector
+    inline = np.array([',' in cell for cell in cells], dtype=bool)
+    if not inline.any():
+        types = np.array([int(cell) if cell not in ['', NOVECTOR] else -1
+                          for cell in cells], dtype=np.int64)
+        return types, load_vocab(annoFile), load_normalized_table(annoFile)
+
+    types = np.full(len(cells), -1, dtype=np.int64)
+    known = np.flatnonzero(inline)
+    unique, inverse = np.unique(cells[known].astype(str), return_inverse=True)
+    types[known] = inverse.reshape(-1)
+    vectors = np.array([cell.split(',') for cell in unique],
+                       dtype=np.float32)
+
+    # the word of a row is the text of its first token
+    first = known[np.unique(types[known], return_index=True)[1]]
+    words = [str(word) for word in columns['text'][first]]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return types, words, vectors / norms
+
+
+def probe_vectors(probes, words, table):
+    '''
+    returns a matrix with the normalized mean vector of every probe's words
+    that are in the table (lower case as fallback); rows of probes without any
+    known word are null
+    '''
+    rowOf = {}
+    for row, word in enumerate(words):
+        rowOf.setdefault(word, row)
+        rowOf.setdefault(word.lower(), row)
+
+    queries = np.zeros((len(probes), table.shape[1]), dtype=np.float32)
+    for nr, probe in enumerate(probes):
+        rows = [rowOf.get(word, rowOf.get(word.lower()))
+                for word in probe.split()]
+        rows = [row for row in rows if row is not None]
+        if rows:
+            queries[nr] = table[rows].mean(axis=0)
+
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return queries / norms
+
+
+def top_k(queries, table, k, batchSize):
+    '''
+    returns the rows of the table with the k highest cosine similarities to
+    every query, and the similarities (both queries x k, most similar first)
+    '''
+    k = min(k, table.shape[0])
+    rows = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    if k == 0:
+        return rows, scores
+
+    for start in range(0, len(queries), batchSize):
+        # one BLAS call for the whole batch
+        similarity = queries[start:start + batchSize] @ table.T
+
+        # only the top k are sorted
+        best = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        bestScores = np.take_along_axis(similarity, best, axis=1)
+        order = np.argsort(-bestScores, axis=1, kind='stable')
+
+        rows[start:start + batchSize] = np.take_along_axis(best, order, axis=1)
+        scores[start:start + batchSize] = np.take_along_axis(bestScores,
+                                                             order, axis=1)
+
+    return rows, scores
+
+
+def occurrences(types, nrOfTypes):
+    '''
+    returns the tokens sorted by their row in the table, and where the tokens
+    of every row start (the tokens of row r are sorted[starts[r]:starts[r+1]])
+    '''
+    known = np.flatnonzero(types >= 0)
+    sortedTokens = known[np.argsort(types[known], kind='stable')]
+    starts = np.searchsorted(types[sortedTokens], np.arange(nrOfTypes + 1))
+
+    return sortedTokens, starts
+
+
+def hits(probes, rows, scores, queries, columns, words, sortedTokens, starts):
+    '''
+    returns one row per occurrence of every probe's most similar words
+    '''
+    table = []
+    for nr, probe in enumerate(probes):
+        # probes without any known word have no neighbours
+        if not queries[nr].any():
+            continue
+        for rank, (row, score) in enumerate(zip(rows[nr], scores[nr]), 1):
+            for token in sortedTokens[starts[row]:starts[row + 1]]:
+                table.append([probe, rank, round(float(score), 4),
+                              words[row],
+                              columns['onset'][token],
+                              columns['duration'][token],
+                              columns['run'][token],
+                              columns['person'][token],
+                              columns['text'][token]])
+
+    return table
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, probes, outFile, k, batchSize, nrOfBenchmarks = parse_arguments()
+
+    columns = read_word_columns(inFile)
+    types, words, table = token_types(columns, inFile)
+    sortedTokens, starts = occurrences(types, len(words))
+
+    if nrOfBenchmarks > 0:
+        randomProbes = np.random.default_rng(0).choice(words, nrOfBenchmarks)
+        begin = time.perf_counter()
+        queries = probe_vectors(list(randomProbes), words, table)
+        top_k(queries, table, k, batchSize)
+        seconds = time.perf_counter() - begin
+        print('%s probes against %s words: %.3f s (%.0f probes/s)'
+              % (nrOfBenchmarks, len(words), seconds,
+                 nrOfBenchmarks / seconds), file=sys.stderr)
+
+    queries = probe_vectors(probes, words, table)
+    for probe, query in zip(probes, queries):
+        if not query.any():
+            print('no vector for "%s"' % probe, file=sys.stderr)
+
+    rows, scores = top_k(queries, table, k, batchSize)
+    found = hits(probes, rows, scores, queries, columns, words,
+                 sortedTokens, starts)
+
+    f = open(outFile, 'w') if outFile is not None else sys.stdout
+    writer = csv.writer(f, delimiter='\t')
+    writer.writerow(['probe', 'rank', 'similarity', 'word',
+                     'onset', 'duration', 'run', 'person', 'text'])
+    writer.writerows(found)
+    if outFile is not None:
+        f.close()
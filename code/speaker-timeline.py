@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+"""
+Speaking time and turn-taking statistics of the characters for the whole
+stimulus and every run
+
+Every sentence is assigned to the person speaking it. The sentences of every
+speaker are united (one sweep over the time-sorted intervals) to get the
+speaker's speaking time. Consecutive sentences of the same speaker form a
+turn; for the turns, the number per speaker, the transitions from one
+speaker to the next, and the gaps between turns are computed.
+
+All steps are linear in the number of intervals (the tiers are sorted).
+The statistics are printed, and can be written as LaTeX macros (like the
+ones of descriptive-statistics.py) and the transitions as .tsv.
+
+Call from the root of the dataset, e.g.:
+python3 code/speaker-timeline.py -o paper/speakers.tex
+"""
+import argparse
+import csv
+from collections import defaultdict
+import numpy as np
+from annotation_io import get_runs, read_tier_arrays
+
+
+# tolerance (in seconds) when comparing boundaries
+EPSILON = 0.0005
+
+# number of runs/segments (the whole stimulus is "run" 0)
+NROFRUNS = 8
+
+# percentiles of the gaps between turns that are reported
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Speaking time and turn-taking per speaker and run'
+    )
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech.TextGrid',
+                        help='the TextGrid with the tiers person & sentence')
+
+    parser.add_argument('-o',
+                        required=False,
+                        default=None,
+                        help='the tex-file the statistics to write to')
+
+    parser.add_argument('-t',
+                        required=False,
+                        default=None,
+                        help='the .tsv the turn transitions to write to')
+
+    parser.add_argument('--top',
+                        type=int,
+                        default=10,
+                        help='number of speakers/transitions to report')
+
+    args = parser.parse_args()
+
+    return args.i, args.o, args.t, args.top
+
+
+def speaker_intervals(tiers):
+    '''
+    returns on- & offsets and speaker of every sentence with text; the
+    speaker is the text of the interval of the tier 'person' the sentence
+    starts in
+    '''
+    sMin, sMax, sTexts = tiers['sentence']
+    pMin, pMax, pTexts = tiers['person']
+
+    hasText = np.array([text.strip() != '' for text in sTexts], dtype=bool)
+    sMin, sMax = sMin[hasText], sMax[hasText]
+
+    person = np.searchsorted(pMin, sMin + EPSILON, side='right') - 1
+    speakers = np.where(person >= 0,
+                        pTexts[np.clip(person, 0, None)], '')
+    speakers = np.array([speaker.strip() or 'UNKNOWN'
+                         for speaker in speakers], dtype=object)
+
+    return sMin, sMax, speakers
+
+
+def united_intervals(starts, ends, speakers):
+    '''
+    returns the union of every speaker's intervals; the intervals are sorted
+    by onset, so one sweep suffices that extends the speaker's current
+    interval or starts a new one
+    '''
+    united = defaultdict(list)
+    for start, end, speaker in zip(starts, ends, speakers):
+        current = united[speaker]
+        if current and start <= current[-1][1] + EPSILON:
+            current[-1][1] = max(current[-1][1], end)
+        else:
+            current.append([start, end])
+
+    return united
+
+
+def run_of(onsets):
+    '''
+    returns the run (1-8) of every onset; onsets after the start of the last
+    entry of SEGMENTS_OFFSETS (i.e. the end of the movie) count for run 8
+    '''
+    return np.clip(get_runs(onsets), 1, NROFRUNS)
+
+
+def speaking_time(united):
+    '''
+    returns the seconds every speaker speaks in the whole stimulus (index 0)
+    and every run (indices 1-8); united intervals count for the run of
+    their onset
+    '''
+    times = {}
+    for speaker, intervals in united.items():
+        intervals = np.array(intervals)
+        durations = intervals[:, 1] - intervals[:, 0]
+        perRun = np.bincount(run_of(intervals[:, 0]), weights=durations,
+                             minlength=NROFRUNS + 1)
+        perRun[0] = durations.sum()
+        times[speaker] = perRun
+
+    return times
+
+
+def speaker_turns(starts, ends, speakers):
+    '''
+    returns on- & offsets and speaker of every turn, i.e. of every sequence
+    of consecutive sentences of the same speaker
+    '''
+    if len(speakers) == 0:
+        return starts, ends, speakers
+
+    changes = np.flatnonzero(speakers[1:] != speakers[:-1]) + 1
+    first = np.concatenate([[0], changes])
+
+    return starts[first], np.maximum.reduceat(ends, first), speakers[first]
+
+
+def turn_counts(turnStarts, turnSpeakers):
+    '''
+    returns the number of turns of every speaker in the whole stimulus
+    (index 0) and every run (indices 1-8)
+    '''
+    runs = run_of(turnStarts)
+    counts = defaultdict(lambda: np.zeros(NROFRUNS + 1, dtype=np.int64))
+    for speaker, run in zip(turnSpeakers, runs):
+        counts[speaker][0] += 1
+        counts[speaker][run] += 1
+
+    return counts
+
+
+def transitions(turnStarts, turnSpeakers):
+    '''
+    returns the number of transitions from one speaker (rows) to the next
+    (columns) for the whole stimulus (index 0) and every run (indices 1-8);
+    a transition counts for the run of the second turn's onset
+    '''
+    names = sorted(set(turnSpeakers))
+    codes = np.searchsorted(names, turnSpeakers.astype(str))
+    runs = run_of(turnStarts[1:])
+
+    matrices = np.zeros((NROFRUNS + 1, len(names), len(names)),
+                        dtype=np.int64)
+    np.add.at(matrices, (np.zeros_like(runs), codes[:-1], codes[1:]), 1)
+    np.add.at(matrices, (runs, codes[:-1], codes[1:]), 1)
+
+    return names, matrices
+
+
+def gap_statistics(turnStarts, turnEnds):
+    '''
+    returns per run (0 = whole stimulus) the number of gaps between turns,
+    their mean, their percentiles, and the number of overlaps (negative gaps)
+    '''
+    gaps = turnStarts[1:] - turnEnds[:-1]
+    runs = run_of(turnStarts[1:])
+
+    stats = []
+    for run in range(0, NROFRUNS + 1):
+        runGaps = gaps if run == 0 else gaps[runs == run]
+        if len(runGaps) == 0:
+            stats.append([0, 0.0] + [0.0] * len(PERCENTILES) + [0])
+            continue
+        stats.append([len(runGaps), round(float(runGaps.mean()), 3)] +
+                     [round(float(value), 3) for value
+                      in np.percentile(runGaps, PERCENTILES)] +
+                     [int((runGaps < -EPSILON).sum())])
+
+    return stats
+
+
+def latex_name(text):
+    '''
+    like in descriptive-statistics.py, only letters are used
+    '''
+    name = ''.join([char for char in text if char.isalpha()])
+
+    return name.lower().capitalize()
+
+
+def speaker_lines(kind, values, speakers):
+    '''
+    returns the \\newcommand lines of the values per speaker and run
+    '''
+    linesForLatex = []
+    for speaker in speakers:
+        for run, value in enumerate(values[speaker]):
+            label = latex_name(speaker) + kind + 'Run' + str(run)
+            if isinstance(value, (float, np.floating)):
+                value = round(float(value), 1)
+            linesForLatex.append('\\newcommand{\\%s}{%s}\n' % (label, value))
+
+        # after every speaker, insert a line break
+        linesForLatex.append('\n')
+
+    return linesForLatex
+
+
+def top_transitions(names, matrices, topNr):
+    '''
+    returns the topNr transitions of the whole stimulus (most first) with
+    their counts per run
+    '''
+    whole = matrices[0].ravel()
+    order = np.argsort(-whole, kind='stable')[:topNr]
+    order = order[whole[order] > 0]
+
+    table = []
+    for index in order:
+        first, second = np.unravel_index(index, matrices[0].shape)
+        table.append([names[first], names[second]] +
+                     [int(count) for count in matrices[:, first, second]])
+
+    return table
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, outFile, tsvFile, topNr = parse_arguments()
+
+    tiers = read_tier_arrays(inFile, ['person', 'sentence'])
+    starts, ends, speakers = speaker_intervals(tiers)
+
+    times = speaking_time(united_intervals(starts, ends, speakers))
+    turnStarts, turnEnds, turnSpeakers = speaker_turns(starts, ends, speakers)
+    turns = turn_counts(turnStarts, turnSpeakers)
+    names, matrices = transitions(turnStarts, turnSpeakers)
+    gaps = gap_statistics(turnStarts, turnEnds)
+
+    # speakers with the longest speaking time, sorted alphabetically
+    topSpeakers = sorted(sorted(times, key=lambda x: -times[x][0])[:topNr])
+    topTransitions = top_transitions(names, matrices, topNr)
+
+    print(' \tall\tseg1\tseg2\tseg3\tseg4\tseg5\tseg6\tseg7\tseg8')
+    print('% Speaking time (s):')
+    for speaker in topSpeakers:
+        print('%s\t' % speaker +
+              '\t'.join([str(round(x, 1)) for x in times[speaker]]))
+
+    print('\n% Turns:')
+    for speaker in topSpeakers:
+        print('%s\t' % speaker +
+              '\t'.join([str(x) for x in turns[speaker]]))
+
+    print('\n% Turn transitions:')
+    for row in topTransitions:
+        print('%s > %s\t' % (row[0], row[1]) +
+              '\t'.join([str(x) for x in row[2:]]))
+
+    print('\n% Gaps between turns (s):')
+    labels = ['Count', 'Mean'] + ['Perc%s' % perc for perc in PERCENTILES] + \
+        ['Overlaps']
+    for nr, label in enumerate(labels):
+        print('%s\t' % label + '\t'.join([str(run[nr]) for run in gaps]))
+
+    if tsvFile is not None:
+        with open(tsvFile, 'w') as f:
+            writer = csv.writer(f, delimiter='\t')
+            writer.writerow(['from', 'to'] +
+                            ['run%s' % run for run in range(0, 9)])
+            writer.writerows(top_transitions(names, matrices, len(names) ** 2))
+
+    if outFile is not None:
+        forTexFile = ['% Speaking time by speaker\n']
+        forTexFile.extend(speaker_lines('SpeakingTime', times, topSpeakers))
+        forTexFile.append('% Turns by speaker\n')
+        forTexFile.extend(speaker_lines('Turns', turns, topSpeakers))
+
+        forTexFile.append('% Turn transitions\n')
+        for row in topTransitions:
+            label = 'Transition%s%s' % (latex_name(row[0]),
+                                        latex_name(row[1]))
+            for run, count in enumerate(row[2:]):
+                forTexFile.append('\\newcommand{\\%sRun%s}{%s}\n'
+                                  % (label, run, count))
+            forTexFile.append('\n')
+
+        forTexFile.append('% Gaps between turns\n')
+        for nr, label in enumerate(labels):
+            for run, stats in enumerate(gaps):
+                forTexFile.append('\\newcommand{\\TurnGap%sRun%s}{%s}\n'
+                                  % (label, run, stats[nr]))
+            forTexFile.append('\n')
+
+        with open(outFile, 'w') as f:
+            f.writelines(forTexFile)
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+Speech rate, phone rate and pause fraction in sliding windows
+
+For the tiers 'words' and 'phones', the number of intervals and the time
+spoken up to any time point are piecewise linear functions of time (an
+interval counts in proportion to the part of it that lies before the time
+point). Their knots are the intervals' on- and offsets, i.e. prefix sums over
+the intervals. The number of words, the number of phonemes and the speaking
+time within any window are then the difference of two values, whatever the
+window's length, and all windows are evaluated at once.
+
+Written are (as .tsv)
+    - per run, a time series in run time with one window per step (e.g. per
+      volume with the default step of 2 s, the TR)
+    - per sentence, the rates within the sentence
+
+The columns are words per second, phonemes per second, the fraction of the
+window without words (pause), and the articulation rate (phonemes per second
+of speaking).
+
+Call from the root of the dataset, e.g.:
+python3 code/speech-rate.py --step 2 --window 2 -o annotation/speech-rate
+"""
+import argparse
+import csv
+import os
+import os.path
+import numpy as np
+from annotation_io import SEGMENTS_OFFSETS, read_tier_arrays
+
+
+# the columns of the rates (in the order returned by window_rates)
+RATES = ['words_per_s', 'phones_per_s', 'pause_fraction',
+         'articulation_rate']
+
+# number of decimals of the written rates
+DECIMALS = 4
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Speech rate, phone rate and pauses in sliding windows'
+    )
+    parser.add_argument('-i',
+                        default='annotation/fg_rscut_ad_ger_speech.TextGrid',
+                        help='the TextGrid with the tiers words & phones')
+
+    parser.add_argument('-o',
+                        default='annotation/speech-rate',
+                        help='the directory to write the time series to')
+
+    parser.add_argument('--step',
+                        type=float,
+                        default=2.0,
+                        help='seconds between the windows\' onsets (default: '
+                        'the TR)')
+
+    parser.add_argument('--window',
+                        type=float,
+                        default=None,
+                        help='length of the windows in seconds (default: '
+                        'the step)')
+
+    args = parser.parse_args()
+
+    window = args.window if args.window is not None else args.step
+
+    return args.i, args.o, args.step, window
+
+
+def prefix_functions(starts, ends):
+    '''
+    returns the knots (times) of the functions counting the intervals and
+    summing their durations up to a time point, and the functions' values at
+    the knots; the intervals have to be sorted and must not overlap
+    '''
+    keep = ends > starts
+    starts = starts[keep]
+    ends = ends[keep]
+
+    knots = np.column_stack([starts, ends]).reshape(-1)
+    counted = np.arange(len(starts) + 1, dtype=np.float64)
+    counts = np.column_stack([counted[:-1], counted[1:]]).reshape(-1)
+    spoken = np.cumsum(ends - starts)
+    seconds = np.column_stack([spoken - (ends - starts),
+                               spoken]).reshape(-1)
+
+    return knots, counts, seconds
+
+
+def within(knots, values, onsets, offsets):
+    '''
+    returns the increase of a prefix function within every window
+    '''
+    if len(knots) == 0:
+        return np.zeros(len(onsets))
+
+    return (np.interp(offsets, knots, values) -
+            np.interp(onsets, knots, values))
+
+
+def window_rates(words, phones, onsets, offsets):
+    '''
+    returns the rates (see RATES) of all windows; words and phones are the
+    results of prefix_functions
+    '''
+    lengths = offsets - onsets
+    wordKnots, wordCounts, wordSeconds = words
+    phoneKnots, phoneCounts, phoneSeconds = phones
+
+    nrOfWords = within(wordKnots, wordCounts, onsets, offsets)
+    spoken = within(wordKnots, wordSeconds, onsets, offsets)
+    nrOfPhones = within(phoneKnots, phoneCounts, onsets, offsets)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        articulation = np.where(spoken > 0, nrOfPhones / spoken, np.nan)
+
+    return np.column_stack([nrOfWords / lengths,
+                            nrOfPhones / lengths,
+                            1 - spoken / lengths,
+                            articulation])
+
+
+def run_windows(step, window):
+    '''
+    returns per run (1-8) the windows' onsets in run time and their on- &
+    offsets in movie time; run time is movie time minus the run's start plus
+    its offset (see SEGMENTS_OFFSETS)
+    '''
+    runs = []
+    for run in range(1, len(SEGMENTS_OFFSETS)):
+        start, offset = SEGMENTS_OFFSETS[run - 1]
+        end = SEGMENTS_OFFSETS[run][0]
+        nrOfWindows = int(np.ceil((end - start + offset) / step))
+
+        runOnsets = np.arange(nrOfWindows) * step
+        movieOnsets = runOnsets + start - offset
+        runs.append((run, runOnsets, movieOnsets, movieOnsets + window))
+
+    return runs
+
+
+def rate_cells(rates):
+    '''
+    returns the rates rounded for the .tsv ('n/a' for undefined ones)
+    '''
+    return [['n/a' if np.isnan(value) else round(float(value), DECIMALS)
+             for value in row] for row in rates]
+
+
+def write_tsv(outFile, header, rows):
+    '''
+    '''
+    with open(outFile, 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+# main programm
+if __name__ == "__main__":
+    inFile, outDir, step, window = parse_arguments()
+
+    tiers = read_tier_arrays(inFile, ['sentence', 'words', 'phones'])
+    prefixes = {}
+    for tierName in ['words', 'phones']:
+        starts, ends, texts = tiers[tierName]
+        spoken = np.array([text.strip() != '' for text in texts], dtype=bool)
+        prefixes[tierName] = prefix_functions(starts[spoken], ends[spoken])
+
+    os.makedirs(outDir, exist_ok=True)
+
+    # a dense time series per run
+    for run, runOnsets, onsets, offsets in run_windows(step, window):
+        rates = window_rates(prefixes['words'], prefixes['phones'],
+                             onsets, offsets)
+        rows = [[round(float(onset), 3), window] + cells
+                for onset, cells in zip(runOnsets, rate_cells(rates))]
+        write_tsv(os.path.join(outDir, 'speech-rate_run-%s.tsv' % run),
+                  ['onset', 'duration'] + RATES, rows)
+
+    # and the rates within every sentence
+    starts, ends, texts = tiers['sentence']
+    spoken = np.array([text.strip() != '' for text in texts], dtype=bool)
+    rates = window_rates(prefixes['words'], prefixes['phones'],
+                         starts[spoken], ends[spoken])
+    rows = [[round(float(start), 3), round(float(end - start), 3), text] +
+            cells
+            for start, end, text, cells in zip(starts[spoken], ends[spoken],
+                                               texts[spoken],
+                                               rate_cells(rates))]
+    write_tsv(os.path.join(outDir, 'speech-rate_sentences.tsv'),
+              ['onset', 'duration', 'text'] + RATES, rows)
+
+    print('%s runs with windows of %s s every %s s, %s sentences'
+          % (len(SEGMENTS_OFFSETS) - 1, window, step, len(rows)))
@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+"""
+Tagging daemon that keeps spaCy's models loaded
+
+Loading spaCy and its German model takes seconds per script call. The
+daemon loads the models once and answers tagging requests on a Unix socket
+(see tagging_client.py); add_part-of-speech-tagging2textgrid.py and
+descriptive-statistics.py use it whenever it is running.
+
+Requests are JSON objects, one per line:
+    {"op": "load", "model": ...}           loads a model (if not loaded yet)
+    {"op": "tag", "model": ..., "texts": [...]}
+    {"op": "tag", "model": ..., "words": [[...], ...]}
+                                            tags a batch of sentences, given
+                                            as texts or as lists of words
+    {"op": "explain", "labels": [...]}     spaCy's description of labels
+
+Answers to "tag" contain per sentence the tokens' text, position, head,
+tags, lemma and stop word flag, and the vectors (float32, base64) of the
+words whose vector was not sent on the connection before.
+
+Call from the root of the dataset, e.g.:
+python3 code/tagging-daemon.py --models de_core_news_sm de_core_news_md &
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import spacy
+from spacy.tokens import Doc
+from tagging_client import SOCKET, connect, encode_vector
+
+
+# number of sentences spaCy processes at once
+BATCHSIZE = 256
+
+# longest request (bytes) that is accepted
+MAXREQUEST = 1 << 28
+
+
+def parse_arguments():
+    '''
+    '''
+    parser = argparse.ArgumentParser(
+        description='Keep spaCy\'s models loaded and tag sentences on request'
+    )
+    parser.add_argument('--models',
+                        nargs='+',
+                        default=['de_core_news_md'],
+                        help='the models to load at startup (further ones '
+                        'are loaded when first requested)')
+
+    parser.add_argument('--socket',
+                        default=SOCKET,
+                        help='the Unix socket to listen on')
+
+    args = parser.parse_args()
+
+    return args.models, args.socket
+
+
+class Tagger:
+    '''
+    the loaded models; all requests are processed by a single thread, so
+    the models are never used by two requests at once
+    '''
+    def __init__(self, modelNames):
+        self.models = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        for name in modelNames:
+            self.load(name)
+
+    def load(self, name):
+        '''
+        returns the model, loading it if necessary
+        '''
+        if name not in self.models:
+            print('loading %s' % name, file=sys.stderr)
+            self.models[name] = spacy.load(name)
+
+        return self.models[name]
+
+    def tag(self, message, sent):
+        '''
+        returns the tagged sentences and the vectors of the words that are
+        not in sent (the words whose vectors were sent before)
+        '''
+        nlp = self.load(message['model'])
+        disable = set(message.get('disable', []))
+
+        if 'words' in message:
+            docs = (Doc(nlp.vocab,
+                        words=words,
+                        spaces=[True] * (len(words) - 1) + [False])
+                    for words in message['words'])
+            for name, proc in nlp.pipeline:
+                if name in disable:
+                    continue
+                if hasattr(proc, 'pipe'):
+                    docs = proc.pipe(docs, batch_size=BATCHSIZE)
+                else:
+                    docs = map(proc, docs)
+        else:
+            docs = nlp.pipe(message['texts'], batch_size=BATCHSIZE,
+                            disable=list(disable))
+
+        tagged = []
+        vectors = {}
+        for doc in docs:
+            tokens = []
+            for token in doc:
+                tokens.append({'text': token.text,
+                               'i': token.i,
+                               'head': token.head.i,
+                               'pos': token.pos_,
+                               'tag': token.tag_,
+                               'dep': token.dep_,
+                               'lemma': token.lemma_,
+                               'is_stop': bool(token.is_stop)})
+                if (token.text not in sent and token.has_vector and
+                        abs(token.vector).sum() > 0):
+                    vectors[token.text] = encode_vector(token.vector)
+                    sent.add(token.text)
+            tagged.append(tokens)
+
+        return {'docs': tagged, 'vectors': vectors}
+
+    def answer(self, message, sent):
+        '''
+        returns the answer to a request; sent holds per model the words
+        whose vectors were sent on the connection
+        '''
+        op = message.get('op')
+        if op == 'load':
+            nlp = self.load(message['model'])
+            return {'dims': int(nlp.vocab.vectors_length)}
+        elif op == 'tag':
+            return self.tag(message, sent.setdefault(message['model'], set()))
+        elif op == 'explain':
+            return {'explanations': {label: spacy.explain(label)
+                                     for label in message['labels']}}
+
+        raise ValueError('unknown op: %s' % op)
+
+
+async def handle(reader, writer, tagger):
+    '''
+    answers the requests of one connection until the client closes it
+    '''
+    loop = asyncio.get_running_loop()
+    sent = {}
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                message = json.loads(line)
+                answer = await loop.run_in_executor(tagger.executor,
+                                                    tagger.answer,
+                                                    message, sent)
+            except (ValueError, KeyError, OSError) as error:
+                answer = {'error': '%s: %s' % (type(error).__name__, error)}
+
+            writer.write(json.dumps(answer).encode('utf-8') + b'\n')
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def remove_stale_socket(socketPath):
+    '''
+    removes a socket nobody answers on, i.e. the one of a daemon that died;
+    exits if a daemon is serving on it
+    '''
+    if not os.path.exists(socketPath):
+        return
+
+    connection = connect(socketPath)
+    if connection is not None:
+        connection.close()
+        sys.exit('a tagging daemon is already serving on %s' % socketPath)
+
+    os.remove(socketPath)
+
+
+async def serve(tagger, socketPath):
+    '''
+    '''
+    def client(reader, writer):
+        return handle(reader, writer, tagger)
+
+    server = await asyncio.start_unix_server(client, path=socketPath,
+                                             limit=MAXREQUEST)
+    print('serving on %s' % socketPath, file=sys.stderr)
+
+    async with server:
+        await server.serve_forever()
+
+
+# main programm
+if __name__ == "__main__":
+    modelNames, socketPath = parse_arguments()
+    # before and after the (slow) loading of the models
+    remove_stale_socket(socketPath)
+
+    # the models are loaded once at startup
+    tagger = Tagger(modelNames)
+
+    remove_stale_socket(socketPath)
+
+    try:
+        asyncio.run(serve(tagger, socketPath))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
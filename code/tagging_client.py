@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+"""
+Client of the tagging daemon (see tagging-daemon.py).
+
+The daemon keeps spaCy's models loaded and tags sentences sent over a Unix
+socket. The scripts get their model via load_model and spaCy's glossary via
+explain: if the daemon is running, they talk to it and do not even import
+spaCy (which alone takes seconds); otherwise spaCy is loaded as before.
+
+Requests and answers are JSON objects, one per line. The daemon's tokens are
+turned into RemoteTokens that have the attributes of spaCy's tokens used by
+the scripts (text, i, pos_, tag_, dep_, head, children, lemma_, is_stop,
+vector), so the tagger can treat them like spaCy's.
+
+The socket is set by the environment variable TAGGING_DAEMON_SOCKET; set it
+to an empty string to never use the daemon. By default, every user has a
+socket of their own (in $XDG_RUNTIME_DIR, else in the temporary directory
+with the user's id in the name).
+"""
+
+import base64
+import json
+import os
+import os.path
+import socket
+import tempfile
+import numpy as np
+
+
+def default_socket():
+    '''
+    returns the user's own socket path
+    '''
+    runtimeDir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtimeDir and os.path.isdir(runtimeDir):
+        return os.path.join(runtimeDir, 'speechannotation-tagging.sock')
+
+    return os.path.join(tempfile.gettempdir(),
+                        'speechannotation-tagging-%s.sock' % os.getuid())
+
+
+# the socket the daemon listens on
+SOCKET = os.environ.get('TAGGING_DAEMON_SOCKET', default_socket())
+
+# data type of the vectors sent by the daemon
+VECTORDTYPE = np.float32
+
+# spaCy's descriptions of tags and labels, once they were looked up
+EXPLANATIONS = {}
+
+
+def encode_vector(vector):
+    '''
+    returns a vector as base64 string of its float32 bytes
+    '''
+    vector = np.asarray(vector, dtype=VECTORDTYPE)
+
+    return base64.b64encode(vector.tobytes()).decode('ascii')
+
+
+def decode_vector(text):
+    '''
+    '''
+    return np.frombuffer(base64.b64decode(text), dtype=VECTORDTYPE)
+
+
+class DaemonConnection:
+    '''
+    a connection to the daemon; every request waits for its answer
+    '''
+    def __init__(self, socketPath=SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socketPath)
+        self.reader = self.socket.makefile('rb')
+
+    def request(self, message):
+        '''
+        sends the message (dict) and returns the answer (dict)
+        '''
+        self.socket.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('the tagging daemon closed the connection')
+        answer = json.loads(line)
+        if 'error' in answer:
+            raise RuntimeError('tagging daemon: %s' % answer['error'])
+
+        return answer
+
+    def close(self):
+        '''
+        '''
+        self.reader.close()
+        self.socket.close()
+
+
+def connect(socketPath=SOCKET):
+    '''
+    returns a connection to the daemon, or None if it is not running
+    '''
+    if not socketPath or not os.path.exists(socketPath):
+        return None
+    try:
+        return DaemonConnection(socketPath)
+    except OSError:
+        return None
+
+
+class RemoteToken:
+    '''
+    a token tagged by the daemon, with the attributes of spaCy's tokens that
+    the scripts use
+    '''
+    def __init__(self, fields, vector):
+        self.text = fields['text']
+        self.i = fields['i']
+        self.pos_ = fields['pos']
+        self.tag_ = fields['tag']
+        self.dep_ = fields['dep']
+        self.lemma_ = fields['lemma']
+        self.is_stop = fields['is_stop']
+        self.vector = vector
+        # set when the whole sentence is known
+        self.head = self
+        self.children = []
+
+    def __repr__(self):
+        return self.text
+
+
+def remote_doc(tokens, vectors, dims):
+    '''
+    returns the RemoteTokens of a sentence with heads and children linked
+    '''
+    nullVector = np.zeros(dims, dtype=VECTORDTYPE)
+    doc = [RemoteToken(fields, vectors.get(fields['text'], nullVector))
+           for fields in tokens]
+    for token, fields in zip(doc, tokens):
+        token.head = doc[fields['head']]
+        if fields['head'] != token.i:
+            token.head.children.append(token)
+
+    return doc
+
+
+class RemoteModel:
+    '''
+    a model held by the daemon; called with a text like spaCy's Language
+    '''
+    def __init__(self, connection, name, disable=None):
+        self.connection = connection
+        self.name = name
+        self.disable = list(disable) if disable else []
+        # the vectors of all words seen so far; the daemon sends every word's
+        # vector only once per connection
+        self.vectors = {}
+        self.dims = connection.request({'op': 'load', 'model': name})['dims']
+
+    def tag(self, key, batch):
+        '''
+        returns the tagged sentences of a batch of texts (key 'texts') or of
+        lists of words (key 'words')
+        '''
+        answer = self.connection.request({'op': 'tag',
+                                          'model': self.name,
+                                          'disable': self.disable,
+                                          key: batch})
+        for word, vector in answer['vectors'].items():
+            self.vectors[word] = decode_vector(vector)
+
+        return [remote_doc(tokens, self.vectors, self.dims)
+                for tokens in answer['docs']]
+
+    def __call__(self, text):
+        return self.tag('texts', [text])[0]
+
+    def pipe_words(self, wordLists, batchSize):
+        '''
+        yields the tagged sentences of already tokenized sentences (lists of
+        words), sending batchSize sentences per request
+        '''
+        batch = []
+        for words in wordLists:
+            batch.append(words)
+            if len(batch) == batchSize:
+                yield from self.tag('words', batch)
+                batch = []
+        if batch:
+            yield from self.tag('words', batch)
+
+
+def load_model(name, disable=None, useDaemon=True):
+    '''
+    returns the model held by the daemon if it is running, else spaCy's
+    model loaded in this process
+    '''
+    connection = connect() if useDaemon else None
+    if connection is not None:
+        return RemoteModel(connection, name, disable)
+
+    # spaCy is only imported if it is actually needed
+    import spacy
+    if disable:
+        return spacy.load(name, disable=disable)
+
+    return spacy.load(name)
+
+
+def vectors_length(nlp):
+    '''
+    returns the length of the model's vectors
+    '''
+    if isinstance(nlp, RemoteModel):
+        return nlp.dims
+
+    return nlp.vocab.vectors_length
+
+
+def explain(label):
+    '''
+    returns spaCy's description of a tag or label (like spacy.explain)
+    '''
+    if label not in EXPLANATIONS:
+        connection = connect()
+        if connection is not None:
+            answer = connection.request({'op': 'explain', 'labels': [label]})
+            connection.close()
+            EXPLANATIONS[label] = answer['explanations'][label]
+        else:
+            import spacy
+            EXPLANATIONS[label] = spacy.explain(label)
+
+    return EXPLANATIONS[label]
@@ -7,39 +7,143 @@ TextGrid format specifications:
 http://www.fon.hum.uva.nl/praat/manual/TextGrid_file_formats.html
 
 """
+import argparse
 import csv
-import sys
 from collections import defaultdict
+from annotation_io import read_tiers_cached
+from memory_profile import MemoryProfile
 
 
-def read_data(infile):
+# the acoustic features (see add_acoustic-features2textgrid.py) become the
+# last columns if the TextGrid contains them; sentences and words take them
+# from the tiers of their own level (e.g. 'words_rms' for words)
+ACOUSTICS = ['rms', 'pitch']
+
+# the lexical statistics (see add_surprisal2textgrid.py) of the words follow
+# the acoustic features if the TextGrid contains them
+LEXICAL = ['frequency', 'surprisal']
+
+# every row gets the index of its sentence and word (if any); phonemes are
+# linked to the word and sentence that contain them
+INDICES = ['sentence_index', 'word_index']
+
+# tolerance (in seconds) when checking if an interval contains another
+EPSILON = 0.0005
+
+
+def parse_arguments():
     '''
     '''
-    with open(infile, 'r', encoding='utf-16') as f:
-        textGridLines = f.readlines()
-        textGridLines = [line.strip() for line in textGridLines]
+    parser = argparse.ArgumentParser(
+        description='Convert the (tagged) TextGrid into a BIDS .tsv'
+    )
+    parser.add_argument('infile',
+                        help='the TextGrid to convert')
+
+    parser.add_argument('--memory-report',
+                        default=None,
+                        help='trace the memory of every stage and write '
+                        'the report (.json) to this file')
+
+    args = parser.parse_args()
+
+    return args.infile, args.memory_report
+
+
+def read_data(infile, tierNames=None):
+    '''
+    only the tiers in tierNames are read (if given)
+    '''
+    # parsed tiers are cached in a binary snapshot next to the TextGrid
+    tiers = read_tiers_cached(infile, tierNames)
 
     data = defaultdict(lambda: defaultdict(list))
-    for line in textGridLines[9:]:
-        linepair = line.split(' = ')
-
-        if len(linepair) == 2:
-            if linepair[0] == 'name':
-                tiername = linepair[1].strip('"')
-            elif linepair[0] == 'xmin':
-                xmin = linepair[1]
-            elif linepair[0] == 'xmax':
-                xmax = linepair[1]
-            elif linepair[0] == 'text' and linepair[1] != '""':
-                text = linepair[1].strip('"')
-                diff = str(round(float(xmax)-float(xmin), 3))
-                onOffset = (float(xmin), float(diff))
+    for tiername, intervals in tiers.items():
+        for xmin, xmax, text in intervals:
+            if text != '':
+                diff = str(round(xmax - xmin, 3))
+                onOffset = (xmin, float(diff))
 
                 data[onOffset][tiername] = [text]
 
     return data
 
 
+def has_tier(data, tierName):
+    '''
+    '''
+    for onOffset in data:
+        if tierName in data[onOffset]:
+            return True
+
+    return False
+
+
+def has_acoustics(data):
+    '''
+    '''
+    return has_tier(data, 'words_rms')
+
+
+def acoustic_cells(data, onOffset, level):
+    '''
+    returns the acoustic features of the sentence or word at onOffset
+    '''
+    cells = []
+    for feature in ACOUSTICS:
+        cell = data[onOffset].get('%s_%s' % (level, feature), [''])
+        cells.extend(cell)
+
+    return cells
+
+
+def tier_intervals(data, tierName):
+    '''
+    returns the on-/offsets of the tier's intervals (that contain text),
+    sorted by onset
+    '''
+    onOffsets = [onOffset for onOffset in data
+                 if tierName in data[onOffset]]
+
+    return sorted(onOffsets, key=lambda y: (y[0], -y[1]))
+
+
+def assign_parents(children, parents):
+    '''
+    returns for every child interval the index of the parent interval
+    containing it (None if there is none); both lists are sorted by onset
+    and the parents do not overlap, so a single sweep over both suffices
+    '''
+    parentOf = []
+    current = -1
+    for onset, duration in children:
+        # the candidate is the last parent starting before the child
+        while (current + 1 < len(parents) and
+               parents[current + 1][0] <= onset + EPSILON):
+            current += 1
+
+        if current >= 0:
+            parentEnd = parents[current][0] + parents[current][1]
+            if onset + duration <= parentEnd + EPSILON:
+                parentOf.append(current)
+                continue
+
+        parentOf.append(None)
+
+    return parentOf
+
+
+def get_person(data, onOffset, sentences, sentIndex):
+    '''
+    returns the person speaking the sentence that contains the interval;
+    intervals outside of any sentence take the person of their own timing
+    '''
+    if sentIndex is not None:
+        onOffset = sentences[sentIndex]
+
+    return data[onOffset].get('person', [''])
+
+
 def build_word_line(data, onOffset, person):
     '''
     '''
@@ -84,54 +188,97 @@ def write_to_tsv(outputFile, header, toWrite):
 # main programm
 if __name__ == "__main__":
     # read textgrid
-    inFile = sys.argv[1]
+    inFile, memoryReport = parse_arguments()
+    profile = MemoryProfile(enabled=memoryReport is not None)
 
-    data = read_data(inFile)
+    with profile.stage('read'):
+        data = read_data(inFile)
 
-    toWrite = []
-    sortedKeys = sorted(data, key=lambda y: (y[0], -y[1]))
-    for onOffset in sortedKeys:
-        keys = data[onOffset].keys()
-        # process on-/offset matching a whole sentences
-        if 'sentence' in keys:
+    with profile.stage('link'):
+        # link words to their sentences, and phonemes to their words and
+        # sentences
+        sentences = tier_intervals(data, 'sentence')
+        words = tier_intervals(data, 'words')
+        phones = tier_intervals(data, 'phones')
+        sentOfWord = assign_parents(words, sentences)
+        sentOfPhone = assign_parents(phones, sentences)
+        wordOfPhone = assign_parents(phones, words)
+
+    with profile.stage('rows'):
+        # collect the rows together with their sort key, and the indices of
+        # their sentence and word
+        rows = []
+        for sentIndex, onOffset in enumerate(sentences):
             line = [onOffset[0], onOffset[1]]
-            person = data[onOffset]['person']
+            person = get_person(data, onOffset, sentences, sentIndex)
             line.extend(person)
             line.extend(data[onOffset]['sentence'])
             line.append('SENTENCE')
-            toWrite.append(line)
-            # process sentences with only one word
-            if 'words' in keys:
-                line = build_word_line(data, onOffset, person)
-                toWrite.append(line)
-            # process sentences with only one word
-            # AND just one phoneme (essentially "sentences" that contain
-            # justone non-speech vocalization
-            if 'phones' in keys:
-                line = build_phone_line(data, onOffset, person)
-                toWrite.append(line)
-
-        # process on-/offset matching a single word (that is not a "sentence")
-        elif 'sentence' not in keys and 'words' in keys:
+            rows.append([(onOffset[0], -onOffset[1], 0), line, sentIndex,
+                         None])
+
+        for wordIndex, onOffset in enumerate(words):
+            sentIndex = sentOfWord[wordIndex]
+            person = get_person(data, onOffset, sentences, sentIndex)
             line = build_word_line(data, onOffset, person)
-            toWrite.append(line)
-            # and the single words' corresponding phonemes
-            if 'phones' in keys:
-                line = build_phone_line(data, onOffset, person)
-                toWrite.append(line)
+            rows.append([(onOffset[0], -onOffset[1], 1), line, sentIndex,
+                         wordIndex])
 
-        # process onOffset matching a single phoneme
-        elif len(keys) == 1 and 'phones' == list(keys)[0]:
+        for phoneIndex, onOffset in enumerate(phones):
+            sentIndex = sentOfPhone[phoneIndex]
+            person = get_person(data, onOffset, sentences, sentIndex)
             line = build_phone_line(data, onOffset, person)
+            rows.append([(onOffset[0], -onOffset[1], 2), line, sentIndex,
+                         wordOfPhone[phoneIndex]])
+
+        # sentences, words and phonemes are sorted by onset, longest first;
+        # with equal timing, a sentence comes before its word and phoneme
+        rows.sort(key=lambda row: row[0])
+
+        # append the acoustic features; rows of sentences and phonemes are
+        # padded up to the column 'vector' first
+        acoustics = has_acoustics(data)
+        lexical = has_tier(data, LEXICAL[0])
+        toWrite = []
+        for sortKey, line, sentIndex, wordIndex in rows:
+            onOffset = (line[0], line[1])
+            line.extend([''] * (11 - len(line)))
+
+            if acoustics:
+                if line[4] == 'SENTENCE':
+                    line.extend(acoustic_cells(data, onOffset, 'sentence'))
+                elif line[4] == 'PHONEME':
+                    line.extend([''] * len(ACOUSTICS))
+                else:
+                    line.extend(acoustic_cells(data, onOffset, 'words'))
+
+            if lexical:
+                if line[4] in ['SENTENCE', 'PHONEME']:
+                    line.extend([''] * len(LEXICAL))
+                else:
+                    line.extend([data[onOffset].get(column, [''])[0]
+                                 for column in LEXICAL])
+
+            for index in [sentIndex, wordIndex]:
+                line.append('' if index is None else index)
             toWrite.append(line)
 
-        else:
-            print(line)
+    with profile.stage('write'):
+        # write to csv
+        # the column 'vector' holds the row index into the vector table
+        # (<name>_vectors.npy) that the .tsv shares with the TextGrid;
+        # use word_vectors.resolve_vectors to get the actual vectors
+        outputFile = inFile.replace('.TextGrid', '.tsv')
+        header = ['onset', 'duration', 'person', 'text',
+                  'pos', 'tag', 'dep', 'lemma', 'stop',
+                  'descr', 'vector']
+        if acoustics:
+            header.extend(ACOUSTICS)
+        if lexical:
+            header.extend(LEXICAL)
+        header.extend(INDICES)
 
-    # write to csv
-    outputFile = inFile.replace('.TextGrid', '.tsv')
-    header = ['onset', 'duration', 'person', 'text',
-              'pos', 'tag', 'dep', 'lemma', 'stop',
-              'descr', 'vector']
+        write_to_tsv(outputFile, header, toWrite)
 
-    write_to_tsv(outputFile, header, toWrite)
+    if memoryReport is not None:
+        profile.report(memoryReport)
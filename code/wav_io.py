@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Memory-mapped access to (large) WAV files
+
+The audio track of the movie is a single ~680 MB file; instead of reading it
+into memory, its samples are memory-mapped, so that only the parts that are
+actually accessed are read from disk.
+"""
+import struct
+import wave
+import numpy as np
+
+
+# the format tags of the fmt chunk
+FORMAT_PCM = 1
+FORMAT_FLOAT = 3
+FORMAT_EXTENSIBLE = 0xFFFE
+
+# numpy's data types of the samples per format and sample width (in bytes)
+SAMPLE_DTYPES = {(FORMAT_PCM, 1): np.uint8,
+                 (FORMAT_PCM, 2): np.int16,
+                 (FORMAT_PCM, 4): np.int32,
+                 (FORMAT_FLOAT, 4): np.float32,
+                 (FORMAT_FLOAT, 8): np.float64}
+
+
+def wav_layout(wavFile):
+    '''
+    walks the RIFF chunks of a WAV file (PCM or IEEE float, also as
+    WAVE_FORMAT_EXTENSIBLE) and returns the byte offset of the samples, the
+    number of channels, the samples' data type, the sampling rate and the
+    number of frames
+    '''
+    with open(wavFile, 'rb') as f:
+        riff, size, waveId = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or waveId != b'WAVE':
+            raise ValueError('%s is not a WAV file' % wavFile)
+
+        channels = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError('%s has no data chunk' % wavFile)
+            chunkId, chunkSize = struct.unpack('<4sI', header)
+
+            if chunkId == b'fmt ':
+                fmt = f.read(chunkSize)
+                # chunks are padded to an even number of bytes
+                f.seek(chunkSize % 2, 1)
+                formatTag, channels, rate = struct.unpack('<HHI', fmt[0:8])
+                sampWidth = struct.unpack('<H', fmt[14:16])[0] // 8
+                # the actual format is the subformat's first two bytes
+                if formatTag == FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    formatTag = struct.unpack('<H', fmt[24:26])[0]
+                dtype = SAMPLE_DTYPES.get((formatTag, sampWidth))
+                if dtype is None:
+                    raise ValueError('%s: format %s with %s bytes per sample '
+                                     'is not supported'
+                                     % (wavFile, formatTag, sampWidth))
+            elif chunkId == b'data':
+                if channels is None:
+                    raise ValueError('%s has no fmt chunk' % wavFile)
+                offset = f.tell()
+                frames = chunkSize // (channels * sampWidth)
+                break
+            else:
+                # chunks are padded to an even number of bytes
+                f.seek(chunkSize + chunkSize % 2, 1)
+
+    return offset, channels, dtype, rate, frames
+
+
+def memmap_wav(wavFile):
+    '''
+    returns the memory-mapped samples (frames x channels) and the sampling
+    rate of a WAV file
+    '''
+    offset, channels, dtype, rate, frames = wav_layout(wavFile)
+    samples = np.memmap(wavFile, dtype=dtype, mode='r', offset=offset,
+                        shape=(frames, channels))
+
+    return samples, rate
+
+
+def to_float(samples):
+    '''
+    converts samples to float32 in the range -1 to 1 and averages the
+    channels
+    '''
+    samples = np.asarray(samples)
+    if samples.dtype.kind == 'f':
+        floats = samples.astype(np.float32)
+    elif samples.dtype == np.uint8:
+        floats = (samples.astype(np.float32) - 128) / 128
+    else:
+        floats = samples.astype(np.float32) / np.iinfo(samples.dtype).max
+
+    return floats.mean(axis=1)
+
+
+def write_wav(outFile, samples, rate):
+    '''
+    writes samples (frames x channels) as PCM WAV; float samples are
+    written as 16 bit
+    '''
+    samples = np.asarray(samples)
+    if samples.dtype.kind == 'f':
+        samples = np.round(np.clip(samples, -1, 1) * np.iinfo(np.int16).max)
+        samples = samples.astype(np.int16)
+    samples = np.ascontiguousarray(samples)
+    with wave.open(outFile, 'wb') as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(samples.dtype.itemsize)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+    return None
@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+"""
+Type-level storage of spaCy's word vectors.
+
+Instead of writing the full vector of every token into the 'vector' tier
+(and the BIDS .tsv), the tagger writes a vocabulary table with one vector per
+unique word (float32) into a sidecar file next to the annotation:
+
+    <annotation>_vectors.npy    matrix of shape (number of types, dimensions)
+    <annotation>_vocab.tsv      row index and word of every row in the matrix
+
+The 'vector' tier/column then only contains the row index into the table
+('#' still flags words without a vector). Because the TextGrid and the .tsv
+created from it share their stem, both find the same sidecar files.
+
+The table can be stored quantized to save memory and disk space:
+float16, or int8 with a per-dimension scale and offset that are written to
+<annotation>_vectors_scale.npy. Loaders dequantize on the fly.
+
+The tagger also stores one vector per interval of the tier 'sentence' (the
+mean of the vectors of the sentence's non-stop words, null for pauses) in
+<annotation>_sentence_vectors.npy, and optionally the mean weighted by the
+words' inverse frequency in <annotation>_sentence_vectors_weighted.npy.
+"""
+
+import csv
+import os
+import os.path
+import numpy as np
+
+
+# flag for words that have no (i.e. a null) vector
+NOVECTOR = '#'
+
+# data types the vector table can be stored in
+DTYPES = ['float32', 'float16', 'int8']
+
+
+def vector_table_path(annoFile):
+    '''
+    returns the path of the vector table belonging to an annotation file
+    '''
+    return os.path.splitext(annoFile)[0] + '_vectors.npy'
+
+
+def vocab_path(annoFile):
+    '''
+    returns the path of the vocabulary belonging to an annotation file
+    '''
+    return os.path.splitext(annoFile)[0] + '_vocab.tsv'
+
+
+def scale_path(annoFile):
+    '''
+    returns the path of the scales & offsets of an int8-quantized table
+    '''
+    return os.path.splitext(annoFile)[0] + '_vectors_scale.npy'
+
+
+def sentence_vectors_path(annoFile, weighted=False):
+    '''
+    returns the path of the sentence vectors belonging to an annotation file
+    '''
+    suffix = '_sentence_vectors_weighted.npy' if weighted else \
+        '_sentence_vectors.npy'
+
+    return os.path.splitext(annoFile)[0] + suffix
+
+
+def add_to_table(vocab, vectors, word, vector):
+    '''
+    returns the table's row index of the word's vector; the vector is appended
+    to the table when the word is seen for the first time
+    '''
+    index = vocab.get(word)
+    if index is None:
+        index = len(vectors)
+        vocab[word] = index
+        vectors.append(np.asarray(vector, dtype=np.float32))
+
+    return index
+
+
+def quantize(table, dtype='float32'):
+    '''
+    returns the table in the requested data type and, for int8, an array
+    with the per-dimension scale (row 0) and offset (row 1); the offset is the
+    dimension's minimum, so the 256 steps span each dimension's range
+    '''
+    table = np.asarray(table, dtype=np.float32)
+
+    if dtype == 'int8':
+        if len(table):
+            minimum = table.min(axis=0)
+            maximum = table.max(axis=0)
+        else:
+            # an empty table has neither minimum nor maximum
+            minimum = maximum = np.zeros(table.shape[1], dtype=np.float32)
+        scale = (maximum - minimum) / 255
+        # dimensions with only one value would divide by zero
+        scale[scale == 0] = 1
+        quantized = np.round((table - minimum) / scale) - 128
+        quantized = np.clip(quantized, -128, 127).astype(np.int8)
+        scaleOffset = np.vstack([scale, minimum]).astype(np.float32)
+    else:
+        quantized = table.astype(dtype)
+        scaleOffset = None
+
+    return quantized, scaleOffset
+
+
+def dequantize(rows, scaleOffset=None):
+    '''
+    turns rows of a (quantized) table back into float32
+    '''
+    rows = np.asarray(rows, dtype=np.float32)
+    if scaleOffset is not None:
+        rows = (rows + 128) * scaleOffset[0] + scaleOffset[1]
+
+    return rows
+
+
+def save_vector_table(annoFile, vocab, vectors, dtype='float32', dims=0):
+    '''
+    writes the vector table and its vocabulary next to the annotation file;
+    dims is the vectors' length, which an empty table keeps
+    '''
+    if vectors:
+        table = np.vstack(vectors).astype(np.float32)
+    else:
+        table = np.zeros((0, dims), dtype=np.float32)
+
+    table, scaleOffset = quantize(table, dtype)
+    np.save(vector_table_path(annoFile), table)
+
+    # only int8 needs scales; remove ones of an earlier int8 export
+    if scaleOffset is not None:
+        np.save(scale_path(annoFile), scaleOffset)
+    elif os.path.exists(scale_path(annoFile)):
+        os.remove(scale_path(annoFile))
+
+    with open(vocab_path(annoFile), 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['index', 'word'])
+        for word, index in sorted(vocab.items(), key=lambda x: x[1]):
+            writer.writerow([index, word])
+
+    return None
+
+
+def load_vocab(annoFile):
+    '''
+    returns the list of words in the order of the vector table's rows
+    '''
+    with open(vocab_path(annoFile)) as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader, None)
+        words = [row[1] for row in reader]
+
+    return words
+
+
+def load_vector_table(annoFile):
+    '''
+    memory-maps the vector table, so vectors are only read from disk
+    when they are actually resolved
+    '''
+    return np.load(vector_table_path(annoFile), mmap_mode='r')
+
+
+def load_scale(annoFile):
+    '''
+    returns the scales & offsets of an int8-quantized table (else None)
+    '''
+    if os.path.exists(scale_path(annoFile)):
+        return np.load(scale_path(annoFile))
+
+    return None
+
+
+def iter_vector_chunks(annoFile, chunkSize=4096):
+    '''
+    yields the row index of the first row and the float32 rows of the
+    (possibly quantized) vector table, chunk by chunk, so that only one
+    dequantized chunk is held in memory at a time
+    '''
+    table = load_vector_table(annoFile)
+    scaleOffset = load_scale(annoFile)
+
+    for start in range(0, table.shape[0], chunkSize):
+        yield start, dequantize(table[start:start + chunkSize], scaleOffset)
+
+
+def resolve_vectors(table, cells, scaleOffset=None):
+    '''
+    turns the cells of a 'vector' tier/column into a float32 matrix;
+    cells that are empty or flagged with '#' become null vectors; cells of
+    annotations created before the vector table still hold the whole vector
+    as comma-separated string; pass the result of load_scale for
+    int8-quantized tables
+    '''
+    dims = table.shape[1]
+    resolved = np.zeros((len(cells), dims), dtype=np.float32)
+
+    rows = []
+    indices = []
+    for row, cell in enumerate(cells):
+        if cell in ['', NOVECTOR]:
+            continue
+        elif ',' in cell:
+            resolved[row] = np.array(cell.split(','), dtype=np.float32)
+        else:
+            rows.append(row)
+            indices.append(int(cell))
+
+    # fancy indexing only reads the needed rows of the memory-mapped table
+    if indices:
+        resolved[rows] = dequantize(table[np.array(indices)], scaleOffset)
+
+    return resolved
+
+
+def load_normalized_table(annoFile):
+    '''
+    returns the whole (dequantized) vector table as float32 with every row
+    scaled to unit length, so that dot products are cosine similarities;
+    null vectors stay null
+    '''
+    table = dequantize(load_vector_table(annoFile), load_scale(annoFile))
+    norms = np.linalg.norm(table, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+
+    return np.ascontiguousarray(table / norms, dtype=np.float32)
+
+
+def segment_means(rows, segments, nrOfSegments, weights=None):
+    '''
+    returns the (weighted) mean of the rows of every segment; segments holds
+    the segment index of every row and has to be sorted; segments without
+    rows get null vectors
+    '''
+    means = np.zeros((nrOfSegments, rows.shape[1]), dtype=np.float32)
+    if len(rows) == 0:
+        return means
+
+    if weights is None:
+        weights = np.ones(len(rows), dtype=np.float32)
+
+    # one reduction over all segments; reduceat sums from every segment's
+    # first row up to the next segment's first row
+    present, firsts = np.unique(segments, return_index=True)
+    sums = np.add.reduceat(rows * weights[:, np.newaxis], firsts, axis=0)
+    totals = np.add.reduceat(weights, firsts)
+    totals[totals == 0] = 1
+    means[present] = sums / totals[:, np.newaxis]
+
+    return means
+
+
+def save_sentence_vectors(annoFile, means, weighted=False):
+    '''
+    writes the sentence vectors next to the annotation file
+    '''
+    np.save(sentence_vectors_path(annoFile, weighted),
+            means.astype(np.float32))
+
+    return None
+
+
+def load_sentence_vectors(annoFile, weighted=False):
+    '''
+    returns the sentence vectors, one row per interval of the tier 'sentence'
+    '''
+    return np.load(sentence_vectors_path(annoFile, weighted), mmap_mode='r')